@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the stages that build the call tree, from the output of
+``cube_dump -w`` to the DataFrame representation.
+"""
+import os
+import calltree as ct
+import lazy_calltree as lct
+import numpy as np
+import preorder as po
+import profile_diff as pdiff
+import pruning as pr
+import tree_parsing as tp
+import bench_utils as bu
+import pytest
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_get_call_tree_lines(benchmark, n_cnodes):
+    text = bu.w_text(n_cnodes)
+    lines = bu.run(benchmark, ct.get_call_tree_lines, text)
+    assert len(lines) == n_cnodes
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_collect_hierarchy(benchmark, n_cnodes):
+    lines = bu.calltree_lines(n_cnodes)
+    bu.run(benchmark, tp.collect_hierarchy, lines, tp.level_fun)
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_create_node(benchmark, n_cnodes):
+    lines = bu.calltree_lines(n_cnodes)
+    bu.run(benchmark, lambda: [ct.create_node(line) for line in lines])
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_calltree_from_lines(benchmark, n_cnodes):
+    lines = bu.calltree_lines(n_cnodes)
+    bu.run(benchmark, ct.calltree_from_lines, lines)
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_parallel_calltree_from_lines(benchmark, n_cnodes):
+    lines = bu.calltree_lines(n_cnodes)
+    bu.run(benchmark, ct.calltree_from_lines, lines, processes=os.cpu_count())
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_lazy_calltree_from_lines(benchmark, n_cnodes):
+    lines = bu.calltree_lines(n_cnodes)
+    bu.run(benchmark, lct.lazy_calltree_from_lines, lines, maxlevel=2)
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_calltree_to_df(benchmark, n_cnodes):
+    calltree = bu.calltree(n_cnodes)
+    df = bu.run(benchmark, ct.calltree_to_df, calltree, full_path=True)
+    assert len(df) == n_cnodes
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_get_level(benchmark, n_cnodes):
+    parent_series = bu.tree_df(n_cnodes).set_index("Cnode ID")["Parent Cnode ID"]
+    bu.run(benchmark, ct.get_level, parent_series)
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_align_calltrees(benchmark, n_cnodes):
+    tree_df = bu.tree_df(n_cnodes)
+    aligned = bu.run(benchmark, pdiff.align_calltrees, tree_df, tree_df)
+    assert len(aligned.tree_df) == n_cnodes
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_prune(benchmark, n_cnodes):
+    tree_df = bu.tree_df(n_cnodes)
+    values = np.linspace(1.0, 0.0, n_cnodes)
+    index = pr.get_pruning_index(tree_df, values)
+    bu.run(benchmark, pr.prune, index, 0.01)
+
+
+@pytest.mark.parametrize("n_cnodes", bu.TREE_SIZES)
+def bench_preorder_index(benchmark, n_cnodes):
+    tree_df = bu.tree_df(n_cnodes)
+    index = bu.run(benchmark, po.PreorderIndex, tree_df)
+    assert len(index) == n_cnodes
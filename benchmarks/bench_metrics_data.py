@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the stages that read and transform the metric data.
+
+The stages that need ``cube_dump`` run on the files in ``test_data``, and
+are skipped if ``cube_dump`` is not available. The same stages also run on
+synthetic profiles, using ``synthetic.FakeCubeDump`` instead of
+``cube_dump``.
+"""
+import io
+import shutil
+from glob import glob
+
+import calltree_conversions as cc
+import cube_file_utils as cfu
+import cubex_archive as ca
+import index_conversions as ic
+import merger as mg
+import synthetic as sy
+import bench_utils as bu
+import pytest
+
+SINGLE_FILE = "../test_data/profile.cubex"
+SCALASCA_OUTPUT = "../test_data/scalasca_output"
+
+needs_cube_dump = pytest.mark.skipif(
+    shutil.which("cube_dump") is None, reason="cube_dump not available"
+)
+
+
+@needs_cube_dump
+def bench_cube_dump_w(benchmark):
+    bu.run(benchmark, cfu.get_cube_dump_w_text, SINGLE_FILE)
+
+
+@needs_cube_dump
+@pytest.mark.parametrize("exclusive", [True, False])
+def bench_cube_dump_csv(benchmark, exclusive):
+    bu.run(benchmark, cfu.get_dump, SINGLE_FILE, exclusive)
+
+
+@needs_cube_dump
+def bench_process_multi(benchmark):
+    files = glob(f"{SCALASCA_OUTPUT}/*/profile.cubex")
+    bu.run(benchmark, mg.process_multi, files)
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.DATA_SIZES)
+def bench_fake_cube_dump_csv(benchmark, n_cnodes, n_threads):
+    fake = sy.FakeCubeDump({"profile.cubex": bu.profile(n_cnodes, n_threads)})
+    with cfu.use_cube_dump_runner(fake):
+        bu.run(benchmark, cfu.get_dump, "profile.cubex")
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.SLOW_DATA_SIZES)
+def bench_process_multi_synthetic(benchmark, n_cnodes, n_threads):
+    fake = bu.fake_cube_dump(n_cnodes, n_threads)
+    with cfu.use_cube_dump_runner(fake):
+        bu.run(benchmark, mg.process_multi, sorted(fake.profiles))
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.DATA_SIZES)
+def bench_read_dump(benchmark, n_cnodes, n_threads):
+    text = bu.csv_text(n_cnodes, n_threads)
+    bu.run(benchmark, lambda: cfu.read_dump(io.StringIO(text)))
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.DATA_SIZES)
+@pytest.mark.parametrize("target", ["Short Callpath", "Full Callpath"])
+def bench_convert_index(benchmark, n_cnodes, n_threads, target):
+    df = bu.dump_df(n_cnodes, n_threads)
+    tree_df = bu.tree_df(n_cnodes)
+    bu.run(benchmark, ic.convert_index, df, tree_df, target)
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.SLOW_DATA_SIZES)
+def bench_convert_df_to_inclusive(benchmark, n_cnodes, n_threads):
+    df = cc.select_metrics(bu.dump_df(n_cnodes, n_threads), ["time", "visits"])
+    bu.run(benchmark, cc.convert_df_to_inclusive, df, bu.calltree(n_cnodes))
+
+
+@pytest.mark.parametrize("n_cnodes,n_threads", bu.DATA_SIZES)
+def bench_convert_array_to_inclusive(benchmark, n_cnodes, n_threads):
+    df = cc.select_metrics(bu.dump_df(n_cnodes, n_threads), ["time", "visits"])
+    tree_df = bu.tree_df(n_cnodes)
+    array = ic.to_cnode_array(df, tree_df).array
+    bu.run(benchmark, cc.convert_array_to_inclusive, array, tree_df)
+
+
+@pytest.mark.parametrize("max_workers", [1, None])
+def bench_read_metrics_native(benchmark, max_workers):
+    def read_metrics():
+        with ca.CubexReader(SINGLE_FILE) as reader:
+            return reader.read_metrics(max_workers=max_workers)
+
+    bu.run(benchmark, read_metrics)
@@ -0,0 +1,90 @@
+"""
+Shared parameters and cached synthetic inputs for the benchmarks.
+"""
+import os
+import io
+from functools import lru_cache
+from itertools import product
+
+import calltree as ct
+import cube_file_utils as cfu
+import synthetic as sy
+
+CNODES = [1000, 10000, 100000]
+THREADS = [1, 10, 100, 1000]
+
+MAX_ROWS = int(os.environ.get("CUPYBE_BENCH_MAX_ROWS", 10 ** 6))
+MAX_CNODES = int(os.environ.get("CUPYBE_BENCH_MAX_CNODES", 100000))
+SLOW_CNODES = int(os.environ.get("CUPYBE_BENCH_SLOW_CNODES", 1000))
+ROUNDS = int(os.environ.get("CUPYBE_BENCH_ROUNDS", 3))
+RUNS = int(os.environ.get("CUPYBE_BENCH_RUNS", 4))
+
+TREE_SIZES = [n for n in CNODES if n <= MAX_CNODES]
+SLOW_TREE_SIZES = [n for n in TREE_SIZES if n <= SLOW_CNODES]
+DATA_SIZES = [
+    (n, t) for n, t in product(TREE_SIZES, THREADS) if n * t <= MAX_ROWS
+]
+SLOW_DATA_SIZES = [(n, t) for n, t in DATA_SIZES if n <= SLOW_CNODES]
+
+
+def run(benchmark, fun, *args, **kwargs):
+    """
+    Runs a benchmark with a fixed number of rounds, as some stages are too
+    slow for the automatic calibration.
+    """
+    return benchmark.pedantic(
+        fun, args=args, kwargs=kwargs, rounds=ROUNDS, iterations=1
+    )
+
+
+@lru_cache(maxsize=None)
+def profile(n_cnodes, n_threads=1):
+    return sy.generate_profile(n_cnodes=n_cnodes, n_threads=n_threads)
+
+
+@lru_cache(maxsize=None)
+def w_text(n_cnodes):
+    return sy.cube_dump_w_text(profile(n_cnodes))
+
+
+@lru_cache(maxsize=None)
+def calltree_lines(n_cnodes):
+    return ct.get_call_tree_lines(w_text(n_cnodes))
+
+
+@lru_cache(maxsize=None)
+def calltree(n_cnodes):
+    return ct.calltree_from_lines(calltree_lines(n_cnodes))
+
+
+@lru_cache(maxsize=None)
+def tree_df(n_cnodes):
+    return ct.calltree_to_df(calltree(n_cnodes), full_path=True)
+
+
+@lru_cache(maxsize=None)
+def csv_text(n_cnodes, n_threads, exclusive=True):
+    return sy.cube_dump_csv_text(profile(n_cnodes, n_threads), exclusive)
+
+
+@lru_cache(maxsize=None)
+def dump_df(n_cnodes, n_threads):
+    return (
+        cfu.read_dump(io.StringIO(csv_text(n_cnodes, n_threads)))
+        .rename_axis("metric", axis="columns")
+        .set_index(["Cnode ID", "Thread ID"])
+    )
+
+
+@lru_cache(maxsize=None)
+def fake_cube_dump(n_cnodes, n_threads, n_runs=RUNS):
+    """
+    A fake ``cube_dump`` with ``n_runs`` profiles, as in the output of
+    ``scalasca -analyze`` (each run with different PAPI counters).
+    """
+    fake = sy.FakeCubeDump()
+    for run in range(n_runs):
+        fake.add(f"run{run}/profile.cubex", n_cnodes=n_cnodes,
+                 n_threads=n_threads, seed=run, n_papi_counters=2,
+                 first_papi_counter=2 * run)
+    return fake
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Time and peak memory used by each stage of the ingestion pipeline, measured
+with the ``instrumentation`` module on synthetic profiles (read through
+``synthetic.FakeCubeDump``).
+
+Usage:
+
+    PYTHONPATH=../src ./memory_usage.py [n_cnodes n_threads]...
+
+e.g. ``./memory_usage.py 10000 100 100000 10``.
+"""
+import sys
+
+import calltree_conversions as cc
+import cube_file_utils as cfu
+import index_conversions as ic
+import instrumentation as ins
+import merger as mg
+import synthetic as sy
+
+
+def stages(n_cnodes, n_threads):
+    """
+    Runs all the stages on a synthetic profile, returning the summary of
+    the recorded spans.
+    """
+    fake = sy.FakeCubeDump()
+    fake.add("profile.cubex", n_cnodes=n_cnodes, n_threads=n_threads)
+    with cfu.use_cube_dump_runner(fake), ins.recording() as recorder:
+        output = mg.process_cubex("profile.cubex")
+        ic.convert_index(output.df, output.ctree_df, "Short Callpath")
+        array = ic.to_cnode_array(output.df, output.ctree_df).array
+        cc.convert_array_to_inclusive(array, output.ctree_df)
+    summary = recorder.summary()
+    summary["peak_memory"] /= 2 ** 20
+    return summary.rename(columns={"peak_memory": "peak_memory (MB)"})
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]] or [1000, 10, 10000, 10]
+    for n_cnodes, n_threads in zip(args[::2], args[1::2]):
+        print(f"{n_cnodes} cnodes, {n_threads} threads:")
+        print(stages(n_cnodes, n_threads).to_string(float_format="%.3f"))
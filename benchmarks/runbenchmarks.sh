@@ -0,0 +1,26 @@
+#!/bin/bash
+
+# Benchmarks for the stages of the ingestion and analysis pipeline.
+#
+# Results are saved in .benchmarks/ (tagged with the current commit) and
+# compared with the last saved run, so that regressions show up between
+# commits. Extra arguments are passed to pytest, e.g.:
+#
+#   ./runbenchmarks.sh -k calltree_to_df
+#
+# The size of the synthetic profiles can be controlled with the
+# environment variables (see bench_utils.py):
+#   CUPYBE_BENCH_MAX_ROWS    maximum number of (cnode, thread) pairs
+#   CUPYBE_BENCH_MAX_CNODES  maximum number of cnodes
+#   CUPYBE_BENCH_SLOW_CNODES maximum number of cnodes for the slow stages
+#   CUPYBE_BENCH_ROUNDS      number of rounds for each benchmark
+#   CUPYBE_BENCH_RUNS        number of profiles for process_multi
+
+export PYTHONPATH=$PYTHONPATH:../src
+
+if ls .benchmarks/*/*.json &> /dev/null
+then
+    COMPARE="--benchmark-compare --benchmark-compare-fail=mean:20%"
+fi
+
+pytest --benchmark-autosave $COMPARE --benchmark-columns=min,mean,max,rounds "$@"
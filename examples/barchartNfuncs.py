@@ -24,7 +24,7 @@ most expensive functions.
 """
 if __name__ == "__main__":
     import merger as mg
-    import index_conversions as ic
+    import hotspots as hs
     import matplotlib.pyplot as plt
     import sys
 
@@ -50,17 +50,10 @@ if __name__ == "__main__":
 
     output_i = mg.process_cubex(inpfilename, exclusive=exclincl)
 
-    # We convert the Cnode IDs to short callpaths in the dataframe.
-    df_i = ic.convert_index(output_i.df, output_i.ctree_df, target="Short Callpath")
-
-    # We calculate the mean of the time
-
+    # We select the nfuncs callpaths with the largest time, summed over threads
     res = (
-        df_i.reset_index()[["Short Callpath", "Thread ID", metric]]
-        .groupby("Short Callpath")
-        .sum()
-        .sort_values([metric], ascending=False)[metric]
-        .head(nfuncs)
+        hs.top_k(output_i, metric, k=nfuncs, reduction="sum", exclusive=exclincl)
+        .set_index("Short Callpath")[metric]
     )
 
     print(res)
@@ -12,6 +12,7 @@ if <cubex file> is not provided, '../test_data/profile.cubex' is used.
 if __name__ == "__main__":
     import merger as mg
     import index_conversions as ic
+    import imbalance as ib
     import pandas as pd
     from sys import argv
 
@@ -26,20 +27,16 @@ if __name__ == "__main__":
 
     output_i = mg.process_cubex(input_file, exclusive=False)
 
-    df_i = output_i.df  # Dataframes with the metrics
-
     tree = output_i.ctree_df  # Dataframe containing info on the calltree
 
-    # We convert the Cnode IDs to short callpaths in the dataframe.
-    df_i = ic.convert_index(df_i, tree, target="Short Callpath")
-
-    # We calculate the mean of the time
-    times_mean = df_i.time.groupby("Short Callpath").mean().rename("mean")
+    # We compute the mean of the time and a measure of imbalance between
+    # threads, for all the cnodes at once
+    tree["Short Callpath"] = ic.get_short_callpath(tree)
+    stats = ib.get_imbalance(output_i, inclusive=True).time
+    stats.index = tree["Short Callpath"]
 
-    # We get a measure of imbalance between threads
-    times_max = df_i.time.groupby("Short Callpath").max()
-    times_min = df_i.time.groupby("Short Callpath").min()
-    times_imbalance = ((times_max - times_min) / times_mean).rename("imbalance")
+    times_mean = stats["mean"]
+    times_imbalance = stats["(max-min)/mean"].rename("imbalance")
 
     # We do a merge (=join) on the tree dataframe to find the parent-child relation
     parent_child = (
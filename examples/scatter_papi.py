@@ -42,8 +42,8 @@ if __name__ == "__main__":
         if files_check != files:
             raise Exception("Data  does not contain the expected files.")
     except:
-        inoutput = mg.process_multi(files, exclusive=False)
-        exoutput = mg.process_multi(files, exclusive=True)
+        output = mg.process_multi(files, mode="both")
+        inoutput, exoutput = output.incl, output.excl
         with open(pickle_archive, "wb") as f:
             data = pickle.dump((inoutput, exoutput, files), f)
 
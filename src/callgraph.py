@@ -0,0 +1,161 @@
+"""
+Function-level call graph, built by collapsing the cnodes of the call tree
+by ``Function ID`` (see :py:func:`calltree.calltree_to_df`).
+
+The call tree is path-sensitive: the same function appears under many
+cnodes. In the call graph there is a node per function, with the
+exclusive and inclusive cost summed over all its cnodes (the inclusive cost
+of a recursive function is counted only once, see
+:py:func:`funcwise.get_recursion_mask`), and an edge for each pair
+``(caller, callee)`` of functions, with the number of calls (from the
+``visits`` metric) and the inclusive cost of the callee when called by the
+caller.
+
+Everything is computed with ``numpy.bincount`` on the arrays of the
+``Function ID`` of each cnode and of its parent, so that no loop on the
+cnodes is needed. The callers and the callees of a function can then be
+queried as in ``gprof``:
+
+.. code-block:: python3
+
+    graph = callgraph.build_call_graph(output)
+    callgraph.callers(graph, "MPI_Allreduce")
+    callgraph.callees(graph, "solve_timestep")
+"""
+import calltree as ct
+import calltree_conversions as cc
+import funcwise as fw
+import metrics as mt
+import numpy as np
+import pandas as pd
+import profile_diff as pdiff
+from box import Box
+
+
+def build_call_graph(output, metrics=None, statistic="sum", calls_metric="visits"):
+    """
+    Builds the function-level call graph from the output of
+    ``process_cubex``.
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex``;
+    metrics : list of str or None
+        The metrics to aggregate. If ``None``, all the metrics that are
+        summed along the call tree (see :py:func:`metrics.get_ufuncs`);
+    statistic : str
+        How the values of the threads are reduced (see
+        :py:func:`profile_diff.reduce_over_threads`);
+    calls_metric : str
+        The metric counting the calls to each cnode (summed over threads).
+
+    Returns
+    -------
+    res : Box
+        - ``nodes``: a DataFrame indexed by ``Function ID``, with the
+          ``Function Name``, the number of ``Cnodes``, whether the function
+          is ``Recursive``, the total ``Calls`` and, for each metric, the
+          exclusive and inclusive costs (``<metric> excl`` and
+          ``<metric> incl``);
+        - ``edges``: a DataFrame with the ``Caller ID``, the ``Callee ID``,
+          their names, the ``Calls`` and, for each metric, the inclusive
+          cost of the callee for the calls from the caller;
+        - ``metrics``: the metrics.
+    """
+    tree_df = output.ctree_df
+    if metrics is None:
+        ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else {}
+        metrics = [m for m in output.df.columns if ufuncs.get(m, np.add) is np.add]
+    metrics = list(metrics)
+
+    reduced = pdiff.reduce_over_threads(output, metrics, statistic)
+    if calls_metric in output.df.columns:
+        calls = pdiff.reduce_over_threads(output, [calls_metric], "sum").excl[:, 0]
+    else:
+        calls = np.zeros(len(tree_df))
+
+    function_ids = tree_df["Function ID"].to_numpy()
+    n_functions = function_ids.max() + 1
+    recursive = fw.get_recursion_mask(tree_df)
+    function_names = ct.get_function_table(tree_df)
+
+    nodes = pd.DataFrame(
+        {
+            "Function Name": function_names.to_numpy(),
+            "Cnodes": np.bincount(function_ids, minlength=n_functions),
+            "Recursive": np.bincount(
+                function_ids, weights=recursive, minlength=n_functions
+            ) > 0,
+            "Calls": np.bincount(function_ids, weights=calls, minlength=n_functions),
+        },
+        index=function_names.index,
+    )
+    excl = fw.aggregate_array_by_function(reduced.excl, tree_df)
+    incl = fw.aggregate_array_by_function(reduced.incl, tree_df, inclusive=True)
+    for i, metric in enumerate(metrics):
+        nodes[f"{metric} excl"] = excl[:, i]
+        nodes[f"{metric} incl"] = incl[:, i]
+
+    # one edge for each (caller, callee) pair, from the cnodes with a parent
+    parents = cc.get_parent_positions(tree_df)
+    children = np.flatnonzero(parents >= 0)
+    callers = function_ids[parents[children]]
+    callees = function_ids[children]
+    keys, inverse = np.unique(callers * n_functions + callees, return_inverse=True)
+    # cnodes inside a recursion of the callee are already counted in an
+    # ancestor cnode of the same function
+    counted = ~recursive[children]
+
+    edges = pd.DataFrame(
+        {
+            "Caller ID": keys // n_functions,
+            "Callee ID": keys % n_functions,
+            "Calls": np.bincount(inverse, weights=calls[children], minlength=len(keys)),
+        }
+    )
+    edges.insert(2, "Caller", function_names.loc[edges["Caller ID"]].to_numpy())
+    edges.insert(3, "Callee", function_names.loc[edges["Callee ID"]].to_numpy())
+    for i, metric in enumerate(metrics):
+        edges[metric] = np.bincount(
+            inverse, weights=reduced.incl[children, i] * counted, minlength=len(keys)
+        )
+    return Box(nodes=nodes, edges=edges, metrics=metrics)
+
+
+def _function_id(graph, function):
+    if isinstance(function, str):
+        matches = graph.nodes.index[graph.nodes["Function Name"] == function]
+        assert len(matches) == 1, f"Unknown function {function}"
+        return matches[0]
+    return function
+
+
+def callers(graph, function, sort_by="Calls"):
+    """
+    The functions calling a function (given by name or ``Function ID``),
+    sorted by decreasing ``sort_by`` (``Calls``, or a metric).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The edges of :py:func:`build_call_graph` towards the function,
+        indexed by the caller name.
+    """
+    edges = graph.edges[graph.edges["Callee ID"] == _function_id(graph, function)]
+    return edges.set_index("Caller").sort_values(sort_by, ascending=False)
+
+
+def callees(graph, function, sort_by="Calls"):
+    """
+    The functions called by a function (given by name or ``Function ID``),
+    sorted by decreasing ``sort_by`` (``Calls``, or a metric).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The edges of :py:func:`build_call_graph` from the function, indexed
+        by the callee name.
+    """
+    edges = graph.edges[graph.edges["Caller ID"] == _function_id(graph, function)]
+    return edges.set_index("Callee").sort_values(sort_by, ascending=False)
@@ -6,11 +6,14 @@ A call tree is represented as a tree of
 named tuples (of class ``CubeTreeNode``)
 """
 import logging
-from tree_parsing import collect_hierarchy,level_fun
+from concurrent.futures import ProcessPoolExecutor
+from tree_parsing import collect_hierarchy, level_fun, parent_positions
 from box import Box
+import numpy as np
 import pandas as pd
 import re
 from cube_file_utils import get_lines, get_cube_dump_w_text
+import instrumentation as ins
 
 
 class CubeTreeNode(Box):
@@ -79,7 +82,13 @@ def iterate_on_call_tree(root, maxlevel=None):
             yield from iterate_on_call_tree(child, new_maxlevel)
 
 
-def calltree_to_df(call_tree, full_path=False):
+# node attributes added by calltree_to_df(..., attributes=True), with the
+# name of their (categorical) column
+attribute_columns = {"paradigm": "Paradigm", "role": "Role", "mode": "Source File"}
+
+
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
+def calltree_to_df(call_tree, full_path=False, attributes=False):
     """Convert a call tree into a DataFrame.
 
     Parameters
@@ -88,12 +97,19 @@ def calltree_to_df(call_tree, full_path=False):
         Recursive representation of a call tree
     full_path : bool
         Whether or not the full path needs to be in the output as a column
+    attributes : bool
+        Whether to add the attributes of the regions as columns: "Paradigm",
+        "Role" and "Source File" (categorical, see ``attribute_columns``),
+        "Begin Line" and "End Line".
 
     Returns
     -------
     df : DataFrame
         A dataframe with "Function Name", "Cnode ID", "Parent Cnode ID", 
-        "Level" and optionally "Full Callpath" as columns.
+        "Level", "Function ID" and optionally "Full Callpath" as columns.
+        The rows follow the depth-first order of the call tree. 
+        The "Function ID" is an integer shared by all the cnodes relative
+        to the same function (see :py:func:`get_function_table`).
 
     """
 
@@ -121,8 +137,40 @@ def calltree_to_df(call_tree, full_path=False):
                .reset_index()) #
     df = pd.merge(df,levels,left_on = 'Cnode ID', right_on = 'Cnode ID')
 
+    # Integer IDs for function names
+    df['Function ID'], _ = pd.factorize(df['Function Name'])
+
+    if attributes:
+        nodes = list(iterate_on_call_tree(call_tree))
+        for key, column in attribute_columns.items():
+            df[column] = pd.Categorical([n.get(key, "") for n in nodes])
+        df["Begin Line"] = pd.array([n.get("begin", pd.NA) for n in nodes], dtype="Int64")
+        df["End Line"] = pd.array([n.get("end", pd.NA) for n in nodes], dtype="Int64")
+
     return df
 
+
+def get_function_table(tree_df):
+    """
+    Gets the name of the function for each ``Function ID``.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, as produced by 
+        :py:func:`calltree_to_df`.
+
+    Returns
+    -------
+    functions : pandas.Series
+        The function names, indexed by ``Function ID``.
+    """
+    return (
+        tree_df.drop_duplicates("Function ID")
+        .set_index("Function ID")["Function Name"]
+        .sort_index()
+    )
+
 def get_level(parent_series):
     '''
     This function computes the levels starting from the parent information.
@@ -210,6 +258,27 @@ def get_fpath_vs_id(root, parent_full_callpath=""):
         data += get_fpath_vs_id(child, full_callpath + "/")
     return data
 
+def read_line_range(info):
+    """
+    Reads the first and the last line of the region out of the entries
+    without a key in the attributes of a line of the call tree, e.g.
+    ``id=257,   mod=, 632, 646, paradigm=compiler, ...``.
+
+    Returns
+    -------
+    res : dict
+        ``begin`` and ``end`` (integers, ``-1`` if not known), or nothing if
+        the entries are not there.
+    """
+    entries = [entry.strip() for entry in info.split(",") if "=" not in entry]
+    if len(entries) < 2:
+        return {}
+    try:
+        return {"begin": int(entries[0]), "end": int(entries[1])}
+    except ValueError:
+        return {}
+
+
 def create_node_cpp_template(line):
     """
     Parse a line in the call tree graph output by 'cube_dump -w'
@@ -245,6 +314,7 @@ def create_node_cpp_template(line):
 
     # extract attributes from entry pairs
     attrs = {key.strip(): value.strip() for key, value in entry_pairs}
+    attrs.update(read_line_range(info))
 
     # set fname as function name
     fname_full = fname.strip()
@@ -296,6 +366,7 @@ def create_node_cpp(line):
 
     # extract attributes from entry pairs
     attrs = {key.strip(): value.strip() for key, value in entry_pairs}
+    attrs.update(read_line_range(info))
 
     # set fname as function name
     fname_full = fname.strip()
@@ -345,6 +416,7 @@ def create_node_simple(line):
 
     # extract attributes from entry pairs
     attrs = {key.strip(): value.strip() for key, value in entry_pairs}
+    attrs.update(read_line_range(info))
 
     # set fname as function name
     attrs['fname'] = fname 
@@ -389,10 +461,154 @@ def get_call_tree_lines(cube_dump_w_text):
     )
 
 
-def calltree_from_lines(input_lines):
+def truncate_call_tree_lines(input_lines, maxlevel):
+    """
+    Drops the lines of the call tree deeper than ``maxlevel``, before they
+    are parsed.
+
+    Parameters
+    ----------
+    input_lines : list of str
+        The lines of the call tree (see :py:func:`get_call_tree_lines`);
+    maxlevel : int
+        The deepest level to keep (the root is at level 0).
+
+    Returns
+    -------
+    lines : list of str
+        The lines that are kept;
+    cutoff : pandas.Series
+        For each dropped cnode (in the index), the ``Cnode ID`` of its
+        ancestor at level ``maxlevel``.
+    """
+    lines = []
+    dropped = []
+    ancestors = []
+    ancestor_id = None
+    for line in input_lines:
+        level = level_fun(line)
+        if level > maxlevel:
+            dropped.append(int(re.search(r"\bid=(\d+)", line).group(1)))
+            ancestors.append(ancestor_id)
+            continue
+        if level == maxlevel:
+            ancestor_id = int(re.search(r"\bid=(\d+)", line).group(1))
+        lines.append(line)
+    cutoff = pd.Series(ancestors, index=pd.Index(dropped, name="Cnode ID"), dtype=int)
+    return lines, cutoff
+
+
+def _parse_lines(lines):
+    """
+    Parses a chunk of lines of the call tree, returning the level of each
+    line (an array) and a list with a plain ``dict`` of the attributes of
+    each node (see :py:func:`create_node`, without ``parent`` and
+    ``children``), which is cheaper to send between processes than a node.
+    """
+    levels = np.fromiter((level_fun(line) for line in lines), dtype=int, count=len(lines))
+    attrs = []
+    for line in lines:
+        node_attrs = create_node(line).to_dict()
+        del node_attrs["parent"], node_attrs["children"]
+        attrs.append(node_attrs)
+    return levels, attrs
+
+
+def _frozen_node(values):
+    """
+    Creates a ``CubeTreeNode`` from values that need no conversion (strings,
+    numbers, nodes and tuples of nodes), storing them directly instead of
+    going through the conversion of each value done by ``Box``.
+    """
+    node = CubeTreeNode()
+    dict.update(node, values)
+    return node
+
+
+def link_parsed_lines(levels, attrs):
+    """
+    Builds the call tree from the levels and the attributes of the lines
+    (see :py:func:`_parse_lines`).
+
+    The parents of all the lines are found at once from the levels (see
+    :py:func:`tree_parsing.parent_positions`), and the nodes are then
+    created bottom-up, with the same structure as in
+    :py:func:`calltree_from_lines`: the ``parent`` of a node is a copy of the
+    parent without ``children``. All the values are converted beforehand,
+    so that the nodes can be filled directly (see :py:func:`_frozen_node`):
+    the conversion done by ``Box`` for each node would otherwise take most
+    of the time.
+
+    Parameters
+    ----------
+    levels : numpy.ndarray
+        The level of each line;
+    attrs : list of dict
+        The attributes of the node of each line.
+
+    Returns
+    -------
+    root : CubeTreeNode
+        The node of the first line.
+    """
+    parents = parent_positions(levels).tolist()
+    attrs = [
+        {key: CubeTreeNode(value) if isinstance(value, dict) else value
+         for key, value in node_attrs.items()}
+        for node_attrs in attrs
+    ]
+    bare = {
+        parent: _frozen_node(dict(attrs[parent], parent=None, children=()))
+        for parent in set(parents) if parent >= 0
+    }
+    children = [[] for _ in attrs]
+    node = None
+    # the children follow their parent in the lines
+    for position in range(len(attrs) - 1, -1, -1):
+        parent = parents[position]
+        node = _frozen_node(
+            dict(
+                attrs[position],
+                parent=bare.get(parent),
+                children=tuple(children[position][::-1]),
+            )
+        )
+        if parent >= 0:
+            children[parent].append(node)
+    return node
+
+
+def calltree_from_lines(input_lines, processes=None, chunksize=10000):
     """
     Build the call tree structure from the output
+
+    Parameters
+    ----------
+    input_lines : list of str
+        The lines of the call tree (see :py:func:`get_call_tree_lines`);
+    processes : int or None
+        If given, the lines are parsed in chunks of ``chunksize`` lines by a
+        pool of ``processes`` worker processes, and the nodes are then linked
+        in this process, using the levels of the lines (see
+        :py:func:`link_parsed_lines`). The resulting tree is the same.
+    chunksize : int
+        The number of lines parsed by a worker at a time.
     """
+    if processes is not None:
+        with ins.span(
+            "calltree.calltree_from_lines", lines=len(input_lines), processes=processes
+        ):
+            chunks = [
+                input_lines[i : i + chunksize]
+                for i in range(0, len(input_lines), chunksize)
+            ]
+            with ins.span("calltree.parse_lines", chunks=len(chunks)):
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    parsed = list(executor.map(_parse_lines, chunks))
+            levels = np.concatenate([chunk_levels for chunk_levels, _ in parsed])
+            attrs = [node_attrs for _, chunk_attrs in parsed for node_attrs in chunk_attrs]
+            with ins.span("calltree.link_parsed_lines"):
+                return link_parsed_lines(levels, attrs)
 
     # list of non-zero length lines
     def assemble_function(root, children):
@@ -408,10 +624,57 @@ def calltree_from_lines(input_lines):
 
         return CubeTreeNode(root)
 
-    return collect_hierarchy(input_lines, level_fun, create_node, assemble_function)
+    # create_node and assemble_function are called once per line: only their
+    # total time is recorded (the rest is spent in collect_hierarchy).
+    with ins.span("calltree.calltree_from_lines", lines=len(input_lines)):
+        return collect_hierarchy(
+            input_lines,
+            level_fun,
+            ins.timed("create_node", create_node),
+            ins.timed("assemble_function", assemble_function),
+        )
+
+
+def prune_call_tree(root, cnode_ids):
+    """
+    Builds a new call tree containing only the selected nodes.
+
+    Parameters
+    ----------
+    root : CubeTreeNode
+        The root of the tree;
+    cnode_ids : set
+        The ``Cnode ID`` values of the nodes to keep. It must contain all the 
+        ancestors of each of the selected nodes (in particular, the root).
+
+    Returns
+    -------
+    res : CubeTreeNode
+        The root of the pruned tree.
+    """
+
+    def assemble(node):
+        children = [
+            assemble(child) for child in node.children if child.cnode_id in cnode_ids
+        ]
+        res = dict(node)
+        res["parent"] = None
+        res["children"] = []
+        new_root = CubeTreeNode(res)
+
+        def deorphan_and_freeze(child):
+            res = dict(child)
+            res["parent"] = new_root
+            return CubeTreeNode(res)
+
+        res["children"] = [deorphan_and_freeze(child) for child in children]
+        return CubeTreeNode(res)
+
+    return assemble(root)
 
 
-def get_call_tree(profile_file):
+@ins.instrumented()
+def get_call_tree(profile_file, processes=None):
     """
     Typical use case, gets all the information regarding the calltree
 
@@ -419,6 +682,9 @@ def get_call_tree(profile_file):
     ==========
     profile_file : str
         Name of the ``.cubex`` file
+    processes : int or None
+        The number of worker processes used to parse the lines (see
+        :py:func:`calltree_from_lines`).
 
     Returns
     =======
@@ -429,6 +695,6 @@ def get_call_tree(profile_file):
 
     cube_dump_w_text = get_cube_dump_w_text(profile_file)
     call_tree_lines = get_call_tree_lines(cube_dump_w_text)
-    calltree = calltree_from_lines(call_tree_lines)
+    calltree = calltree_from_lines(call_tree_lines, processes)
 
     return calltree
@@ -3,11 +3,13 @@ Utilities to convert metrics to inclusive.
 '''
 
 import calltree as ct
-import pandas as pd
+import numpy as np
 import pandas as pd
 import index_conversions as ic
+import instrumentation as ins
 
 
+@ins.instrumented(counts=lambda series: {"rows": len(series)})
 def convert_series_to_inclusive(series, call_tree):
     '''
     Converts a series having Cnode IDs as index from exclusive to inclusive.
@@ -105,6 +107,7 @@ def select_metrics(df, selected_metrics):
         return df.loc[:, list(possible_metrics)]
 
 
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
 def convert_df_to_inclusive(df_convertible, call_tree):
     """
     Converts a DataFrame from exclusive to inclusive. A level named
@@ -154,3 +157,168 @@ def convert_df_to_inclusive(df_convertible, call_tree):
         .pipe(ic.convert_index, tree_df, old_index_name)
         .stack(levels_to_unstack)
     )
+
+
+def get_parent_positions(tree_df):
+    """
+    Finds, for each row of a call tree DataFrame, the position (row number)
+    of the row of its parent.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, with ``Cnode ID`` and 
+        ``Parent Cnode ID`` as columns.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        Array of integers, with ``-1`` for the root(s).
+    """
+    parent_ids = tree_df["Parent Cnode ID"].fillna(-1).to_numpy(dtype=int)
+    return pd.Index(tree_df["Cnode ID"]).get_indexer(parent_ids)
+
+
+def _bottom_up_groups(tree_df):
+    """
+    Yields, from the deepest level to level 1, the positions of the rows at
+    that level and the positions of their parents.
+    """
+    parents = get_parent_positions(tree_df)
+    levels = tree_df["Level"].to_numpy(dtype=int)
+    order = np.argsort(levels, kind="stable")
+    bounds = np.searchsorted(levels[order], np.arange(levels.max() + 2))
+    for level in range(levels.max(), 0, -1):
+        positions = order[bounds[level] : bounds[level + 1]]
+        yield positions, parents[positions]
+
+
+@ins.instrumented(counts=lambda res: {"shape": res.shape})
+def convert_array_to_inclusive(array, tree_df, ufunc=np.add):
+    """
+    Converts an array of exclusive measurements into inclusive ones, 
+    summing the values of all the descendants of each cnode (or combining
+    them with ``ufunc``).
+
+    Vectorized alternative to :py:func:`convert_df_to_inclusive`: the tree
+    is traversed bottom-up one level at a time, so that the cost is linear in
+    the number of cnodes.
+
+    *Notice: The results may be nonsensical unless the metrics acted upon are 
+    "INCLUSIVE convertible"*
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Array whose first axis is aligned with the rows of ``tree_df`` (e.g.,
+        the output of :py:func:`index_conversions.to_cnode_array`).
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, with the ``Cnode ID``, 
+        ``Parent Cnode ID`` and ``Level`` columns.
+    ufunc : numpy.ufunc or list of numpy.ufunc
+        The binary operation used to combine the values of a cnode with the
+        ones of its children, e.g. ``numpy.add`` (default), ``numpy.minimum``
+        or ``numpy.maximum``. A list gives the operation for each index
+        along the second axis of ``array`` (e.g., for each metric, see
+        :py:func:`metrics.get_ufuncs`): the columns are grouped by operation,
+        and all the groups are aggregated in the same traversal of the tree.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        An array with the same shape of ``array``.
+    """
+    res = np.array(array, dtype=float)
+    if isinstance(ufunc, np.ufunc):
+        groups = [(ufunc, None)]
+    else:
+        assert len(ufunc) == res.shape[1], "One ufunc per column needed"
+        groups = [
+            (u, np.array([i for i, v in enumerate(ufunc) if v is u]))
+            for u in set(ufunc)
+        ]
+        if len(groups) == 1:
+            groups = [(groups[0][0], None)]
+
+    for positions, parent_positions in _bottom_up_groups(tree_df):
+        for group_ufunc, columns in groups:
+            if columns is None:
+                group_ufunc.at(res, parent_positions, res[positions])
+            else:
+                group_ufunc.at(
+                    res,
+                    (parent_positions[:, None], columns[None, :]),
+                    res[positions][:, columns],
+                )
+    return res
+
+
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
+def convert_df_to_inclusive_vectorized(df, tree_df, ufuncs=None):
+    """
+    Converts a DataFrame from exclusive to inclusive, using
+    :py:func:`convert_array_to_inclusive`.
+
+    Vectorized alternative to :py:func:`convert_df_to_inclusive`, which can
+    also aggregate each metric with a different operation (e.g., the minimum
+    for ``min_time``).
+
+    *Notice: The results may be nonsensical unless the metrics acted upon are
+    "INCLUSIVE convertible"*
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A DataFrame with ``Cnode ID`` in the index (e.g., ``df`` in the output
+        of ``process_cubex``).
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`). The
+        metrics that are not in the dictionary are summed.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the same index and columns as ``df``.
+    """
+    cnode_array = ic.to_cnode_array(df, tree_df)
+    if ufuncs is None:
+        ufunc = np.add
+    else:
+        metrics = (
+            df.columns.get_level_values("metric")
+            if "metric" in df.columns.names
+            else df.columns
+        )
+        ufunc = [ufuncs.get(metric, np.add) for metric in metrics]
+    inclusive = convert_array_to_inclusive(cnode_array.array, tree_df, ufunc)
+    return ic.from_cnode_array(inclusive, cnode_array, df.index)
+
+
+@ins.instrumented(counts=lambda res: {"shape": res.shape})
+def convert_array_to_exclusive(array, tree_df):
+    """
+    Converts an array of inclusive measurements into exclusive ones,
+    subtracting from each cnode the values of its children.
+
+    Inverse of :py:func:`convert_array_to_inclusive`.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Array whose first axis is aligned with the rows of ``tree_df``.
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        An array with the same shape of ``array``.
+    """
+    array = np.asarray(array, dtype=float)
+    res = array.copy()
+    parents = get_parent_positions(tree_df)
+    children = np.flatnonzero(parents >= 0)
+    np.subtract.at(res, parents[children], array[children])
+    return res
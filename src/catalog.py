@@ -0,0 +1,401 @@
+"""
+A catalog of experiments, stored in a SQLite database.
+
+Each ``.cubex`` file is processed (with ``process_cubex``) only once, when
+it is ingested, and the catalog stores:
+
+- the metadata of the file (see :py:func:`cubex_archive.scan_cubex`) and
+  user-defined *tags* (e.g., ``nproc=40``), in the ``files`` and ``tags``
+  tables;
+- the call tree, in the ``cnodes`` table (``cnode_id``, ``parent_id``,
+  ``function_id``, ``level``, ``callpath`` and ``recursive``, whether the
+  cnode has an ancestor relative to the same function), and the function
+  names in the ``functions`` table;
+- for each cnode and each metric, the sum, the mean, the minimum and the
+  maximum over threads of the exclusive and of the inclusive values, in the
+  ``metric_values`` table.
+
+Queries across experiments, like
+
+.. code-block:: python3
+
+    catalog = Catalog("experiments.sqlite")
+    catalog.ingest("profile-25m-nproc40-nsteps10.cubex", tags=dict(nproc=40))
+    ...
+    catalog.function_values("MPI_Allreduce", "time", tags=dict(nproc=40))
+
+then only read the database. Arbitrary SQL queries can be run with
+:py:meth:`Catalog.query`.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tarfile
+import xml.etree.ElementTree as ET
+
+import cubex_archive as ca
+import funcwise as fw
+import index_conversions as ic
+import merger as mg
+import numpy as np
+import pandas as pd
+
+statistics = ["sum", "mean", "min", "max"]
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    file_size INTEGER,
+    mtime REAL,
+    cube_version TEXT,
+    scorep_version TEXT,
+    attributes TEXT,
+    n_cnodes INTEGER,
+    n_threads INTEGER
+);
+CREATE TABLE IF NOT EXISTS tags (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (file_id, key)
+);
+CREATE TABLE IF NOT EXISTS functions (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    function_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (file_id, function_id)
+);
+CREATE TABLE IF NOT EXISTS cnodes (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    cnode_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    function_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    callpath TEXT,
+    recursive INTEGER NOT NULL,
+    PRIMARY KEY (file_id, cnode_id)
+);
+CREATE TABLE IF NOT EXISTS metric_values (
+    file_id INTEGER NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    cnode_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    inclusive INTEGER NOT NULL,
+    sum REAL,
+    mean REAL,
+    min REAL,
+    max REAL,
+    PRIMARY KEY (file_id, metric, inclusive, cnode_id)
+);
+CREATE INDEX IF NOT EXISTS functions_name ON functions (name, file_id);
+CREATE INDEX IF NOT EXISTS tags_key_value ON tags (key, value);
+CREATE INDEX IF NOT EXISTS cnodes_function ON cnodes (file_id, function_id);
+CREATE INDEX IF NOT EXISTS metric_values_metric ON metric_values (metric, inclusive);
+"""
+
+
+def reduce_over_threads(df, tree_df):
+    """
+    Computes the sum, the mean, the minimum and the maximum over threads for
+    every cnode and every metric.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID`` and ``Thread ID`` (e.g., ``df``
+        in the output of ``process_cubex``);
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A "long" DataFrame with the ``cnode_id`` and ``metric`` columns and
+        one column per statistic.
+    """
+    arr = ic.to_cnode_array(df, tree_df)
+    values = arr.array
+    reduced = np.stack(
+        [values.sum(axis=-1), values.mean(axis=-1), values.min(axis=-1),
+         values.max(axis=-1)],
+        axis=-1,
+    )
+    n_cnodes, n_metrics = values.shape[:2]
+    res = pd.DataFrame(reduced.reshape(n_cnodes * n_metrics, -1), columns=statistics)
+    res.insert(0, "cnode_id", np.repeat(arr.cnode_ids, n_metrics))
+    res.insert(1, "metric", np.tile(np.asarray(arr.columns, dtype=object), n_cnodes))
+    return res
+
+
+def _file_metadata(profile_file):
+    """
+    The metadata of a file, from ``anchor.xml`` if possible (``None``
+    values otherwise, e.g. for files that are not ``.cubex`` archives).
+    """
+    try:
+        info = ca.scan_cubex(profile_file)
+        return dict(
+            file_size=info.file_size,
+            mtime=info.mtime,
+            cube_version=info.cube_version,
+            scorep_version=info.scorep_version,
+            attributes=json.dumps(info.attributes),
+        )
+    except (OSError, tarfile.TarError, ET.ParseError, KeyError):
+        return dict(file_size=None, mtime=None, cube_version=None,
+                    scorep_version=None, attributes=None)
+
+
+class Catalog:
+    """
+    A catalog of experiments, stored in a SQLite database (see the module
+    documentation).
+
+    Parameters
+    ----------
+    path : str
+        The name of the database file (``:memory:`` for a temporary,
+        in-memory database). It is created if it does not exist.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def file_id(self, profile_file):
+        """
+        The ID of an ingested file, or ``None``.
+        """
+        row = self.connection.execute(
+            "SELECT file_id FROM files WHERE path = ?", (profile_file,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def is_up_to_date(self, profile_file):
+        """
+        Whether a file has been ingested, and has not been modified since.
+        """
+        row = self.connection.execute(
+            "SELECT file_size, mtime FROM files WHERE path = ?", (profile_file,)
+        ).fetchone()
+        if row is None:
+            return False
+        if not os.path.exists(profile_file):
+            return True
+        stat = os.stat(profile_file)
+        return row == (stat.st_size, stat.st_mtime)
+
+    def ingest(self, profile_file, tags=None, force=False):
+        """
+        Processes a ``.cubex`` file and stores its data in the catalog.
+
+        Files that are already in the catalog, and have not been modified
+        since they were ingested, are not processed again (only the tags are
+        updated).
+
+        Parameters
+        ----------
+        profile_file : str
+            Name of the ``.cubex`` file;
+        tags : dict or None
+            User-defined tags for the experiment (e.g., ``{"nproc": 40}``);
+        force : bool
+            Whether to process the file even if it is up to date.
+
+        Returns
+        -------
+        file_id : int
+            The ID of the file in the catalog.
+        """
+        if force or not self.is_up_to_date(profile_file):
+            self.remove(profile_file)
+            output = mg.process_cubex(profile_file, mode="both")
+            with self.connection:
+                file_id = self._insert(profile_file, output)
+        else:
+            logging.debug(f"{profile_file} already in the catalog.")
+            file_id = self.file_id(profile_file)
+        if tags:
+            self.set_tags(profile_file, **tags)
+        return file_id
+
+    def _insert(self, profile_file, output):
+        tree_df = output.excl.ctree_df
+        n_threads = len(output.excl.df.index.unique("Thread ID"))
+        metadata = _file_metadata(profile_file)
+        cursor = self.connection.execute(
+            "INSERT INTO files (path, file_size, mtime, cube_version, "
+            "scorep_version, attributes, n_cnodes, n_threads) "
+            "VALUES (:path, :file_size, :mtime, :cube_version, :scorep_version, "
+            ":attributes, :n_cnodes, :n_threads)",
+            dict(metadata, path=profile_file, n_cnodes=len(tree_df),
+                 n_threads=n_threads),
+        )
+        file_id = cursor.lastrowid
+
+        functions = tree_df.drop_duplicates("Function ID")
+        self.connection.executemany(
+            "INSERT INTO functions VALUES (?, ?, ?)",
+            zip([file_id] * len(functions), functions["Function ID"].tolist(),
+                functions["Function Name"].tolist()),
+        )
+        parents = tree_df["Parent Cnode ID"].astype(object)
+        self.connection.executemany(
+            "INSERT INTO cnodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                [file_id] * len(tree_df),
+                tree_df["Cnode ID"].tolist(),
+                [None if pd.isna(p) else int(p) for p in parents],
+                tree_df["Function ID"].tolist(),
+                tree_df["Level"].tolist(),
+                (tree_df["Full Callpath"].tolist() if "Full Callpath" in tree_df
+                 else [None] * len(tree_df)),
+                fw.get_recursion_mask(tree_df).astype(int).tolist(),
+            ),
+        )
+        for inclusive, data in [(0, output.excl), (1, output.incl)]:
+            reduced = reduce_over_threads(data.df, tree_df)
+            self.connection.executemany(
+                "INSERT INTO metric_values VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (file_id, int(cnode_id), metric, inclusive) + tuple(values)
+                    for cnode_id, metric, *values in reduced.itertuples(
+                        index=False, name=None
+                    )
+                ),
+            )
+        return file_id
+
+    def remove(self, profile_file):
+        """
+        Removes a file (and all its data) from the catalog.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM files WHERE path = ?", (profile_file,))
+
+    def set_tags(self, profile_file, **tags):
+        """
+        Sets user-defined tags for an ingested file (values are stored as
+        text).
+        """
+        file_id = self.file_id(profile_file)
+        if file_id is None:
+            raise KeyError(f"{profile_file} not in the catalog")
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tags VALUES (?, ?, ?)",
+                [(file_id, key, str(value)) for key, value in tags.items()],
+            )
+
+    def query(self, sql, params=()):
+        """
+        Runs a SQL query on the catalog, returning a DataFrame.
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def files(self):
+        """
+        The ingested files, with their metadata and tags (one column per tag
+        key).
+
+        Returns
+        -------
+        res : pandas.DataFrame
+            A DataFrame indexed by ``file_id``.
+        """
+        files = self.query("SELECT * FROM files").set_index("file_id")
+        tags = self.query("SELECT * FROM tags").pivot(
+            index="file_id", columns="key", values="value"
+        )
+        return files.join(tags.rename_axis(None, axis="columns"))
+
+    def _filter_tags(self, tags):
+        clauses, params = [], []
+        for key, value in (tags or {}).items():
+            clauses.append(
+                "files.file_id IN "
+                "(SELECT file_id FROM tags WHERE key = ? AND value = ?)"
+            )
+            params += [key, str(value)]
+        return clauses, params
+
+    def function_values(self, function, metric, inclusive=False, tags=None):
+        """
+        The statistics over threads of a metric for a function, summed over
+        all the cnodes relative to the function, for each file.
+
+        Parameters
+        ----------
+        function : str
+            The function name;
+        metric : str
+            The metric;
+        inclusive : bool
+            Whether to use the exclusive (False) or inclusive (True) values.
+            For the inclusive values, the cnodes inside a recursive call of
+            the function (``recursive`` in the ``cnodes`` table) are skipped,
+            so that they are counted only once;
+        tags : dict or None
+            Only files with these tags are considered.
+
+        Returns
+        -------
+        res : pandas.DataFrame
+            A DataFrame indexed by ``path``, with one column per statistic
+            (the sums over cnodes of the ``sum``, ``mean``, ``min`` and
+            ``max`` over threads) and the number of cnodes summed.
+        """
+        clauses, params = self._filter_tags(tags)
+        if inclusive:
+            clauses.append("NOT c.recursive")
+        where = "".join(f" AND {clause}" for clause in clauses)
+        sql = (
+            "SELECT files.path, "
+            + ", ".join(f"SUM(v.{s}) AS {s}" for s in statistics)
+            + ", COUNT(*) AS cnodes "
+            "FROM functions f "
+            "JOIN cnodes c ON c.file_id = f.file_id AND c.function_id = f.function_id "
+            "JOIN metric_values v ON v.file_id = c.file_id AND v.cnode_id = c.cnode_id "
+            "JOIN files ON files.file_id = f.file_id "
+            "WHERE f.name = ? AND v.metric = ? AND v.inclusive = ?"
+            + where
+            + " GROUP BY files.path ORDER BY files.path"
+        )
+        return self.query(sql, [function, metric, int(inclusive)] + params).set_index(
+            "path"
+        )
+
+    def cnode_values(self, profile_file, metrics=None, inclusive=False,
+                     statistic="mean"):
+        """
+        The values of a statistic over threads for every cnode of a file.
+
+        Returns
+        -------
+        res : pandas.DataFrame
+            A DataFrame indexed by ``Cnode ID``, with one column per metric.
+        """
+        assert statistic in statistics, f"Unknown statistic {statistic}"
+        file_id = self.file_id(profile_file)
+        if file_id is None:
+            raise KeyError(f"{profile_file} not in the catalog")
+        df = self.query(
+            f"SELECT cnode_id, metric, {statistic} FROM metric_values "
+            "WHERE file_id = ? AND inclusive = ?",
+            (file_id, int(inclusive)),
+        )
+        res = df.pivot(index="cnode_id", columns="metric", values=statistic)
+        res = res.rename_axis(index="Cnode ID")
+        return res if metrics is None else res.loc[:, list(metrics)]
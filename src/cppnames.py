@@ -0,0 +1,250 @@
+"""
+Normalisation of C++ function names, to group the instantiations of the same
+template (and the overloads of the same function) together.
+
+In C++ profiles every instantiation of a template is a separate region, e.g.
+``Eigen::internal::call_dense_assignment_loop`` appears with a different
+``[with DstXprType = ...]`` substitution for each expression type, and the
+names of the functions of class templates contain the template arguments
+(``Eigen::Matrix<double,-1,-1>::resize``). :py:func:`normalise_name` strips
+the template arguments, the parameter lists and the ``[with ...]``
+substitutions beyond a configurable nesting depth:
+
+.. code-block:: python3
+
+    >>> normalise_name("Eigen::Matrix<double,-1,-1>::resize")
+    'Eigen::Matrix::resize'
+    >>> normalise_name("Eigen::Matrix<double,-1,-1>::resize", template_depth=1)
+    'Eigen::Matrix<double,-1,-1>::resize'
+
+The names are normalised once per distinct ``Function ID`` (see
+:py:func:`get_name_groups`), so that the cost does not depend on the number
+of cnodes, and the metrics are then aggregated by group with the same
+vectorized reductions used in :py:mod:`funcwise`:
+
+.. code-block:: python3
+
+    groups = cppnames.get_name_groups(output.ctree_df)
+    ufuncs = metrics.get_ufuncs(output.metrics)
+    cppnames.aggregate_by_name(output.df, output.ctree_df, groups, ufuncs=ufuncs)
+    cppnames.top_names(output.df, output.ctree_df, "time", k=20, groups=groups)
+"""
+import re
+
+import funcwise as fw
+import numpy as np
+import pandas as pd
+from box import Box
+
+# tokens copied as they are, even if they contain brackets or spaces
+_verbatim = re.compile(
+    r"operator\s*(?:\(\)|\[\]|->\*?|<=>|<<=?|>>=?|&&|\|\||\+\+|--|[-+*/%^&|~!=<>,]=?)"
+    r"|operator\s+\w[\w:]*"
+    r"|\(anonymous namespace\)"
+    r"|\{[^{}]*\}"
+)
+_with = re.compile(r"\s*\[with .*\]\s*$")
+_spaces = re.compile(r"(?<=,)\s+|\s+(?=[,)>])")
+
+# pandas aggregations equivalent to the ufuncs in metrics.get_ufuncs
+_aggregations = {np.add: "sum", np.minimum: "min", np.maximum: "max"}
+
+
+def normalise_name(name, template_depth=0, params_depth=0, keep_subs=False, keep_return=False):
+    """
+    Canonicalises a C++ function name.
+
+    Parameters
+    ----------
+    name : str
+        The name (e.g., ``Function Name``, or ``fname_full`` in the nodes of
+        the call tree, see :py:func:`calltree.create_node_cpp_template`);
+    template_depth : int
+        The number of nesting levels of template arguments to keep (``0``
+        removes all of them, ``1`` keeps ``A<B<int>>`` as ``A<B>``);
+    params_depth : int
+        The number of nesting levels of parentheses to keep (``0`` removes
+        the parameter list, together with the qualifiers following it);
+    keep_subs : bool
+        Whether to keep the ``[with ...]`` template substitutions;
+    keep_return : bool
+        Whether to keep the return type and the specifiers before the name
+        (e.g., ``virtual``).
+
+    Returns
+    -------
+    name : str
+        The normalised name, with no spaces after commas (as in
+        :py:func:`calltree.create_node_cpp`) or before closing brackets.
+    """
+    subs = ""
+    if keep_subs:
+        match = _with.search(name)
+        if match is not None:
+            subs = " " + match.group().strip()
+    name = _with.sub("", name).strip()
+
+    out = []
+    # the open brackets, with whether their content is dropped
+    stack = []
+    dropping = False
+    name_start = 0
+    params_start = None
+    i = 0
+    while i < len(name):
+        c = name[i]
+        match = _verbatim.match(name, i)
+        if match is not None and (i == 0 or not (name[i - 1].isalnum() or name[i - 1] == "_")):
+            if not dropping:
+                out.append(match.group())
+            i = match.end()
+            continue
+        if c in "<(":
+            limit = template_depth if c == "<" else params_depth
+            depth = sum(1 for b, _ in stack if b == c)
+            drop = not dropping and depth >= limit
+            if c == "(" and not stack and params_start is None:
+                params_start = len(out)
+            stack.append((c, drop))
+            dropping = dropping or drop
+            if not dropping:
+                out.append(c)
+        elif c in ">)" and stack and stack[-1][0] == "<("[c == ")"]:
+            _, drop = stack.pop()
+            if not dropping:
+                out.append(c)
+            if drop:
+                dropping = False
+        else:
+            if c == " " and not stack and params_start is None:
+                name_start = len(out) + 1
+            if not dropping:
+                out.append(c)
+        i += 1
+
+    if params_depth == 0 and params_start is not None:
+        out = out[:params_start]
+    if keep_return:
+        name_start = 0
+    res = "".join(out[name_start:]).strip()
+    return _spaces.sub("", res) + subs
+
+
+def get_name_groups(tree_df, column="Function Name", **options):
+    """
+    Groups the cnodes of a call tree by normalised function name.
+
+    Each distinct name is normalised only once.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, as produced by
+        :py:func:`calltree.calltree_to_df`;
+    column : str
+        The column with the names;
+    options :
+        Passed to :py:func:`normalise_name`.
+
+    Returns
+    -------
+    res : Box
+        - ``ids``: the ``Group ID`` of each row of ``tree_df``;
+        - ``names``: the normalised names, indexed by ``Group ID`` (in order
+          of first appearance);
+        - ``sizes``: the number of distinct names in each group.
+    """
+    name_ids, distinct = pd.factorize(tree_df[column])
+    normalised = [normalise_name(name, **options) for name in distinct]
+    name_groups, names = pd.factorize(np.asarray(normalised, dtype=object))
+    return Box(
+        ids=name_groups[name_ids],
+        names=pd.Series(
+            names,
+            index=pd.RangeIndex(len(names), name="Group ID"),
+            name="Normalised Name",
+        ),
+        sizes=np.bincount(name_groups, minlength=len(names)),
+    )
+
+
+def aggregate_by_name(
+    df, tree_df, groups=None, inclusive=False, exclusive_data=True, ufuncs=None
+):
+    """
+    Aggregates the metrics in a DataFrame by normalised function name.
+
+    The same as :py:func:`funcwise.aggregate_by_function`, with the groups
+    of :py:func:`get_name_groups` instead of the functions (the inclusive
+    value of a group is counted only once when its functions call each
+    other).
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with ``Cnode ID`` in the index;
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree;
+    groups : Box or None
+        The output of :py:func:`get_name_groups` (computed with the default
+        options, if ``None``);
+    inclusive : bool
+        Whether to compute the inclusive (True) or exclusive (False) values;
+    exclusive_data : bool
+        Whether the data in ``df`` is exclusive (True) or inclusive (False);
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`), to
+        reduce e.g. ``max_time`` with the maximum instead of the sum.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the same columns as ``df``, where the ``Cnode ID``
+        level in the index is replaced by ``Normalised Name``.
+    """
+    if groups is None:
+        groups = get_name_groups(tree_df)
+    return fw.aggregate_by_function(
+        df,
+        tree_df,
+        inclusive,
+        exclusive_data,
+        function_ids=groups.ids,
+        names=groups.names,
+        ufuncs=ufuncs,
+    )
+
+
+def top_names(
+    df,
+    tree_df,
+    metric,
+    k=10,
+    groups=None,
+    inclusive=False,
+    exclusive_data=True,
+    ufuncs=None,
+):
+    """
+    The ``k`` normalised function names with the largest value of a metric,
+    reduced over all the other levels of the index (e.g., the threads) with
+    the same operation as over the cnodes (the sum, unless ``ufuncs`` says
+    otherwise).
+
+    See :py:func:`aggregate_by_name` for the parameters.
+
+    Returns
+    -------
+    res : pandas.Series
+        The values, indexed by ``Normalised Name``, in decreasing order.
+    """
+    res = aggregate_by_name(
+        df[[metric]], tree_df, groups, inclusive, exclusive_data, ufuncs
+    )
+    values = res[metric]
+    if values.index.nlevels > 1:
+        ufunc = (ufuncs or {}).get(metric, np.add)
+        values = values.groupby(level="Normalised Name", sort=False).agg(
+            _aggregations[ufunc]
+        )
+    return values.nlargest(k)
@@ -1,17 +1,67 @@
 """
 This module contains low-level functions that wrap/call the
 ``cube_dump`` utility.
+
+All the calls to ``cube_dump`` go through this module. A different
+"runner" can be set with :py:func:`set_cube_dump_runner` (or, temporarily,
+with :py:func:`use_cube_dump_runner`), e.g. to use the pure-Python
+stand-in in :py:class:`synthetic.FakeCubeDump` instead of the executable
+from CubeLib.
 """
 import subprocess
 import logging
 import sys
+import io
+from contextlib import contextmanager
 import pandas as pd
+import instrumentation as ins
 
 
 class CubeDumpException(Exception):
     pass
 
 
+# A callable taking the list of arguments for ``cube_dump`` and returning its
+# output as a string, or None to run the ``cube_dump`` executable.
+_cube_dump_runner = None
+
+
+def set_cube_dump_runner(runner):
+    """Sets the function used instead of the ``cube_dump`` executable.
+
+    Parameters
+    ==========
+    runner : callable or None
+        A function that takes the list of the arguments for ``cube_dump``
+        (e.g., ``["-w", "profile.cubex"]``) and returns what ``cube_dump``
+        would print, as a string. It should raise ``CubeDumpException`` on
+        errors. If ``None``, the ``cube_dump`` executable is used.
+
+    Returns
+    =======
+    previous : callable or None
+        The runner that was in use before.
+    """
+    global _cube_dump_runner
+    previous = _cube_dump_runner
+    _cube_dump_runner = runner
+    return previous
+
+
+@contextmanager
+def use_cube_dump_runner(runner):
+    """Context manager that sets the function used instead of the
+    ``cube_dump`` executable (see :py:func:`set_cube_dump_runner`) and
+    restores the previous one on exit.
+    """
+    previous = set_cube_dump_runner(runner)
+    try:
+        yield runner
+    finally:
+        set_cube_dump_runner(previous)
+
+
+@ins.instrumented(counts=lambda text: {"chars": len(text)})
 def get_cube_dump_w_text(profile_file):
     """Simple function that calls ``cube_dump -w`` and gets the output as a
     string.
@@ -26,6 +76,8 @@ def get_cube_dump_w_text(profile_file):
     cube_dump_w_text : str
         Output of ``cube_dump -w``
     """
+    if _cube_dump_runner is not None:
+        return _cube_dump_runner(["-w", profile_file])
 
     if sys.version_info >= (3, 7, 0):
         cube_dump_process = subprocess.run(
@@ -50,6 +102,7 @@ def get_cube_dump_w_text(profile_file):
     return cube_dump_process.stdout
 
 
+@ins.instrumented(counts=lambda lines: {"lines": len(lines)})
 def get_lines(cube_dump_w_text, start_hint, end_hint):
     """
     Select a section of the output of 'cube_dump -w'.
@@ -79,7 +132,8 @@ def get_lines(cube_dump_w_text, start_hint, end_hint):
     return lines
 
 
-def get_dump(profile_file, exclusive=True):
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
+def get_dump(profile_file, exclusive=True, metrics=None):
     """ Parses output of ``cube_dump`` on a ``.cubex`` file and returns a
     dataframe.
 
@@ -95,13 +149,39 @@ def get_dump(profile_file, exclusive=True):
     exclusive : bool
         Whether to ask ``cube_dump`` for exclusive (True) or inclusive (False) 
         metrics.
+    metrics : list of str or None
+        The (unique) names of the metrics to read. If ``None``, all the
+        metrics are read.
 
     Returns
     =======
     res : pandas.DataFrame
-        A DataFrame containing all the metrics in the ``.cubex`` file. 
+        A DataFrame containing all the metrics in the ``.cubex`` file
+        (or the selected ones).
     """
     excl_incl = "excl" if exclusive == True else "incl"
-    command = f"cube_dump -m all -x excl -z {excl_incl} -c all -s csv2 {profile_file}"
+    selected = "all" if metrics is None else ",".join(metrics)
+    command = f"cube_dump -m {selected} -x excl -z {excl_incl} -c all -s csv2 {profile_file}"
+    if _cube_dump_runner is not None:
+        with ins.span("cube_file_utils.cube_dump", file=profile_file):
+            text = _cube_dump_runner(command.split()[1:])
+        return read_dump(io.StringIO(text))
     cube_dump_process = subprocess.Popen(command.split(), stdout=subprocess.PIPE)
-    return pd.read_csv(cube_dump_process.stdout, sep="\s*,\s*", engine="python")
+    return read_dump(cube_dump_process.stdout)
+
+
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
+def read_dump(dump):
+    """ Reads the ``csv2`` output of ``cube_dump`` into a dataframe.
+
+    Parameters
+    ==========
+    dump : str or file-like
+        Path or buffer containing the output of ``cube_dump -s csv2``.
+
+    Returns
+    =======
+    res : pandas.DataFrame
+        A DataFrame with the same layout as the output of ``cube_dump``.
+    """
+    return pd.read_csv(dump, sep=r"\s*,\s*", engine="python")
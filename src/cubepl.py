@@ -0,0 +1,923 @@
+"""
+Evaluation of derived metrics written in CubePL, the language used in the
+``remapping.spec`` file contained in each ``.cubex`` archive (and in Cube
+in general) to define derived metrics, without ``cube_dump``.
+
+The expressions are evaluated on whole ``(cnode, thread)`` ``numpy`` arrays
+at once, built from the output of :ref:`process_cubex <process-cubex>` or
+:ref:`process_multi <process-multi>`. Conditional statements whose
+condition depends on the cnode or on the thread are evaluated with masks,
+so that each cnode/thread pair follows its own branch.
+
+The semantics of the different kinds of derived metrics is respected:
+
+- ``PREDERIVED_EXCLUSIVE``: the expression is computed on the exclusive
+  values of each cnode, and then summed over the call tree to obtain the
+  inclusive values;
+- ``PREDERIVED_INCLUSIVE``: the expression is computed on the inclusive
+  values, and the exclusive values are obtained by difference;
+- ``POSTDERIVED``: the expression is computed after the aggregation, i.e.,
+  on the exclusive values to obtain the exclusive value and on the
+  inclusive ones to obtain the inclusive value (e.g., for ratios).
+
+Supported CubePL subset:
+
+- blocks ``{ ... }``, assignments (also to array elements),
+  ``if``/``elseif``/``else``, ``while``, ``return``, ``global(...)`` and
+  ``cube::metric::set::<metric>("key", "value")``;
+- arithmetic (``+ - * / ^``), comparisons, ``eq``/``seq`` (string
+  equality), ``=~`` (regular expression match), ``and``/``or``/``xor``/
+  ``not``, and the functions ``sqrt``, ``abs``, ``exp``, ``ln``, ``log``,
+  ``sin``, ``cos``, ``tan``, ``asin``, ``acos``, ``atan``, ``sgn``,
+  ``pos``, ``neg``, ``floor``, ``ceil``, ``min``, ``max``, ``lowercase``
+  and ``uppercase``;
+- ``metric::<name>(e)``, ``metric::<name>(i)`` and ``metric::<name>()``,
+  for the exclusive, inclusive or "same as the calculation" value of a
+  metric (``metric::fixed::`` and ``metric::call::`` are treated as
+  ``metric::``);
+- the variables ``${cube::#callpaths}``, ``${cube::#regions}``,
+  ``${cube::#locations}``, ``${cube::callpath::calleeid}``,
+  ``${cube::callpath::parent::id}``, ``${cube::region::name}``,
+  ``${cube::region::paradigm}``, ``${cube::region::role}``,
+  ``${cube::region::mod}`` and, in the calculations,
+  ``${calculation::callpath::id}``, ``${calculation::region::id}`` and
+  ``${calculation::location::id}``.
+
+Regions are identified by the ``Function ID`` of the call tree DataFrame.
+"""
+import logging
+import re
+
+import calltree as ct
+import calltree_conversions as cc
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+import tarfile
+import xml.etree.ElementTree as ET
+from box import Box
+
+derived_types = ["PREDERIVED_EXCLUSIVE", "PREDERIVED_INCLUSIVE", "POSTDERIVED"]
+
+
+class CubePLError(Exception):
+    pass
+
+
+###############################################################################
+# Reading the definitions
+###############################################################################
+
+
+def derived_metric(uniq_name, cubepl, type="POSTDERIVED", cubeplinit=None):
+    """
+    Defines a derived metric.
+
+    Parameters
+    ----------
+    uniq_name : str
+        The name of the metric;
+    cubepl : str
+        The CubePL expression (or block) that computes the metric, e.g.
+        ``metric::PAPI_FP_OPS() / metric::PAPI_LST_INS()``;
+    type : str
+        One of ``PREDERIVED_EXCLUSIVE``, ``PREDERIVED_INCLUSIVE`` or
+        ``POSTDERIVED``;
+    cubeplinit : str or None
+        CubePL code executed once, before any calculation.
+
+    Returns
+    -------
+    res : Box
+        The definition of the metric.
+    """
+    assert type in derived_types, f"Unknown derived metric type: {type}"
+    return Box(
+        uniq_name=uniq_name, type=type, cubepl=cubepl, cubeplinit=cubeplinit
+    )
+
+
+def _escape_code(text):
+    """
+    Escapes the content of the ``<cubepl>`` and ``<cubeplinit>`` elements,
+    which can contain characters that are not valid in XML (e.g., ``<``).
+    """
+
+    def escape(match):
+        code = match.group(3).replace("&", "&amp;")
+        code = code.replace("<", "&lt;").replace(">", "&gt;")
+        return f"{match.group(1)}{code}{match.group(4)}"
+
+    return re.sub(
+        r"(<(cubepl|cubeplinit)\b[^>]*>)(.*?)(</\2>)", escape, text, flags=re.S
+    )
+
+
+def parse_remapping_spec(text):
+    """
+    Reads the definitions of the derived metrics in the text of a
+    ``remapping.spec`` file.
+
+    Returns
+    -------
+    res : list of Box
+        The definitions (see :py:func:`derived_metric`), in order of
+        appearance, with the additional ``disp_name``, ``dtype``, ``uom``
+        and ``descr`` fields.
+    """
+    root = ET.fromstring(f"<spec>{_escape_code(text)}</spec>")
+    res = []
+    for metric in root.iter("metric"):
+        if metric.findtext("cubepl") is None:
+            continue
+        definition = derived_metric(
+            metric.findtext("uniq_name"),
+            metric.findtext("cubepl"),
+            metric.get("type", "POSTDERIVED"),
+            metric.findtext("cubeplinit"),
+        )
+        for field in ["disp_name", "dtype", "uom", "descr"]:
+            definition[field] = metric.findtext(field)
+        res.append(definition)
+    return res
+
+
+def read_remapping_spec(profile_file):
+    """
+    Reads the definitions of the derived metrics in the ``remapping.spec``
+    file of a ``.cubex`` archive (see :py:func:`parse_remapping_spec`).
+    """
+    with tarfile.open(profile_file) as tar:
+        text = tar.extractfile("remapping.spec").read().decode()
+    return parse_remapping_spec(text)
+
+
+###############################################################################
+# Tokenizer and parser
+###############################################################################
+
+_token_re = re.compile(
+    r"""
+     (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<var>\$\{[^}]*\})
+    |(?P<metric>metric::[\w:~]+)
+    |(?P<setter>cube::metric::set::\w+)
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<string>"[^"]*")
+    |(?P<op>=~|==|!=|<=|>=|&&|\|\||[-+*/^<>=(){}\[\];,!])
+    |(?P<name>[A-Za-z_]\w*)
+    """,
+    re.X | re.S,
+)
+
+
+def tokenize(code):
+    """
+    Splits CubePL code into a list of ``(kind, value)`` tokens.
+    """
+    tokens = []
+    pos = 0
+    while pos < len(code):
+        if tokens and tokens[-1] == ("op", "=~"):
+            # a regular expression, delimited by slashes
+            match = re.compile(r"\s*/((?:[^/\\]|\\.)*)/").match(code, pos)
+            if match is None:
+                raise CubePLError(f"Regular expression expected at {pos}")
+            tokens.append(("regex", match.group(1)))
+            pos = match.end()
+            continue
+        match = _token_re.match(code, pos)
+        if match is None:
+            raise CubePLError(f"Unexpected character at {pos}: {code[pos:pos+20]}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+_comparisons = ["==", "!=", "<", ">", "<=", ">=", "eq", "seq", "=~"]
+
+
+class _Parser:
+    """
+    Recursive descent parser, producing a tree of tuples.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, value):
+        if self.peek()[1] == value and self.peek()[0] in ["op", "name"]:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise CubePLError(f"'{value}' expected, found {self.peek()[1]}")
+
+    # statements
+
+    def program(self):
+        statements = []
+        while self.peek()[0] is not None:
+            statements.append(self.statement())
+        return ("block", statements)
+
+    def block(self):
+        self.expect("{")
+        statements = []
+        while not self.accept("}"):
+            if self.peek()[0] is None:
+                raise CubePLError("'}' expected")
+            statements.append(self.statement())
+        return ("block", statements)
+
+    def statement(self):
+        kind, value = self.peek()
+        if (kind, value) == ("op", ";"):
+            self.next()
+            return ("block", [])
+        if (kind, value) == ("op", "{"):
+            res = self.block()
+        elif kind == "name" and value == "if":
+            res = self.if_statement()
+        elif kind == "name" and value == "while":
+            self.next()
+            self.expect("(")
+            condition = self.expression()
+            self.expect(")")
+            res = ("while", condition, self.block())
+        elif kind == "name" and value == "return":
+            self.next()
+            res = ("return", self.expression())
+        elif kind == "name" and value == "global":
+            self.next()
+            self.expect("(")
+            name = self.next()[1]
+            self.expect(")")
+            res = ("global", name)
+        elif kind == "setter":
+            self.next()
+            res = ("set", value.split("::")[-1], self.arguments())
+        elif kind == "var" and self._is_assignment():
+            res = self.assignment()
+        else:
+            res = ("expr", self.expression())
+        self.accept(";")
+        return res
+
+    def _is_assignment(self):
+        # ${var} = ... or ${var}[...] = ...
+        offset = 1
+        if self.peek(offset) == ("op", "["):
+            depth = 0
+            while True:
+                token = self.peek(offset)
+                if token[0] is None:
+                    return False
+                if token == ("op", "["):
+                    depth += 1
+                elif token == ("op", "]"):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                offset += 1
+            offset += 1
+        return self.peek(offset) == ("op", "=")
+
+    def assignment(self):
+        name = self.next()[1][2:-1]
+        index = None
+        if self.accept("["):
+            index = self.expression()
+            self.expect("]")
+        self.expect("=")
+        return ("assign", name, index, self.expression())
+
+    def if_statement(self):
+        self.expect("if")
+        branches = []
+        self.expect("(")
+        condition = self.expression()
+        self.expect(")")
+        branches.append((condition, self.block()))
+        otherwise = None
+        while True:
+            if self.accept("elseif") or (
+                self.peek()[1] == "else" and self.peek(1)[1] == "if"
+                and self.accept("else") and self.accept("if")
+            ):
+                self.expect("(")
+                condition = self.expression()
+                self.expect(")")
+                branches.append((condition, self.block()))
+            elif self.accept("else"):
+                otherwise = self.block()
+                break
+            else:
+                break
+        return ("if", branches, otherwise)
+
+    # expressions
+
+    def expression(self):
+        return self.disjunction()
+
+    def disjunction(self):
+        left = self.conjunction()
+        while self.peek()[1] in ["or", "xor", "||"]:
+            op = self.next()[1]
+            left = ("binop", "or" if op == "||" else op, left, self.conjunction())
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.peek()[1] in ["and", "&&"]:
+            self.next()
+            left = ("binop", "and", left, self.negation())
+        return left
+
+    def negation(self):
+        if self.peek()[1] in ["not", "!"]:
+            self.next()
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        left = self.additive()
+        while self.peek()[1] in _comparisons:
+            op = self.next()[1]
+            if op == "=~":
+                left = ("match", left, self.next()[1])
+            else:
+                left = ("binop", op, left, self.additive())
+        return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while self.peek() in [("op", "+"), ("op", "-")]:
+            op = self.next()[1]
+            left = ("binop", op, left, self.multiplicative())
+        return left
+
+    def multiplicative(self):
+        left = self.unary()
+        while self.peek() in [("op", "*"), ("op", "/")]:
+            op = self.next()[1]
+            left = ("binop", op, left, self.unary())
+        return left
+
+    def unary(self):
+        if self.peek() in [("op", "-"), ("op", "+")]:
+            op = self.next()[1]
+            operand = self.unary()
+            return ("neg", operand) if op == "-" else operand
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.accept("^"):
+            return ("binop", "^", base, self.unary())
+        return base
+
+    def arguments(self):
+        self.expect("(")
+        args = []
+        if not self.accept(")"):
+            args.append(self.expression())
+            while self.accept(","):
+                args.append(self.expression())
+            self.expect(")")
+        return args
+
+    def primary(self):
+        kind, value = self.next()
+        if kind == "number":
+            return ("const", float(value))
+        if kind == "string":
+            return ("const", value[1:-1])
+        if kind == "var":
+            node = ("var", value[2:-1])
+            if self.accept("["):
+                node = ("index", node, self.expression())
+                self.expect("]")
+            return node
+        if kind == "metric":
+            name = re.sub(r"^metric::((fixed|call)::)?", "", value)
+            self.expect("(")
+            which = None
+            if self.peek()[0] == "name" and self.peek()[1] in ["e", "i"]:
+                which = self.next()[1]
+            self.expect(")")
+            return ("metric", name, which)
+        if kind == "name" and self.peek() == ("op", "("):
+            return ("call", value, self.arguments())
+        if (kind, value) == ("op", "("):
+            res = self.expression()
+            self.expect(")")
+            return res
+        raise CubePLError(f"Unexpected token: {value}")
+
+
+def parse(code):
+    """
+    Parses CubePL code into a syntax tree (nested tuples).
+    """
+    return _Parser(tokenize(code)).program()
+
+
+###############################################################################
+# Evaluation
+###############################################################################
+
+
+def _regex_match(value, pattern):
+    regex = re.compile(pattern)
+    if isinstance(value, np.ndarray):
+        return np.vectorize(lambda v: regex.search(str(v)) is not None, otypes=[bool])(
+            value
+        )
+    return regex.search(str(value)) is not None
+
+
+def _string_map(fun):
+    def apply(value):
+        if isinstance(value, np.ndarray):
+            return np.vectorize(fun, otypes=[object])(value)
+        return fun(value)
+
+    return apply
+
+
+_functions = {
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "exp": np.exp,
+    "ln": np.log,
+    "log": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "sgn": np.sign,
+    "pos": lambda x: np.maximum(x, 0),
+    "neg": lambda x: np.minimum(x, 0),
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "min": np.minimum,
+    "max": np.maximum,
+    "lowercase": _string_map(lambda s: str(s).lower()),
+    "uppercase": _string_map(lambda s: str(s).upper()),
+}
+
+_binops = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "^": np.power,
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    ">": np.greater,
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+    "eq": np.equal,
+    "seq": np.equal,
+    "and": np.logical_and,
+    "or": np.logical_or,
+    "xor": np.logical_xor,
+}
+
+
+def _divide(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.divide(a, b)
+
+
+class _Stop(Exception):
+    """
+    Raised by an unconditional ``return`` to stop the execution.
+    """
+
+
+class _Execution:
+    """
+    The state of the execution of a piece of CubePL code.
+    """
+
+    def __init__(self, interpreter, kind):
+        self.interpreter = interpreter
+        self.kind = kind  # "e", "i" or None (initialisation)
+        self.locals = {}
+        self.result = None
+        self.done = False
+        self.last = None
+
+    # variables
+
+    def scope(self, name):
+        if name in self.interpreter.globals:
+            return self.interpreter.globals
+        return self.locals
+
+    def read(self, name):
+        builtins = self.interpreter.builtins(self.kind)
+        if name in builtins:
+            return builtins[name]
+        return self.scope(name).get(name, 0.0)
+
+    def write(self, name, index, value, mask):
+        scope = self.scope(name)
+        if index is None:
+            if mask is not None:
+                value = np.where(mask, value, scope.get(name, 0.0))
+            scope[name] = value
+            return
+        if mask is not None or np.ndim(index) != 0:
+            raise CubePLError("Assignments to array elements must not depend on cnodes")
+        array = scope.get(name)
+        if not isinstance(array, dict):
+            array = scope[name] = {}
+        array[int(index)] = value
+
+    # statements
+
+    def run(self, node, mask=None):
+        kind = node[0]
+        if kind == "block":
+            for statement in node[1]:
+                self.run(statement, mask)
+        elif kind == "assign":
+            _, name, index, expr = node
+            index = self.eval(index) if index is not None else None
+            self.write(name, index, self.eval(expr), mask)
+        elif kind == "if":
+            self.run_if(node, mask)
+        elif kind == "while":
+            while True:
+                condition = self.eval(node[1])
+                if np.ndim(condition) != 0:
+                    raise CubePLError("While conditions must not depend on cnodes")
+                if not condition:
+                    break
+                self.run(node[2], mask)
+        elif kind == "return":
+            self.set_result(self.eval(node[1]), mask)
+        elif kind == "global":
+            self.interpreter.globals.setdefault(node[1], {})
+        elif kind == "set":
+            key, value = [self.eval(arg) for arg in node[2]]
+            self.interpreter.metric_attributes.setdefault(node[1], {})[key] = value
+        elif kind == "expr":
+            self.last = self.eval(node[1])
+
+    def run_if(self, node, mask):
+        _, branches, otherwise = node
+        remaining = mask
+        for condition, block in branches:
+            condition = self.eval(condition)
+            if np.ndim(condition) == 0:
+                if condition:
+                    self.run(block, remaining)
+                    return
+                continue
+            condition = np.asarray(condition, dtype=bool)
+            selected = condition if remaining is None else remaining & condition
+            if selected.any():
+                self.run(block, selected)
+            remaining = ~condition if remaining is None else remaining & ~condition
+        if otherwise is not None and (remaining is None or np.any(remaining)):
+            self.run(otherwise, remaining)
+
+    def set_result(self, value, mask):
+        if mask is None:
+            active = ~self.done if np.ndim(self.done) else not self.done
+            self.result = np.where(active, value, self.result) if self.result is not None else value
+            raise _Stop()
+        active = mask & ~np.asarray(self.done, dtype=bool)
+        previous = self.result if self.result is not None else 0.0
+        self.result = np.where(active, value, previous)
+        self.done = np.asarray(self.done, dtype=bool) | active
+
+    # expressions
+
+    def eval(self, node):
+        kind = node[0]
+        if kind == "const":
+            return node[1]
+        if kind == "var":
+            return self.read(node[1])
+        if kind == "index":
+            return self.index(self.eval(node[1]), self.eval(node[2]))
+        if kind == "metric":
+            _, name, which = node
+            which = which if which is not None else (self.kind or "e")
+            return self.interpreter.metric(name, which)
+        if kind == "binop":
+            _, op, left, right = node
+            left, right = self.eval(left), self.eval(right)
+            if op == "/":
+                return _divide(left, right)
+            if op in ["eq", "seq"] and np.ndim(left) == 0 and np.ndim(right) == 0:
+                return str(left) == str(right)
+            return _binops[op](left, right)
+        if kind == "neg":
+            return np.negative(self.eval(node[1]))
+        if kind == "not":
+            return np.logical_not(self.eval(node[1]))
+        if kind == "match":
+            return _regex_match(self.eval(node[1]), node[2])
+        if kind == "call":
+            _, name, args = node
+            if name not in _functions:
+                raise CubePLError(f"Unknown function: {name}")
+            return _functions[name](*[self.eval(arg) for arg in args])
+        raise CubePLError(f"Unknown node: {kind}")
+
+    @staticmethod
+    def index(array, index):
+        if isinstance(array, dict):
+            if np.ndim(index) == 0:
+                return array.get(int(index), 0.0)
+            values = np.array(
+                [array.get(i, 0.0) for i in np.asarray(index, dtype=int).ravel()]
+            )
+            return values.reshape(np.shape(index))
+        if np.ndim(array) == 0:
+            return 0.0
+        return np.asarray(array)[np.asarray(index, dtype=int)]
+
+
+class Interpreter:
+    """
+    Evaluates derived metrics on the data of the output of ``process_cubex``
+    or ``process_multi``.
+
+    For the output of ``process_multi``, the "common" metrics are averaged
+    over the runs, while the "non-common" metrics are taken from the run they
+    come from (so that, e.g., a derived metric can combine PAPI counters
+    measured in different runs).
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` or ``process_multi``;
+    derived_metrics : list of Box
+        The definitions of the derived metrics (see :py:func:`derived_metric`
+        and :py:func:`read_remapping_spec`). The ``cubeplinit`` code of all
+        of them is executed, in order, when the interpreter is created;
+    missing_metrics : str
+        What to do when an expression refers to a metric that is neither in
+        the data nor among the derived metrics: ``raise`` (default) or
+        ``zero`` (use zeros, as for metrics that were not measured).
+    """
+
+    def __init__(self, output, derived_metrics=(), missing_metrics="raise"):
+        assert missing_metrics in ["raise", "zero"]
+        self.missing_metrics = missing_metrics
+        self.tree_df = output.ctree_df
+        self.exclusive_data = output.get("exclusive", True)
+        self.data, self.threads = _get_metric_arrays(output)
+        self.shape = (len(self.tree_df), len(self.threads))
+        self.ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else {}
+
+        self.derived = {d.uniq_name: d for d in derived_metrics}
+        self.syntax_trees = {}
+        self.cache = {}
+        self.evaluating = set()
+        self.globals = {}
+        self.metric_attributes = {}
+        self._builtins = _get_builtins(output, self.threads)
+
+        for definition in derived_metrics:
+            if definition.get("cubeplinit"):
+                execution = _Execution(self, None)
+                try:
+                    execution.run(parse(definition.cubeplinit))
+                except _Stop:
+                    pass
+
+    def builtins(self, kind):
+        return self._builtins[kind is not None]
+
+    def syntax_tree(self, name):
+        if name not in self.syntax_trees:
+            self.syntax_trees[name] = parse(self.derived[name].cubepl)
+        return self.syntax_trees[name]
+
+    def evaluate_expression(self, name, kind):
+        execution = _Execution(self, kind)
+        try:
+            execution.run(self.syntax_tree(name))
+        except _Stop:
+            pass
+        res = execution.result if execution.result is not None else execution.last
+        if res is None:
+            raise CubePLError(f"No value computed for {name}")
+        return np.broadcast_to(np.asarray(res, dtype=float), self.shape).copy()
+
+    def is_void(self, name):
+        return self.metric_attributes.get(name, {}).get("value") == "VOID"
+
+    def metric(self, name, kind):
+        """
+        The exclusive (``kind="e"``) or inclusive (``kind="i"``) values of a
+        metric, as an array of shape ``(n_cnodes, n_threads)`` whose rows are
+        aligned with the call tree DataFrame.
+        """
+        key = (name, kind)
+        if key in self.cache:
+            return self.cache[key]
+        if key in self.evaluating:
+            raise CubePLError(f"Circular definition of {name}")
+        self.evaluating.add(key)
+        try:
+            res = self._metric(name, kind)
+        finally:
+            self.evaluating.discard(key)
+        self.cache[key] = res
+        return res
+
+    def _metric(self, name, kind):
+        if name in self.derived:
+            metric_type = self.derived[name].type
+            if metric_type == "POSTDERIVED":
+                return self.evaluate_expression(name, kind)
+            if metric_type == "PREDERIVED_EXCLUSIVE":
+                if kind == "e":
+                    return self.evaluate_expression(name, "e")
+                return cc.convert_array_to_inclusive(self.metric(name, "e"), self.tree_df)
+            if kind == "i":
+                return self.evaluate_expression(name, "i")
+            return cc.convert_array_to_exclusive(self.metric(name, "i"), self.tree_df)
+
+        if name not in self.data:
+            if self.missing_metrics == "zero":
+                logging.warning(f"Metric {name} not available, using zeros.")
+                return np.zeros(self.shape)
+            raise CubePLError(f"Unknown metric: {name}")
+
+        values = self.data[name]
+        if (kind == "e") == self.exclusive_data:
+            return values
+        ufunc = self.ufuncs.get(name, np.add)
+        if kind == "i":
+            return cc.convert_array_to_inclusive(values, self.tree_df, ufunc)
+        if ufunc is not np.add:
+            raise CubePLError(f"Exclusive values of {name} cannot be computed")
+        return cc.convert_array_to_exclusive(values, self.tree_df)
+
+
+def _get_metric_arrays(output):
+    """
+    Dense ``(n_cnodes, n_threads)`` arrays for each metric in the output of
+    ``process_cubex`` or ``process_multi``, and the labels of their columns
+    (the ``others`` of :py:func:`index_conversions.to_cnode_array`, e.g.
+    the ``Thread ID`` of each column, for a subset of the threads).
+    """
+    tree_df = output.ctree_df
+    if "df" in output:
+        frames = [output.df]
+    else:
+        common = output.common.T.groupby(level="metric").mean().T
+        frames = [common.rename_axis("metric", axis="columns"), output.noncommon]
+
+    res = {}
+    for frame in frames:
+        if frame.shape[1] == 0:
+            continue
+        cnode_array = ic.to_cnode_array(frame, tree_df)
+        for i, metric in enumerate(cnode_array.columns):
+            res[metric] = cnode_array.array[:, i, :]
+    others = cnode_array.others.set_names(
+        [name for name in frame.index.names if name != "Cnode ID"]
+    )
+    return res, others
+
+
+def _get_builtins(output, threads):
+    """
+    Values of the predefined variables, for the initialisation (``False``)
+    and for the calculations (``True``).
+
+    ``calculation::location::id`` is the ``Thread ID`` of each column of the
+    data (``threads``, see :py:func:`_get_metric_arrays`).
+
+    The arrays on callpaths are indexed by ``Cnode ID``: if some IDs are
+    missing (e.g., in a call tree truncated with ``maxlevel``, see
+    :py:func:`merger.process_cubex`), their ``calleeid`` and parent ID are
+    ``-1``, and ``cube::#callpaths`` is the largest ID plus one.
+    """
+    tree_df = output.ctree_df
+    cnode_ids = tree_df["Cnode ID"].to_numpy()
+    n_callpaths = cnode_ids.max() + 1
+
+    nodes = {node.cnode_id: node for node in ct.iterate_on_call_tree(output.ctree)}
+    function_ids = tree_df["Function ID"].to_numpy()
+    n_regions = function_ids.max() + 1
+
+    calleeid = np.full(n_callpaths, -1)
+    calleeid[cnode_ids] = function_ids
+    parent_ids = np.full(n_callpaths, -1)
+    parent_ids[cnode_ids] = tree_df["Parent Cnode ID"].fillna(-1).to_numpy(dtype=int)
+
+    def region_attribute(attribute):
+        res = np.full(n_regions, "", dtype=object)
+        for cnode_id, function_id in zip(cnode_ids, function_ids):
+            res[function_id] = nodes[cnode_id].get(attribute, "")
+        return res
+
+    init = {
+        "cube::#callpaths": n_callpaths,
+        "cube::#regions": n_regions,
+        "cube::#locations": len(threads),
+        "cube::callpath::calleeid": calleeid,
+        "cube::callpath::parent::id": parent_ids,
+        "cube::region::name": region_attribute("fname"),
+        "cube::region::paradigm": region_attribute("paradigm"),
+        "cube::region::role": region_attribute("role"),
+        "cube::region::mod": region_attribute("mode"),
+    }
+    calculation = dict(
+        init,
+        **{
+            "calculation::callpath::id": cnode_ids[:, None],
+            "calculation::region::id": function_ids[:, None],
+            "calculation::location::id": threads.get_level_values(
+                "Thread ID"
+            ).to_numpy()[None, :],
+        },
+    )
+    return {False: init, True: calculation}
+
+
+def compute_derived_metrics(
+    output, derived_metrics, names=None, exclusive=None, missing_metrics="raise"
+):
+    """
+    Computes derived metrics for the output of ``process_cubex`` or
+    ``process_multi``.
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` or ``process_multi``;
+    derived_metrics : list of Box
+        The definitions of the derived metrics (see :py:func:`derived_metric`
+        and :py:func:`read_remapping_spec`);
+    names : list of str or None
+        The metrics to compute. If ``None``, all the metrics in
+        ``derived_metrics``, except the ones disabled in the initialisation
+        code (with ``cube::metric::set::<metric>("value", "VOID")``);
+    exclusive : bool or None
+        Whether to compute the exclusive (True) or the inclusive (False)
+        values. If ``None``, the same kind of values as in ``output``;
+    missing_metrics : str
+        See :py:class:`Interpreter`.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with one column per derived metric, indexed by
+        ``Cnode ID`` and ``Thread ID``.
+    """
+    if exclusive is None:
+        exclusive = output.get("exclusive", True)
+    interpreter = Interpreter(output, derived_metrics, missing_metrics)
+    if names is None:
+        names = [d.uniq_name for d in derived_metrics if not interpreter.is_void(d.uniq_name)]
+
+    kind = "e" if exclusive else "i"
+    array = np.stack([interpreter.metric(name, kind) for name in names], axis=1)
+
+    cnode_ids = output.ctree_df["Cnode ID"].to_numpy()
+    threads = interpreter.threads
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(cnode_ids, len(threads))]
+        + [
+            np.tile(threads.get_level_values(i), len(cnode_ids))
+            for i in range(threads.nlevels)
+        ],
+        names=["Cnode ID"] + list(threads.names),
+    )
+    return pd.DataFrame(
+        data=array.transpose(0, 2, 1).reshape(len(index), len(names)),
+        index=index,
+        columns=pd.Index(names, name="metric"),
+    ).sort_index()
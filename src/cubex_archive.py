@@ -0,0 +1,561 @@
+"""
+Utilities to read the information stored in ``.cubex`` files directly,
+without ``cube_dump``.
+
+A ``.cubex`` file is a tar archive containing ``anchor.xml``, with the
+description of the metrics, of the call tree and of the system tree, and,
+for each metric, the files ``<metric id>.index`` and ``<metric id>.data``
+with the values.
+
+Reading ``anchor.xml`` only requires to go through the headers of the tar
+members, so that the metadata of a file can be obtained in milliseconds
+(see :py:func:`scan_cubex` and :py:func:`scan_directory`).
+"""
+import glob
+import logging
+import mmap
+import os
+import re
+import tarfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from box import Box
+
+
+def read_anchor(profile_file):
+    """
+    Reads and parses the ``anchor.xml`` file in a ``.cubex`` archive.
+
+    Parameters
+    ----------
+    profile_file : str
+        Name of the ``.cubex`` file.
+
+    Returns
+    -------
+    anchor : xml.etree.ElementTree.Element
+        The root (``cube``) element.
+    """
+    with tarfile.open(profile_file) as tar:
+        return ET.parse(tar.extractfile("anchor.xml")).getroot()
+
+
+def get_metric_table(anchor):
+    """
+    Reads the description of all the metrics (including the ones nested into
+    other metrics) out of ``anchor.xml``.
+
+    Parameters
+    ----------
+    anchor : xml.etree.ElementTree.Element
+        The root element of ``anchor.xml`` (see :py:func:`read_anchor`).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed by ``uniq_name``, with the ``id``, ``disp_name``,
+        ``dtype``, ``uom``, ``url``, ``descr`` and ``type`` (``EXCLUSIVE``,
+        ``INCLUSIVE``, ``PREDERIVED_EXCLUSIVE``...) columns.
+    """
+    fields = ["disp_name", "dtype", "uom", "url", "descr"]
+    rows = [
+        dict(
+            uniq_name=metric.findtext("uniq_name"),
+            id=int(metric.get("id")),
+            type=metric.get("type"),
+            **{field: metric.findtext(field, default="") for field in fields},
+        )
+        for metric in anchor.find("metrics").iter("metric")
+    ]
+    return pd.DataFrame(
+        rows, columns=["uniq_name", "id"] + fields + ["type"]
+    ).set_index("uniq_name")
+
+
+def get_scorep_version(attributes):
+    """
+    Gets the Score-P version out of the ``Creator`` attribute (e.g.,
+    ``Score-P 5.0``), or ``None`` if the file was not created by Score-P.
+    """
+    match = re.match(r"Score-P\s+(\S+)", attributes.get("Creator", ""))
+    return match.group(1) if match is not None else None
+
+
+def scan_cubex(profile_file):
+    """
+    Reads the metadata of a ``.cubex`` file, out of ``anchor.xml`` only
+    (the data of the metrics is not read).
+
+    Parameters
+    ----------
+    profile_file : str
+        Name of the ``.cubex`` file.
+
+    Returns
+    -------
+    res : Box
+        With the following fields:
+
+        - ``file``, ``file_size`` (in bytes) and ``mtime`` (the modification
+          time, as a timestamp);
+        - ``cube_version`` and ``scorep_version`` (``None`` if the file was
+          not created by Score-P);
+        - ``attributes``: the dictionary of the global attributes (e.g.,
+          ``Creator``, ``CUBE_CT_AGGR``);
+        - ``metrics``: the list of the (unique) names of all the metrics;
+        - ``n_cnodes``, ``n_regions``: the size of the call tree and the
+          number of distinct regions;
+        - ``n_system_nodes``, ``n_location_groups`` (e.g., processes) and
+          ``n_locations`` (e.g., threads): the size of the system tree.
+    """
+    anchor = read_anchor(profile_file)
+    attributes = {attr.get("key"): attr.get("value") for attr in anchor.findall("attr")}
+    stat = os.stat(profile_file)
+    program = anchor.find("program")
+    system = anchor.find("system")
+    return Box(
+        file=profile_file,
+        file_size=stat.st_size,
+        mtime=stat.st_mtime,
+        cube_version=anchor.get("version"),
+        scorep_version=get_scorep_version(attributes),
+        attributes=attributes,
+        metrics=[
+            metric.findtext("uniq_name")
+            for metric in anchor.find("metrics").iter("metric")
+        ],
+        n_cnodes=sum(1 for _ in program.iter("cnode")),
+        n_regions=len(program.findall("region")),
+        n_system_nodes=sum(1 for _ in system.iter("systemtreenode")),
+        n_location_groups=sum(1 for _ in system.iter("locationgroup")),
+        n_locations=sum(1 for _ in system.iter("location")),
+    )
+
+
+def _scan_or_none(profile_file):
+    try:
+        return scan_cubex(profile_file)
+    except (OSError, tarfile.TarError, ET.ParseError, KeyError) as e:
+        logging.warning(f"Cannot scan {profile_file}: {e}")
+        return None
+
+
+def scan_directory(directory, pattern="**/*.cubex", max_workers=None):
+    """
+    Reads the metadata of all the ``.cubex`` files in a directory (see
+    :py:func:`scan_cubex`), in parallel.
+
+    Files that cannot be read are skipped, with a warning.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to scan;
+    pattern : str
+        Glob pattern for the files, relative to ``directory`` (by default,
+        all the ``.cubex`` files, also in subdirectories);
+    max_workers : int or None
+        The number of processes to use. If ``1``, the files are read
+        serially; if ``None``, the number of CPUs.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed by ``file``, with one column per field in the
+        output of :py:func:`scan_cubex`.
+    """
+    files = sorted(glob.glob(os.path.join(directory, pattern), recursive=True))
+    if max_workers == 1 or len(files) <= 1:
+        results = [_scan_or_none(f) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers) as executor:
+            results = list(executor.map(_scan_or_none, files, chunksize=16))
+
+    rows = [result.to_dict() for result in results if result is not None]
+    return pd.DataFrame(rows, columns=_scan_fields).set_index("file")
+
+
+_scan_fields = [
+    "file",
+    "file_size",
+    "mtime",
+    "cube_version",
+    "scorep_version",
+    "attributes",
+    "metrics",
+    "n_cnodes",
+    "n_regions",
+    "n_system_nodes",
+    "n_location_groups",
+    "n_locations",
+]
+
+
+###############################################################################
+# Random access to the metric data
+###############################################################################
+
+INDEX_HEADER = b"CUBEX.INDEX"
+DATA_HEADER = b"CUBEX.DATA"
+COMPRESSED_DATA_HEADER = b"ZCUBEX.DATA"
+
+value_dtypes = {
+    "DOUBLE": "<f8",
+    "MINDOUBLE": "<f8",
+    "MAXDOUBLE": "<f8",
+    "UINT64": "<u8",
+    "INT64": "<i8",
+}
+
+
+def get_cnode_orders(anchor):
+    """
+    Gets the orders in which the rows of the metric data are stored.
+
+    The rows of the ``EXCLUSIVE`` metrics follow the depth-first (pre-order)
+    visit of the call tree in ``anchor.xml``, while in the ``INCLUSIVE``
+    metrics the children of each cnode are stored in a contiguous block (the
+    roots first, then the children of the first root, then the children of
+    its first child, and so on).
+
+    Returns
+    -------
+    res : Box
+        ``preorder`` and ``children_block``: arrays with the cnode ID for
+        each row, and ``parents``: the parent cnode ID (``-1`` for the roots)
+        indexed by cnode ID.
+    """
+    roots = anchor.find("program").findall("cnode")
+    preorder = []
+    children_block = [int(root.get("id")) for root in roots]
+    parent_pairs = []
+
+    # iterative, since call trees can be deeper than the recursion limit
+    stack = [(root, -1) for root in reversed(roots)]
+    while stack:
+        cnode, parent = stack.pop()
+        cnode_id = int(cnode.get("id"))
+        preorder.append(cnode_id)
+        parent_pairs.append((cnode_id, parent))
+        stack.extend((child, cnode_id) for child in reversed(cnode.findall("cnode")))
+
+    stack = list(reversed(roots))
+    while stack:
+        cnode = stack.pop()
+        children = cnode.findall("cnode")
+        children_block.extend(int(child.get("id")) for child in children)
+        stack.extend(reversed(children))
+
+    parents = np.full(len(preorder), -1)
+    for cnode_id, parent in parent_pairs:
+        parents[cnode_id] = parent
+    return Box(
+        preorder=np.array(preorder),
+        children_block=np.array(children_block),
+        parents=parents,
+    )
+
+
+def read_index(buffer):
+    """
+    Parses the content of a ``<metric id>.index`` file.
+
+    The file contains the ``CUBEX.INDEX`` header, an endianness marker
+    (``uint32``), a version (``uint16``), the index type (``uint8``, ``1``
+    for sparse, ``0`` for dense) and, for sparse indices, the number of rows
+    and the row number of each stored row (``uint32``).
+
+    Returns
+    -------
+    rows : numpy.ndarray or None
+        The row numbers stored in the data file, in order, or ``None`` for
+        a dense index (all the rows are stored).
+    """
+    if not bytes(buffer[: len(INDEX_HEADER)]) == INDEX_HEADER:
+        raise ValueError("Not a CUBEX.INDEX file")
+    offset = len(INDEX_HEADER)
+    endianness = np.frombuffer(buffer, "<u4", 1, offset)[0]
+    byteorder = "<" if endianness == 1 else ">"
+    offset += 4 + 2
+    index_type = buffer[offset]
+    offset += 1
+    if index_type == 0:
+        return None
+    n_rows = np.frombuffer(buffer, f"{byteorder}u4", 1, offset)[0]
+    return np.frombuffer(buffer, f"{byteorder}u4", n_rows, offset + 4).astype(np.int64)
+
+
+class CubexReader:
+    """
+    Random-access reader of the metric values in a ``.cubex`` file.
+
+    For each metric, the ``<metric id>.index`` member is read once, to build
+    the table of the rows (cnodes) stored in ``<metric id>.data``. The values
+    of a cnode are then read directly from the data member, with a single
+    read of ``n_locations`` values. For uncompressed archives the file is
+    memory-mapped, so that no data is copied beyond the requested values.
+
+    To read many metrics at once, use :py:meth:`read_metrics`, which reads
+    them in parallel.
+
+    The metric data compressed by CubeW (data members starting with
+    ``ZCUBEX.DATA``) is not supported: :py:meth:`layout` raises
+    ``NotImplementedError`` for it.
+
+    The values are the ones stored in the file, i.e. exclusive values for
+    the metrics whose type (in :py:attr:`metrics`) is ``EXCLUSIVE`` and
+    inclusive values for the ``INCLUSIVE`` ones. Metrics without data are
+    all zeros.
+
+    .. code-block:: python3
+
+        with CubexReader("profile.cubex") as reader:
+            time = reader.get_values("time", [0, 12], threads=[0, 1])
+
+    .. py:attribute:: metrics
+
+       The metric table (see :py:func:`get_metric_table`).
+
+    .. py:attribute:: n_cnodes
+
+       The number of cnodes.
+
+    .. py:attribute:: n_locations
+
+       The number of locations (threads).
+
+    Parameters
+    ----------
+    profile_file : str
+        Name of the ``.cubex`` file.
+    """
+
+    def __init__(self, profile_file):
+        self.profile_file = profile_file
+        self._file = open(profile_file, "rb")
+        self._tar = tarfile.open(fileobj=self._file)
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            self._mmap = None
+        if self._tar.fileobj is not self._file:  # compressed archive
+            self._mmap = None
+        self._members = {member.name: member for member in self._tar.getmembers()}
+
+        self.anchor = ET.parse(self._tar.extractfile("anchor.xml")).getroot()
+        self.metrics = get_metric_table(self.anchor)
+        self._orders = get_cnode_orders(self.anchor)
+        self.n_cnodes = len(self._orders.preorder)
+        self.n_locations = sum(
+            1 for _ in self.anchor.find("system").iter("location")
+        )
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._tar.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def layout(self, metric):
+        """
+        The layout of the data of a metric.
+
+        Returns
+        -------
+        res : Box
+            ``rows``: for each cnode ID, the position of its row in the data
+            member (``-1`` if there is no data); ``n_rows``: the number of
+            rows stored; ``member``: the data member (``None`` if there is no
+            data) and ``dtype``: the ``numpy`` data type of the values.
+
+        Raises
+        ------
+        NotImplementedError
+            If the data type of the metric is not supported, or if its data
+            is compressed;
+        ValueError
+            If the data member does not start with the ``CUBEX.DATA`` header.
+        """
+        with self._lock:
+            if metric in self._layouts:
+                return self._layouts[metric]
+        metric_id, dtype, metric_type = self.metrics.loc[metric, ["id", "dtype", "type"]]
+        if dtype not in value_dtypes:
+            raise NotImplementedError(f"Data type {dtype} not supported")
+
+        rows = np.full(self.n_cnodes, -1)
+        n_rows = 0
+        data_member = self._members.get(f"{metric_id}.data")
+        index_member = self._members.get(f"{metric_id}.index")
+        if data_member is not None and index_member is not None:
+            stored_rows = read_index(self._read(index_member, 0, index_member.size))
+            order = (
+                self._orders.children_block
+                if metric_type == "INCLUSIVE"
+                else self._orders.preorder
+            )
+            if stored_rows is None:
+                stored_rows = np.arange(self.n_cnodes)
+            n_rows = len(stored_rows)
+            rows[order[stored_rows]] = np.arange(n_rows)
+            header = self._read(data_member, 0, len(COMPRESSED_DATA_HEADER))
+            if header == COMPRESSED_DATA_HEADER:
+                raise NotImplementedError(
+                    f"Metric {metric}: compressed data not supported"
+                )
+            if not header.startswith(DATA_HEADER):
+                raise ValueError(f"Metric {metric}: not a CUBEX.DATA member")
+        else:
+            data_member = None
+
+        res = Box(
+            rows=rows,
+            n_rows=n_rows,
+            member=data_member,
+            dtype=np.dtype(value_dtypes[dtype]),
+        )
+        with self._lock:
+            # another thread may have computed it in the meantime
+            return self._layouts.setdefault(metric, res)
+
+    def _read(self, member, offset, size):
+        # the tar file (and its position) is shared by all the threads
+        if self._mmap is not None:
+            start = member.offset_data + offset
+            return self._mmap[start : start + size]
+        with self._lock:
+            data = self._tar.extractfile(member)
+            data.seek(offset)
+            return data.read(size)
+
+    def stored_values(self, metric):
+        """
+        All the rows stored for a metric, in the order of the data member
+        (see :py:meth:`layout`).
+
+        Returns
+        -------
+        res : numpy.ndarray
+            An array of shape ``(n_rows, n_locations)``.
+        """
+        layout = self.layout(metric)
+        if layout.member is None:
+            return np.zeros((0, self.n_locations), dtype=layout.dtype)
+        buffer = self._read(layout.member, 0, layout.member.size)
+        stored = np.frombuffer(
+            buffer, layout.dtype, layout.n_rows * self.n_locations, len(DATA_HEADER)
+        )
+        return stored.reshape(layout.n_rows, self.n_locations)
+
+    def get_values(self, metric, cnode_ids, threads=None):
+        """
+        Reads the values of a metric for some cnodes.
+
+        Parameters
+        ----------
+        metric : str
+            The (unique) name of the metric;
+        cnode_ids : list of int
+            The cnodes;
+        threads : list of int or None
+            The threads (locations). If ``None``, all of them.
+
+        Returns
+        -------
+        res : numpy.ndarray
+            An array of shape ``(len(cnode_ids), n_threads)``.
+        """
+        layout = self.layout(metric)
+        cnode_ids = np.atleast_1d(cnode_ids)
+        threads = np.arange(self.n_locations) if threads is None else np.asarray(threads)
+        res = np.zeros((len(cnode_ids), len(threads)), dtype=layout.dtype)
+        if layout.member is None:
+            return res
+
+        row_size = self.n_locations * layout.dtype.itemsize
+        for i, row in enumerate(layout.rows[cnode_ids]):
+            if row < 0:
+                continue
+            buffer = self._read(layout.member, len(DATA_HEADER) + row * row_size, row_size)
+            res[i] = np.frombuffer(buffer, layout.dtype)[threads]
+        return res
+
+    def get_metric(self, metric):
+        """
+        Reads all the values of a metric.
+
+        Returns
+        -------
+        res : numpy.ndarray
+            An array of shape ``(n_cnodes, n_locations)``, indexed by cnode
+            ID.
+        """
+        layout = self.layout(metric)
+        res = np.zeros((self.n_cnodes, self.n_locations), dtype=layout.dtype)
+        present = layout.rows >= 0
+        res[present] = self.stored_values(metric)[layout.rows[present]]
+        return res
+
+    def read_metrics(self, metrics=None, max_workers=None):
+        """
+        Reads all the values of several metrics in parallel, with a pool of
+        threads. The rows of each metric are copied from the data member
+        (memory-mapped, for uncompressed archives) directly into their place
+        in the preallocated result.
+
+        Parameters
+        ----------
+        metrics : list of str or None
+            The metrics to read. If ``None``, all the metrics with a
+            supported data type;
+        max_workers : int or None
+            The number of threads (see
+            ``concurrent.futures.ThreadPoolExecutor``). If ``1``, the metrics
+            are read serially.
+
+        Returns
+        -------
+        res : Box
+            With the same layout as the output of
+            :py:func:`index_conversions.to_cnode_array`: ``array``, of shape
+            ``(n_cnodes, n_metrics, n_locations)``, ``cnode_ids`` (the
+            cnode ID of each row), ``columns`` (the metrics) and ``others``
+            (the locations).
+        """
+        if metrics is None:
+            metrics = list(self.metrics.index[self.metrics["dtype"].isin(value_dtypes)])
+        array = np.zeros((self.n_cnodes, len(metrics), self.n_locations))
+
+        def fill(position_metric):
+            position, metric = position_metric
+            layout = self.layout(metric)
+            present = layout.rows >= 0
+            array[present, position, :] = self.stored_values(metric)[
+                layout.rows[present]
+            ]
+
+        if max_workers == 1:
+            for item in enumerate(metrics):
+                fill(item)
+        else:
+            with ThreadPoolExecutor(max_workers) as executor:
+                list(executor.map(fill, enumerate(metrics)))
+
+        return Box(
+            array=array,
+            cnode_ids=np.arange(self.n_cnodes),
+            columns=pd.Index(metrics, name="metric"),
+            others=pd.RangeIndex(self.n_locations, name="Thread ID"),
+        )
@@ -0,0 +1,384 @@
+"""
+A dashboard to explore the inclusive values of a metric and their imbalance
+between threads over the call tree, as sunburst or treemap plots, for any
+number of ``.cubex`` files.
+
+The work is split so that the interactions are cheap:
+
+- each file is analysed once, in the background (see
+  :py:meth:`AnalysisStore.load`): the call tree, the imbalance statistics for
+  all the metrics (see :py:func:`imbalance.get_imbalance`) and the pruning
+  indices (see :py:func:`pruning.get_pruning_index`) are kept in memory;
+- the figures are cached, keyed by file, metric, threshold bucket (see
+  :py:func:`threshold_bucket`) and visualisation type, in a
+  least-recently-used cache of bounded size shared by all the users of the
+  server (see :py:class:`FigureCache`).
+
+``plotly`` and ``dash`` are only needed to build the figures and the app:
+
+.. code-block:: python3
+
+    app = dashboard.create_app(["run1.cubex", "run2.cubex"])
+    app.run_server()
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import imbalance as ib
+import index_conversions as ic
+import merger as mg
+import numpy as np
+import pruning as pr
+from box import Box
+
+vis_types = ["treemap", "sunburst"]
+
+# statistic used to colour the plots
+color_statistic = "(max-min)/mean"
+
+
+def threshold_bucket(rel_threshold, resolution=0.1):
+    """
+    Rounds a relative threshold to a bucket, on a logarithmic scale, so that
+    close thresholds (e.g., from a slider) share the same figure.
+
+    Returns
+    -------
+    res : float
+        ``log10`` of the threshold, rounded to a multiple of ``resolution``
+        (``-inf`` for a zero threshold).
+    """
+    if rel_threshold <= 0:
+        return -np.inf
+    return round(round(np.log10(rel_threshold) / resolution) * resolution, 10)
+
+
+def analyse_file(profile_file, metrics=None):
+    """
+    Precomputes everything that is needed to plot the data of a file at any
+    threshold.
+
+    Parameters
+    ----------
+    profile_file : str
+        The name of the ``.cubex`` file;
+    metrics : list of str or None
+        The metrics to prepare (all the metrics, if ``None``).
+
+    Returns
+    -------
+    res : Box
+        ``file``, ``tree_df``, ``labels`` (the short callpath of each cnode,
+        indexed by ``Cnode ID``), ``metrics``, ``mean`` and ``imbalance``
+        (DataFrames indexed by ``Cnode ID`` with a column per metric) and
+        ``pruning`` (the pruning index for each metric).
+    """
+    output = mg.process_cubex(profile_file, exclusive=False)
+    tree_df = output.ctree_df
+    if metrics is None:
+        metrics = list(output.df.columns)
+    stats = ib.get_imbalance(output, inclusive=True).loc[:, list(metrics)]
+    mean = stats.xs("mean", level="statistic", axis="columns")
+    return Box(
+        file=profile_file,
+        tree_df=tree_df,
+        labels=ic.get_short_callpath(tree_df).set_axis(tree_df["Cnode ID"]),
+        metrics=list(metrics),
+        mean=mean,
+        imbalance=stats.xs(color_statistic, level="statistic", axis="columns"),
+        pruning={
+            metric: pr.get_pruning_index(tree_df, mean[metric]) for metric in metrics
+        },
+    )
+
+
+def pruned_data(analysis, metric, rel_threshold):
+    """
+    Prunes the call tree of an analysed file (see :py:func:`analyse_file`)
+    and adds what is needed for the plots.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The output of :py:func:`pruning.prune`, with the value in the
+        ``metric`` column and the additional ``Short Callpath``,
+        ``Imbalance``, ``Node`` and ``Parent`` columns (the last two are the
+        ids of the nodes, as strings, for plotly). The "other" nodes are
+        labelled and coloured like their parent.
+    """
+    data = pr.prune(analysis.pruning[metric], rel_threshold, metric)
+    is_other = data["Pruned"] > 0
+    owner = data["Cnode ID"].where(~is_other, data["Parent Cnode ID"])
+    data["Short Callpath"] = analysis.labels.reindex(owner).to_numpy()
+    data.loc[is_other, "Short Callpath"] = "other (" + data["Short Callpath"] + ")"
+    imbalance = analysis.imbalance[metric].reindex(owner).fillna(0)
+    data["Imbalance"] = imbalance.to_numpy()
+    data["Node"] = data["Cnode ID"].astype(str)
+    data["Parent"] = (
+        data["Parent Cnode ID"].astype(str).where(data["Parent Cnode ID"].notna(), "")
+    )
+    return data
+
+
+def make_figure(data, metric, vis_type="treemap"):
+    """
+    Plots the output of :py:func:`pruned_data` as a treemap or a sunburst.
+    """
+    import plotly.express as px
+
+    assert vis_type in vis_types, f"Unknown visualisation type {vis_type}"
+    plot = px.treemap if vis_type == "treemap" else px.sunburst
+    return plot(
+        data,
+        ids=data["Node"],
+        names=data["Short Callpath"],
+        parents=data["Parent"],
+        values=data[metric],
+        color=data["Imbalance"],
+        branchvalues="total",
+    )
+
+
+class FigureCache:
+    """
+    A thread-safe least-recently-used cache of bounded size.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of entries.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, make):
+        """
+        Returns the entry for ``key``, calling ``make()`` to create it if it
+        is not in the cache. Concurrent requests for a missing key may call
+        ``make`` more than once.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = make()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class AnalysisStore:
+    """
+    Keeps the analyses of the files (see :py:func:`analyse_file`), loaded in
+    background threads, and the cache of the figures.
+
+    Parameters
+    ----------
+    max_figures : int
+        The size of the figure cache;
+    max_workers : int
+        The number of files that can be loaded at the same time;
+    resolution : float
+        The width of the threshold buckets (see :py:func:`threshold_bucket`);
+    metrics : list of str or None
+        The metrics to prepare for each file (all, if ``None``);
+    figure_function : callable
+        The function used to build the figures, with the same signature as
+        :py:func:`make_figure`.
+    """
+
+    def __init__(
+        self,
+        max_figures=256,
+        max_workers=2,
+        resolution=0.1,
+        metrics=None,
+        figure_function=make_figure,
+    ):
+        self.resolution = resolution
+        self.metrics = metrics
+        self.figure_function = figure_function
+        self.figures = FigureCache(max_figures)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def load(self, profile_file):
+        """
+        Starts analysing a file in the background, if that has not been done
+        already.
+
+        Returns
+        -------
+        res : concurrent.futures.Future
+            The future for the analysis.
+        """
+        with self._lock:
+            if profile_file not in self._futures:
+                logging.info(f"Loading {profile_file}")
+                self._futures[profile_file] = self._executor.submit(
+                    analyse_file, profile_file, self.metrics
+                )
+            return self._futures[profile_file]
+
+    def is_ready(self, profile_file):
+        """
+        Whether the analysis of a file is available (after a call to
+        :py:meth:`load`).
+        """
+        future = self._futures.get(profile_file)
+        return future is not None and future.done()
+
+    def get(self, profile_file, timeout=None):
+        """
+        Returns the analysis of a file, loading it if needed and waiting for
+        at most ``timeout`` seconds (see
+        ``concurrent.futures.Future.result``).
+        """
+        return self.load(profile_file).result(timeout)
+
+    def files(self):
+        return list(self._futures)
+
+    def data(self, profile_file, metric, rel_threshold):
+        """
+        The pruned data for a file (see :py:func:`pruned_data`), at the
+        threshold of the bucket ``rel_threshold`` falls in.
+        """
+        bucket = threshold_bucket(rel_threshold, self.resolution)
+        return pruned_data(self.get(profile_file), metric, 10 ** bucket)
+
+    def figure(self, profile_file, metric, rel_threshold, vis_type="treemap"):
+        """
+        Returns the (possibly cached) figure for a file.
+        """
+        bucket = threshold_bucket(rel_threshold, self.resolution)
+        key = (profile_file, metric, bucket, vis_type)
+        return self.figures.get(
+            key,
+            lambda: self.figure_function(
+                pruned_data(self.get(profile_file), metric, 10 ** bucket),
+                metric,
+                vis_type,
+            ),
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def create_app(files, store=None, metric="time", name=__name__):
+    """
+    Creates a ``dash`` app to explore the files, starting to load all of them
+    in the background.
+
+    Parameters
+    ----------
+    files : list of str
+        The ``.cubex`` files;
+    store : AnalysisStore or None
+        The store to use (a new one, if ``None``). It can be shared between
+        apps;
+    metric : str
+        The metric shown at the beginning.
+
+    Returns
+    -------
+    app : dash.Dash
+        The app (call ``app.run_server()`` to start it).
+    """
+    import dash
+    from dash import dcc, html
+    from dash.dependencies import Input, Output
+
+    store = store if store is not None else AnalysisStore()
+    for profile_file in files:
+        store.load(profile_file)
+
+    app = dash.Dash(name)
+    style_centered = {"text-align": "center"}
+    controls = [
+        html.H5(children="File", style=style_centered),
+        dcc.Dropdown(
+            id="file-choice",
+            options=[{"label": f, "value": f} for f in files],
+            value=files[0],
+        ),
+        html.H5(children="Metric", style=style_centered),
+        dcc.Dropdown(id="metric-choice", value=metric),
+        html.H5(children="Threshold", style=style_centered),
+        dcc.Slider(id="log-threshold", min=-4, step=store.resolution, max=-0.5, value=-2),
+        html.H5(id="threshold-value", style=style_centered),
+        html.H5(children="Visualisation type", style=style_centered),
+        dcc.Dropdown(
+            id="vis-choice",
+            options=[{"label": v.capitalize(), "value": v} for v in vis_types],
+            value="treemap",
+        ),
+        # polls while the selected file is being loaded
+        dcc.Interval(id="loading-poll", interval=500, disabled=False),
+    ]
+    app.layout = html.Div(
+        children=[
+            html.Div(style={"width": "15%", "float": "left"}, children=controls),
+            html.Div(
+                style={"width": "85%", "float": "right", "height": "50em"},
+                children=[dcc.Graph(id="hierarchy-datavis", style={"height": "100%"})],
+            ),
+        ]
+    )
+
+    @app.callback(
+        Output("metric-choice", "options"),
+        [Input("file-choice", "value"), Input("loading-poll", "n_intervals")],
+    )
+    def update_metrics(profile_file, _):
+        if not store.is_ready(profile_file):
+            return []
+        return [{"label": m, "value": m} for m in store.get(profile_file).metrics]
+
+    @app.callback(
+        [Output("hierarchy-datavis", "figure"), Output("loading-poll", "disabled")],
+        [
+            Input("file-choice", "value"),
+            Input("metric-choice", "value"),
+            Input("log-threshold", "value"),
+            Input("vis-choice", "value"),
+            Input("loading-poll", "n_intervals"),
+        ],
+    )
+    def update_visualisation(profile_file, metric, log_threshold, vis_type, _):
+        store.load(profile_file)
+        if not store.is_ready(profile_file):
+            return {"layout": {"title": f"Loading {profile_file}..."}}, False
+        if metric not in store.get(profile_file).metrics:
+            return dash.no_update, True
+        return store.figure(profile_file, metric, 10 ** log_threshold, vis_type), True
+
+    @app.callback(Output("threshold-value", "children"), [Input("log-threshold", "value")])
+    def update_threshold_text(value):
+        return f"{(10 ** value):1.4f}"
+
+    return app
@@ -0,0 +1,223 @@
+"""
+Utilities to aggregate metrics per function (instead of per cnode), using the
+integer ``Function ID`` produced by :py:func:`calltree.calltree_to_df`.
+
+All the reductions are done with ``numpy.bincount`` or ``ufunc.at`` (e.g.,
+``numpy.add.at``, or ``numpy.maximum.at`` for ``max_time``) on integer IDs,
+without any manipulation of strings.
+"""
+import calltree as ct
+import calltree_conversions as cc
+import index_conversions as ic
+import numpy as np
+import pandas as pd
+
+# the initial values of the reductions
+_identities = {np.add: 0.0, np.minimum: np.inf, np.maximum: -np.inf}
+
+
+def get_recursion_mask(tree_df, function_ids=None):
+    """
+    Marks the cnodes that have an ancestor relative to the same function,
+    i.e., the cnodes that are inside a (direct or indirect) recursive call.
+
+    Using the depth-first order of the rows in ``tree_df``, every subtree is
+    a contiguous range of rows: a cnode has an ancestor relative to the same
+    function if and only if any of the previous cnodes for that function has
+    a subtree extending up to it.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, as produced by
+        :py:func:`calltree.calltree_to_df` (with rows in depth-first order).
+    function_ids : numpy.ndarray or None
+        Integer IDs of the function of each row of ``tree_df``, to use
+        instead of ``Function ID`` (e.g., the groups of
+        :py:func:`cppnames.get_name_groups`).
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        Boolean array aligned with the rows of ``tree_df``.
+    """
+    n = len(tree_df)
+    if function_ids is None:
+        function_ids = tree_df["Function ID"].to_numpy()
+    starts = np.arange(n)
+    sizes = cc.convert_array_to_inclusive(np.ones(n), tree_df).astype(int)
+    ends = starts + sizes - 1
+
+    # rows grouped by function, in depth-first order within each group
+    order = np.argsort(function_ids, kind="stable")
+    offsets = function_ids[order] * (n + 1)
+    # maximum end of the subtrees of the previous cnodes in the same group
+    running_max = np.maximum.accumulate(offsets + ends[order])
+    previous_max = np.concatenate([[-1], running_max[:-1]])
+
+    mask = np.empty(n, dtype=bool)
+    mask[order] = previous_max >= offsets + starts[order]
+    return mask
+
+
+def aggregate_array_by_function(
+    array, tree_df, inclusive=False, function_ids=None, ufunc=np.add
+):
+    """
+    Sums (or reduces with another ufunc) the rows of an array relative to
+    cnodes of the same function.
+
+    When ``inclusive`` is True, the rows for cnodes with an ancestor relative
+    to the same function are skipped, so that the inclusive value of
+    recursive functions is counted only once.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Array whose first axis is aligned with the rows of ``tree_df``.
+        It must contain inclusive values if ``inclusive`` is True.
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+    inclusive : bool
+        Whether the values in ``array`` are inclusive.
+    function_ids : numpy.ndarray or None
+        Integer IDs to use instead of ``Function ID`` (see
+        :py:func:`get_recursion_mask`).
+    ufunc : numpy.ufunc or list of numpy.ufunc
+        ``numpy.add`` (default), ``numpy.minimum`` or ``numpy.maximum``, or
+        a list with the operation for each index along the second axis of
+        ``array`` (e.g., for each metric, see :py:func:`metrics.get_ufuncs`).
+
+    Returns
+    -------
+    res : numpy.ndarray
+        Array whose first axis is indexed by ``Function ID`` (or by
+        ``function_ids``). The rows of the IDs without cnodes are zeros.
+    """
+    if function_ids is None:
+        function_ids = tree_df["Function ID"].to_numpy()
+    nfunctions = function_ids.max() + 1
+    if inclusive:
+        counted = ~get_recursion_mask(tree_df, function_ids)
+        function_ids = function_ids[counted]
+        array = array[counted]
+
+    if array.ndim == 1 and ufunc is np.add:
+        return np.bincount(function_ids, weights=array, minlength=nfunctions)
+
+    if isinstance(ufunc, np.ufunc):
+        groups = [(ufunc, Ellipsis)]
+    else:
+        assert len(ufunc) == array.shape[1], "One ufunc per column needed"
+        groups = [
+            (u, np.array([i for i, v in enumerate(ufunc) if v is u]))
+            for u in set(ufunc)
+        ]
+
+    res = np.empty((nfunctions,) + array.shape[1:])
+    for group_ufunc, columns in groups:
+        reduced = np.full(res[:, columns].shape, _identities[group_ufunc])
+        group_ufunc.at(reduced, function_ids, array[:, columns])
+        res[:, columns] = reduced
+    present = np.zeros(nfunctions, dtype=bool)
+    present[function_ids] = True
+    res[~present] = 0.0
+    return res
+
+
+def aggregate_by_function(
+    df,
+    tree_df,
+    inclusive=False,
+    exclusive_data=True,
+    function_ids=None,
+    names=None,
+    ufuncs=None,
+):
+    """
+    Aggregates the metrics in a DataFrame by function.
+
+    Replaces the conversion to ``Short Callpath`` and the splitting of the
+    strings needed to group the data by function name.
+
+    *Notice: The results may be nonsensical unless the metrics acted upon are
+    "INCLUSIVE convertible"*
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with ``Cnode ID`` in the index (e.g., ``df`` in the output
+        of ``process_cubex``, or ``common`` in the output of
+        ``process_multi``).
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree, as produced by
+        :py:func:`calltree.calltree_to_df`.
+    inclusive : bool
+        Whether to compute the inclusive (True) or exclusive (False) values
+        for each function.
+    exclusive_data : bool
+        Whether the data in ``df`` is exclusive (True) or inclusive (False).
+        From inclusive data, only the summed metrics can be converted back
+        to exclusive values: the others are ``NaN``.
+    function_ids : numpy.ndarray or None
+        Integer IDs to use instead of ``Function ID`` (see
+        :py:func:`get_recursion_mask`);
+    names : pandas.Series or None
+        The name of each of the ``function_ids`` (required with
+        ``function_ids``), whose name is used for the index level;
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`), used
+        both along the call tree and over the cnodes of each function (e.g.,
+        the maximum for ``max_time``). The metrics that are not in the
+        dictionary are summed.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the same columns as ``df``, where the ``Cnode ID``
+        level in the index is replaced by ``Function Name`` (or by the name
+        of ``names``).
+    """
+    metrics = (
+        df.columns.get_level_values("metric")
+        if "metric" in df.columns.names
+        else df.columns
+    )
+    ufuncs = {} if ufuncs is None else ufuncs
+    ufunc = [ufuncs.get(metric, np.add) for metric in metrics]
+
+    arr = ic.to_cnode_array(df, tree_df)
+    values = arr.array
+    if inclusive and exclusive_data:
+        values = cc.convert_array_to_inclusive(values, tree_df, ufunc)
+    elif not inclusive and not exclusive_data:
+        summed = np.array([u is np.add for u in ufunc], dtype=bool)
+        values = np.full(arr.array.shape, np.nan)
+        values[:, summed] = cc.convert_array_to_exclusive(
+            arr.array[:, summed], tree_df
+        )
+
+    res = aggregate_array_by_function(values, tree_df, inclusive, function_ids, ufunc)
+
+    if names is None:
+        names = ct.get_function_table(tree_df)
+    function_names = names.to_numpy()
+    other_levels = [name for name in df.index.names if name != "Cnode ID"]
+    if other_levels:
+        others = arr.others
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(function_names, len(others))]
+            + [
+                np.tile(others.get_level_values(i), len(function_names))
+                for i in range(others.nlevels)
+            ],
+            names=[names.name] + other_levels,
+        )
+    else:
+        index = pd.Index(function_names, name=names.name)
+
+    return pd.DataFrame(
+        data=res.transpose(0, 2, 1).reshape(len(index), len(df.columns)),
+        index=index,
+        columns=df.columns,
+    )
@@ -0,0 +1,169 @@
+"""
+Aggregation of the metrics over groups of cnodes defined by their
+attributes, e.g. the paradigm (MPI, OpenMP or compute), the source file or
+the level in the call tree, possibly per process or per node.
+
+The groups are defined by any column of the call tree DataFrame: in the
+output of ``process_cubex`` this has the categorical ``Paradigm``, ``Role``
+and ``Source File`` columns, besides ``Level`` and ``Function Name`` (see
+:py:func:`calltree.calltree_to_df`). The keys can be given with the short
+names in ``group_keys``, e.g.
+
+.. code-block:: python3
+
+    # MPI vs OpenMP vs compute time per rank
+    grouping.group_reduce(output, "paradigm", level="process")
+    # time per source file and level, summed over all threads
+    grouping.group_reduce(output, ["file", "level"], level=None)
+
+The exclusive values of the cnodes in each group are aggregated in a single
+pass over the ``(cnode, metric, thread)`` array (sorting the cnodes by
+group and reducing with ``reduceat``), and then over the threads of each
+process or node.
+"""
+import calltree_conversions as cc
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+import systemtree as st
+
+group_keys = {
+    "paradigm": "Paradigm",
+    "role": "Role",
+    "file": "Source File",
+    "level": "Level",
+    "function": "Function Name",
+}
+
+
+def group_codes(tree_df, by):
+    """
+    Numbers the groups of cnodes with the same values of some columns of
+    the call tree DataFrame.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree;
+    by : str or list of str
+        Column names, or keys in ``group_keys``.
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        The group of each row of ``tree_df``;
+    labels : pandas.Index
+        The values of the columns for each group (a ``MultiIndex`` if more
+        than a column is given).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    columns = [group_keys.get(key, key) for key in by]
+
+    codes = np.zeros(len(tree_df), dtype=np.int64)
+    uniques = []
+    for column in columns:
+        values = tree_df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column_codes = values.cat.codes.to_numpy()
+            column_uniques = values.cat.categories
+        else:
+            column_codes, column_uniques = pd.factorize(values, sort=True)
+        codes = codes * len(column_uniques) + column_codes
+        uniques.append(column_uniques)
+
+    # only the combinations that appear
+    groups, codes = np.unique(codes, return_inverse=True)
+    positions = []
+    for column_uniques in reversed(uniques):
+        positions.append(groups % len(column_uniques))
+        groups = groups // len(column_uniques)
+    arrays = [u[p] for u, p in zip(uniques, reversed(positions))]
+    if len(columns) == 1:
+        return codes, pd.Index(arrays[0], name=columns[0])
+    return codes, pd.MultiIndex.from_arrays(arrays, names=columns)
+
+
+def group_reduce(output, by, metrics=None, level="thread", mean=False):
+    """
+    Aggregates the exclusive values of the metrics over groups of cnodes.
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` (with exclusive or inclusive data).
+        From inclusive data, only the summed metrics can be converted back
+        to exclusive values: the others are ``NaN`` (as in
+        :py:func:`profile_diff.reduce_over_threads`);
+    by : str or list of str
+        The columns of ``output.ctree_df`` (or keys in ``group_keys``)
+        defining the groups;
+    metrics : list of str or None
+        The metrics (all, if ``None``). The metrics aggregated with
+        ``numpy.minimum`` or ``numpy.maximum`` (see
+        :py:func:`metrics.get_ufuncs`) are aggregated with the same
+        operation, the others are summed;
+    level : str or None
+        ``thread``, ``process`` or ``node``, to aggregate also the threads of
+        each process or node (see :py:mod:`systemtree`), or ``None`` to
+        aggregate all of them;
+    mean : bool
+        Whether to divide the sums by the number of threads in each process
+        or node.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with a column per metric, indexed by the group labels
+        and by ``Thread ID``, ``Rank`` or ``Node ID`` (depending on
+        ``level``).
+    """
+    tree_df = output.ctree_df
+    df = output.df if metrics is None else output.df.loc[:, list(metrics)]
+    ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else {}
+    ufunc = [ufuncs.get(metric, np.add) for metric in df.columns]
+
+    cnode_array = ic.to_cnode_array(df, tree_df)
+    values = cnode_array.array
+    if not output.get("exclusive", True):
+        summed = np.array([u is np.add for u in ufunc], dtype=bool)
+        values = np.full(values.shape, np.nan)
+        values[:, summed] = cc.convert_array_to_exclusive(
+            cnode_array.array[:, summed], tree_df
+        )
+
+    codes, labels = group_codes(tree_df, by)
+    # the cnode axis is moved last to use reduce_locations
+    grouped, groups, _ = st.reduce_locations(values.transpose(2, 1, 0), codes, ufunc)
+    grouped = grouped.transpose(2, 1, 0)
+    labels = labels[groups]
+
+    thread_ids = np.asarray(cnode_array.others)
+    if level is None:
+        locations = np.zeros(len(thread_ids), dtype=int)
+    elif level == "thread":
+        locations = thread_ids
+    else:
+        system_df = output.system_df
+        locations = system_df[st.levels[level]].reindex(thread_ids).to_numpy()
+    grouped, location_groups, counts = st.reduce_locations(grouped, locations, ufunc)
+    if mean:
+        summed = np.array([u is np.add for u in ufunc], dtype=bool)
+        grouped[:, summed] = grouped[:, summed] / counts
+
+    n_groups, n_metrics, n_locations = grouped.shape
+    data = grouped.transpose(0, 2, 1).reshape(n_groups * n_locations, n_metrics)
+    if level is None:
+        index = labels
+    else:
+        label_arrays = (
+            [labels.get_level_values(i) for i in range(labels.nlevels)]
+            if isinstance(labels, pd.MultiIndex)
+            else [labels]
+        )
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(np.asarray(a), n_locations) for a in label_arrays]
+            + [np.tile(location_groups, n_groups)],
+            names=list(labels.names) + [st.levels[level]],
+        )
+    return pd.DataFrame(data=data, index=index, columns=df.columns)
@@ -0,0 +1,209 @@
+"""
+Utilities to find the most expensive cnodes or functions ("hotspots") in the
+output of :ref:`process_cubex <process-cubex>` or
+:ref:`process_multi <process-multi>`.
+
+Instead of sorting a whole DataFrame indexed by ``Short Callpath``, the data
+for a single metric is reduced to one value per cnode (or per function) and
+only the top ``k`` entries are selected, with ``numpy.argpartition``.
+"""
+import calltree as ct
+import calltree_conversions as cc
+import funcwise as fw
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+from box import Box
+
+reductions = {"mean": np.mean, "max": np.max, "min": np.min, "sum": np.sum}
+
+
+def get_metric_frame(output, metric):
+    """
+    Selects the data relative to a single metric out of the output of
+    ``process_cubex`` or ``process_multi``.
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` or ``process_multi``.
+    metric : str
+        The name of the metric.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed like the original data, with a single column
+        for ``process_cubex`` outputs and one column per run for the common
+        metrics in ``process_multi`` outputs.
+    """
+    if "df" in output:
+        return output.df.loc[:, [metric]]
+    if metric in output.common.columns.get_level_values("metric"):
+        return output.common.xs(metric, level="metric", axis="columns")
+    return output.noncommon.loc[:, [metric]]
+
+
+def get_ancestor_closure(positions, parent_positions):
+    """
+    Finds all the ancestors of a set of rows in a call tree DataFrame.
+
+    Parameters
+    ----------
+    positions : array of int
+        Positions of the selected rows;
+    parent_positions : numpy.ndarray
+        Output of :py:func:`calltree_conversions.get_parent_positions`.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        A boolean mask, ``True`` for the selected rows and their ancestors.
+    """
+    mask = np.zeros(len(parent_positions), dtype=bool)
+    current = np.unique(positions)
+    while len(current) != 0:
+        mask[current] = True
+        current = parent_positions[current]
+        current = np.unique(current[(current >= 0)])
+        current = current[~mask[current]]
+    return mask
+
+
+def _top_k_positions(values, k):
+    """
+    Positions of the ``k`` largest values, sorted in descending order.
+    """
+    if k < len(values):
+        candidates = np.argpartition(-values, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+def top_k(
+    output,
+    metric,
+    k=10,
+    by="cnode",
+    reduction="mean",
+    exclusive=True,
+    return_subtree=False,
+):
+    """
+    Finds the ``k`` cnodes or functions with the largest value of a metric,
+    reduced over threads (and runs).
+
+    The data in ``output`` can be either exclusive or inclusive: when the
+    other kind is requested, the conversion is done along the call tree
+    (see :py:func:`calltree_conversions.convert_array_to_inclusive`).
+    For the ``mean`` and ``sum`` reductions, the data is reduced over threads
+    *before* the conversion, so that only one value per cnode is aggregated.
+    If the output contains the metric table, ``MINDOUBLE`` and ``MAXDOUBLE``
+    metrics are converted to inclusive with the minimum and the maximum (see
+    :py:func:`metrics.get_ufuncs`).
+
+    *Notice: The results may be nonsensical unless the metric is
+    "INCLUSIVE convertible" or no conversion is needed.*
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` or ``process_multi``.
+    metric : str
+        The name of the metric.
+    k : int
+        The number of cnodes or functions to return.
+    by : str
+        Either ``cnode`` or ``function``. In the latter case, the values for
+        all the cnodes relative to the same function are summed, or reduced
+        with the minimum or the maximum for ``MINDOUBLE`` and ``MAXDOUBLE``
+        metrics (for the inclusive values, recursive calls are counted only
+        once).
+    reduction : str
+        One of ``mean``, ``max``, ``min`` or ``sum``, the reduction over
+        threads and runs.
+    exclusive : bool
+        Whether to rank the cnodes by exclusive (True) or inclusive (False)
+        values.
+    return_subtree : bool
+        Whether to also return the smallest call tree containing all the
+        selected cnodes.
+
+    Returns
+    -------
+    res : pandas.DataFrame or Box
+        A DataFrame sorted by decreasing value of the metric, indexed by
+        ``Cnode ID`` (with the ``Function Name`` and ``Short Callpath``
+        columns) or by ``Function Name``. If ``return_subtree`` is True,
+        a Box containing the DataFrame (``top``) and the pruned call tree
+        (``subtree``).
+    """
+    assert by in ["cnode", "function"], f"Unknown grouping: {by}"
+    reduce = reductions[reduction]
+    ufunc = (
+        mt.get_ufuncs(output.metrics).get(metric, np.add)
+        if "metrics" in output
+        else np.add
+    )
+    linear = reduction in ["mean", "sum"] and ufunc is np.add
+
+    tree_df = output.ctree_df
+    frame = get_metric_frame(output, metric)
+    data = ic.to_cnode_array(frame, tree_df).array.reshape(len(tree_df), -1)
+
+    stored_exclusive = output.get("exclusive", True)
+
+    def cnode_values(data):
+        if exclusive == stored_exclusive:
+            return data
+        if exclusive:
+            return cc.convert_array_to_exclusive(data, tree_df)
+        return cc.convert_array_to_inclusive(data, tree_df, ufunc)
+
+    if by == "cnode":
+        if linear:
+            values = cnode_values(reduce(data, axis=1)[:, None])[:, 0]
+        else:
+            values = reduce(cnode_values(data), axis=1)
+        positions = _top_k_positions(values, k)
+        top = tree_df.iloc[positions][["Cnode ID", "Function Name"]].assign(
+            **{
+                "Short Callpath": lambda df: ic.get_short_callpath(df),
+                metric: values[positions],
+            }
+        )
+        top = top.set_index("Cnode ID")
+        selected_positions = positions
+    else:
+        if linear:
+            cnode_vals = cnode_values(reduce(data, axis=1)[:, None])[:, 0]
+            values = fw.aggregate_array_by_function(
+                cnode_vals, tree_df, inclusive=not exclusive
+            )
+        else:
+            per_function = fw.aggregate_array_by_function(
+                cnode_values(data), tree_df, inclusive=not exclusive, ufunc=ufunc
+            )
+            values = reduce(per_function, axis=1)
+        function_positions = _top_k_positions(values, k)
+        top = pd.DataFrame(
+            {metric: values[function_positions]},
+            index=pd.Index(
+                ct.get_function_table(tree_df).to_numpy()[function_positions],
+                name="Function Name",
+            ),
+        )
+        selected_positions = np.flatnonzero(
+            np.isin(tree_df["Function ID"].to_numpy(), function_positions)
+        )
+
+    if not return_subtree:
+        return top
+
+    mask = get_ancestor_closure(selected_positions, cc.get_parent_positions(tree_df))
+    subtree = ct.prune_call_tree(
+        output.ctree, set(tree_df["Cnode ID"].to_numpy()[mask].tolist())
+    )
+    return Box({"top": top, "subtree": subtree})
@@ -0,0 +1,195 @@
+"""
+Utilities to compute load-imbalance metrics between threads.
+
+All the statistics are computed at once, for every cnode and every metric,
+on the dense ``(cnode, metric, thread)`` array obtained with
+:py:func:`index_conversions.to_cnode_array`.
+
+The available statistics are:
+
+- ``mean``, ``min`` and ``max``: over threads;
+- ``max/mean``: the ratio between the maximum and the average;
+- ``(max-min)/mean``: the spread between threads, relative to the average;
+- ``cv``: the coefficient of variation (standard deviation over average);
+- ``percent imbalance``: ``(max/mean - 1) * 100``;
+- ``critical path imbalance``: ``max - mean``, the time the slowest thread
+  spends in the cnode beyond the average, i.e. what perfectly balancing the
+  cnode alone would save. This is only an estimate from the profile: unlike
+  Scalasca's "critical-path imbalance", computed from traces, it ignores
+  the waits that move the critical path between threads.
+"""
+import calltree_conversions as cc
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+
+statistics = [
+    "mean",
+    "min",
+    "max",
+    "max/mean",
+    "(max-min)/mean",
+    "cv",
+    "percent imbalance",
+    "critical path imbalance",
+]
+
+
+def imbalance_array(array):
+    """
+    Computes the imbalance statistics over the last axis of an array.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        An array whose last axis runs over threads.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        An array with the same shape as ``array``, except for the last axis
+        that runs over the statistics (in the order given by
+        ``imbalance.statistics``). Ratios are ``NaN`` where the mean is zero.
+    """
+    mean = array.mean(axis=-1)
+    amin = array.min(axis=-1)
+    amax = array.max(axis=-1)
+    std = array.std(axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        safe_mean = np.where(mean != 0, mean, np.nan)
+        max_over_mean = amax / safe_mean
+        res = [
+            mean,
+            amin,
+            amax,
+            max_over_mean,
+            (amax - amin) / safe_mean,
+            std / safe_mean,
+            (max_over_mean - 1) * 100,
+            amax - mean,
+        ]
+
+    return np.stack(res, axis=-1)
+
+
+def compute_imbalance(df, tree_df, inclusive=False, exclusive_data=True, ufuncs=None):
+    """
+    Computes the imbalance statistics between threads, for every cnode and
+    every column in a DataFrame.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A DataFrame with ``Cnode ID`` and ``Thread ID`` in the index (e.g.,
+        ``df`` in the output of ``process_cubex``).
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+    inclusive : bool
+        Whether to compute the statistics on the exclusive (False) or on the
+        inclusive (True) values.
+    exclusive_data : bool
+        Whether the data in ``df`` is exclusive (True) or inclusive (False).
+        From inclusive data, only the summed metrics can be converted back
+        to exclusive values: the statistics of the others are ``NaN``;
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`), used
+        to convert between exclusive and inclusive values (e.g., the minimum
+        for ``min_time``). The metrics that are not in the dictionary are
+        summed.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID``, with the same columns as ``df``
+        plus an additional ``statistic`` level.
+    """
+    metrics = (
+        df.columns.get_level_values("metric")
+        if "metric" in df.columns.names
+        else df.columns
+    )
+    ufuncs = {} if ufuncs is None else ufuncs
+    ufunc = [ufuncs.get(metric, np.add) for metric in metrics]
+
+    arr = ic.to_cnode_array(df, tree_df)
+    values = arr.array
+    if inclusive and exclusive_data:
+        values = cc.convert_array_to_inclusive(values, tree_df, ufunc)
+    elif not inclusive and not exclusive_data:
+        summed = np.array([u is np.add for u in ufunc], dtype=bool)
+        values = np.full(arr.array.shape, np.nan)
+        values[:, summed] = cc.convert_array_to_exclusive(
+            arr.array[:, summed], tree_df
+        )
+
+    res = imbalance_array(values)
+
+    columns = pd.MultiIndex.from_tuples(
+        [
+            (col if type(col) == tuple else (col,)) + (statistic,)
+            for col in df.columns
+            for statistic in statistics
+        ],
+        names=list(df.columns.names) + ["statistic"],
+    )
+
+    return pd.DataFrame(
+        data=res.reshape(len(arr.cnode_ids), -1),
+        index=pd.Index(arr.cnode_ids, name="Cnode ID"),
+        columns=columns,
+    )
+
+
+def get_imbalance(output, inclusive=False):
+    """
+    Computes the imbalance statistics between threads for the output of
+    ``process_cubex`` or ``process_multi``.
+
+    For the output of ``process_multi``, the statistics for the "common" and
+    the "non-common" metrics are put together, using the information in
+    ``ncmetrics`` to find the run each non-common metric comes from.
+
+    If the output contains the metric table, ``MINDOUBLE`` and ``MAXDOUBLE``
+    metrics are converted between exclusive and inclusive values with the
+    minimum and the maximum (see :py:func:`compute_imbalance`).
+
+    Parameters
+    ----------
+    output : Box
+        The output of ``process_cubex`` or ``process_multi``.
+    inclusive : bool
+        Whether to compute the statistics on the exclusive (False) or on the
+        inclusive (True) values.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID``, with columns
+        ``(metric, statistic)`` for the output of ``process_cubex`` and
+        ``(run, metric, statistic)`` for the output of ``process_multi``.
+    """
+    exclusive_data = output.get("exclusive", True)
+    tree_df = output.ctree_df
+    ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else {}
+
+    if "df" in output:
+        return compute_imbalance(output.df, tree_df, inclusive, exclusive_data, ufuncs)
+
+    noncommon = output.noncommon
+    runs = output.ncmetrics.set_index("metric").run.loc[noncommon.columns]
+    noncommon = noncommon.set_axis(
+        pd.MultiIndex.from_arrays(
+            [runs.to_numpy(), noncommon.columns], names=["run", "metric"]
+        ),
+        axis="columns",
+    )
+
+    return pd.concat(
+        [
+            compute_imbalance(df, tree_df, inclusive, exclusive_data, ufuncs)
+            for df in [output.common, noncommon]
+        ],
+        axis="columns",
+    ).sort_index(axis="columns", level=["run", "metric"], sort_remaining=False)
@@ -6,7 +6,10 @@ e.g. ``Cnode IDs``, ``Full Callpath`` and ``Short Callpath``.
 separated by comma.
 """
 from itertools import filterfalse
+import numpy as np
 import pandas as pd
+from box import Box
+import instrumentation as ins
 
 possible_index_cols = ["Short Callpath", "Full Callpath", "Cnode ID"]
 
@@ -28,6 +31,7 @@ def get_short_callpath(tree_df):
     return tree_df["Function Name"].str.cat(tree_df["Cnode ID"].astype(str), sep=",")
 
 
+@ins.instrumented(counts=lambda df: {"rows": len(df)})
 def convert_index(df, tree_df, target=None):
     """
     Converts the the index of a DataFrame to ``Short Callpath``,
@@ -86,3 +90,96 @@ def convert_index(df, tree_df, target=None):
         .set_index(new_index_levels + cnames)[0]
         .unstack(cnames)
     )
+
+
+@ins.instrumented(counts=lambda res: {"shape": res.array.shape})
+def to_cnode_array(df, tree_df=None):
+    """
+    Reshapes a DataFrame indexed by ``Cnode ID`` (and, e.g., ``Thread ID``)
+    into a dense ``numpy`` array, with one row per cnode.
+
+    All the index levels other than ``Cnode ID`` are moved to the last axis
+    of the array, so that the result has shape 
+    ``(n_cnodes, n_columns, n_other)``, where ``n_other`` is, e.g., the number
+    of threads. Missing entries are filled with zeros.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with ``Cnode ID`` in the index.
+    tree_df : pandas.DataFrame or None
+        DataFrame representation of the call tree. If given, the rows of the
+        result follow the order of ``tree_df["Cnode ID"]``, otherwise the
+        sorted ``Cnode ID`` values in ``df`` are used.
+
+    Returns
+    -------
+    res : Box
+        ``array`` (the array), ``cnode_ids`` (the ``Cnode ID`` for each row),
+        ``columns`` (the columns of ``df``) and ``others`` (the labels along 
+        the last axis).
+    """
+    assert find_index_col(df) == "Cnode ID", "Cnode ID needed in the index"
+
+    # integer codes for the cnodes and for all the other index levels,
+    # so that the array can be filled in a single vectorized assignment
+    cnode_codes, cnode_uniques = pd.factorize(
+        df.index.get_level_values("Cnode ID"), sort=True
+    )
+    if df.index.nlevels > 1:
+        other_codes, others = pd.factorize(df.index.droplevel("Cnode ID"), sort=True)
+    else:
+        other_codes, others = np.zeros(len(df), dtype=int), pd.Index([None])
+
+    array = np.zeros((len(cnode_uniques), len(df.columns), len(others)))
+    array[cnode_codes, :, other_codes] = df.to_numpy(dtype=float, na_value=0.0)
+
+    if tree_df is None:
+        cnode_ids = np.asarray(cnode_uniques)
+    else:
+        cnode_ids = tree_df["Cnode ID"].to_numpy()
+        positions = pd.Index(cnode_uniques).get_indexer(cnode_ids)
+        array = np.where(
+            (positions >= 0)[:, None, None], array[positions], 0.0
+        )
+
+    return Box(
+        {"array": array, "cnode_ids": cnode_ids, "columns": df.columns, "others": others}
+    )
+
+
+def from_cnode_array(array, cnode_array, index):
+    """
+    Inverse of :py:func:`to_cnode_array`: builds a DataFrame with the given
+    index out of an array with the same layout as ``cnode_array.array``.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Array of shape ``(n_cnodes, n_columns, n_other)``, e.g. a
+        transformation of ``cnode_array.array``.
+    cnode_array : Box
+        The output of :py:func:`to_cnode_array`, giving the labels for the
+        axes of ``array``.
+    index : pandas.Index
+        The index of the result (e.g., the index of the DataFrame passed to
+        :py:func:`to_cnode_array`). All its entries must be in ``array``.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the given index and ``cnode_array.columns`` as
+        columns.
+    """
+    rows = pd.Index(cnode_array.cnode_ids).get_indexer(
+        index.get_level_values("Cnode ID")
+    )
+    if index.nlevels > 1:
+        others = cnode_array.others.get_indexer(index.droplevel("Cnode ID"))
+    else:
+        others = np.zeros(len(index), dtype=int)
+    assert (rows >= 0).all() and (others >= 0).all(), "Index not in the array"
+
+    return pd.DataFrame(
+        data=array[rows, :, others], index=index, columns=cnode_array.columns
+    )
@@ -0,0 +1,467 @@
+"""
+Utilities to measure the time and the memory spent in each stage of the
+processing of ``.cubex`` files.
+
+The stages (e.g., running ``cube_dump``, building the call tree, reading
+the csv data, merging the data from multiple files) are wrapped in named
+*spans*. Each span records:
+
+- the wall-clock time and the CPU time;
+- the peak memory allocated during the span, with respect to the memory
+  allocated at its beginning (measured with ``tracemalloc``);
+- some counts (e.g., number of rows or of call tree nodes);
+- the total time spent in the calls of some hot functions (e.g.,
+  ``create_node``), that are too many to be recorded as separate spans
+  (see :py:func:`timed`).
+
+The instrumentation is disabled by default, and has a negligible cost when
+disabled. It can be enabled
+
+- with the :py:func:`recording` context manager:
+
+  .. code-block:: python3
+
+      import instrumentation as ins
+      with ins.recording() as recorder:
+          output = merger.process_multi(files)
+      print(recorder.summary())
+      recorder.to_chrome_trace("process_multi.trace.json")
+
+- or setting the ``CUPYBE_INSTRUMENT`` environment variable. If its value
+  is a file name, the recorded spans are written to it at exit, in the
+  format given by ``CUPYBE_INSTRUMENT_FORMAT`` (``json``, the default, or
+  ``chrome``); otherwise, a summary is logged. Memory tracing can be
+  disabled setting ``CUPYBE_INSTRUMENT_MEMORY=0``.
+
+Chrome-trace files can be opened with ``chrome://tracing`` or
+`Perfetto <https://ui.perfetto.dev>`_.
+
+*Notice: before Python 3.9, the peak memory of a span can include the
+memory allocated in the previous spans, since the peak cannot be reset.*
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+ENV_VAR = "CUPYBE_INSTRUMENT"
+
+_recorder = None
+
+
+class Span:
+    """
+    A named stage, with its measurements.
+
+    .. py:attribute:: name
+
+       The name of the span, like ``module.function``;
+
+    .. py:attribute:: start
+
+       The start time, in seconds, relative to the start of the recording;
+
+    .. py:attribute:: wall
+
+       The wall-clock time, in seconds;
+
+    .. py:attribute:: cpu
+
+       The CPU time (of the process), in seconds;
+
+    .. py:attribute:: peak_memory
+
+       The peak memory allocated during the span, in bytes (``None`` if
+       memory is not traced);
+
+    .. py:attribute:: counts
+
+       A dictionary of counts (e.g., ``rows``) and other attributes;
+
+    .. py:attribute:: timers
+
+       A dictionary with the number of calls and the total time spent in
+       the functions wrapped with :py:func:`timed`;
+
+    .. py:attribute:: depth
+
+       The nesting level of the span;
+
+    .. py:attribute:: thread
+
+       The identifier of the thread that executed the span.
+    """
+
+    def __init__(self, name, depth, thread, counts):
+        self.name = name
+        self.depth = depth
+        self.thread = thread
+        self.counts = dict(counts)
+        self.timers = {}
+        self.start = None
+        self.wall = None
+        self.cpu = None
+        self.peak_memory = None
+
+    def count(self, **counts):
+        """
+        Adds counts or attributes to the span.
+        """
+        self.counts.update(counts)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": self.start,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peak_memory": self.peak_memory,
+            "depth": self.depth,
+            "thread": self.thread,
+            "counts": self.counts,
+            "timers": self.timers,
+        }
+
+
+class _NullSpan:
+    """
+    Returned by :py:func:`span` when the instrumentation is disabled.
+    """
+
+    def count(self, **counts):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Recorder:
+    """
+    Collects the spans.
+
+    .. py:attribute:: spans
+
+       The list of the completed spans, in order of completion.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.spans = []
+        self.trace_memory = trace_memory
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, **counts):
+        stack = self._stack()
+        span = Span(name, len(stack), threading.get_ident(), counts)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            memory_start = tracemalloc.get_traced_memory()[0]
+            _reset_peak()
+            span._max_memory = memory_start
+
+        stack.append(span)
+        span.start = time.perf_counter() - self._t0
+        cpu_start = time.process_time()
+        try:
+            yield span
+        finally:
+            span.cpu = time.process_time() - cpu_start
+            span.wall = time.perf_counter() - self._t0 - span.start
+            stack.pop()
+            if tracing:
+                max_memory = max(span._max_memory, tracemalloc.get_traced_memory()[1])
+                span.peak_memory = max_memory - memory_start
+                if stack and hasattr(stack[-1], "_max_memory"):
+                    parent = stack[-1]
+                    parent._max_memory = max(parent._max_memory, max_memory)
+                _reset_peak()
+            with self._lock:
+                self.spans.append(span)
+
+    def add_timing(self, name, wall, cpu):
+        stack = self._stack()
+        if not stack:
+            return
+        timer = stack[-1].timers.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        timer["calls"] += 1
+        timer["wall"] += wall
+        timer["cpu"] += cpu
+
+    def to_json(self, path=None):
+        """
+        Exports the spans as a list of dictionaries, in JSON format.
+
+        Parameters
+        ----------
+        path : str or None
+            The file to write to. If ``None``, the JSON text is returned.
+        """
+        return _dump({"spans": [span.to_dict() for span in self.spans]}, path)
+
+    def to_chrome_trace(self, path=None):
+        """
+        Exports the spans in the Chrome trace event format (a "complete"
+        event for each span).
+
+        Parameters
+        ----------
+        path : str or None
+            The file to write to. If ``None``, the JSON text is returned.
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.wall * 1e6,
+                "pid": pid,
+                "tid": span.thread,
+                "args": dict(
+                    span.counts,
+                    cpu=span.cpu,
+                    peak_memory=span.peak_memory,
+                    **{f"{name} ({key})": value
+                       for name, timer in span.timers.items()
+                       for key, value in timer.items()},
+                ),
+            }
+            for span in sorted(self.spans, key=lambda span: span.start)
+        ]
+        return _dump({"traceEvents": events, "displayTimeUnit": "ms"}, path)
+
+    def summary(self):
+        """
+        Summarises the spans by name.
+
+        Returns
+        -------
+        res : pandas.DataFrame
+            A DataFrame indexed by span name, with the number of calls, the
+            total wall-clock and CPU times and the maximum peak memory,
+            sorted by decreasing wall-clock time.
+        """
+        df = pd.DataFrame(
+            [
+                (span.name, span.wall, span.cpu, span.peak_memory)
+                for span in self.spans
+            ],
+            columns=["name", "wall", "cpu", "peak_memory"],
+        )
+        return (
+            df.groupby("name")
+            .agg(
+                calls=("wall", "size"),
+                wall=("wall", "sum"),
+                cpu=("cpu", "sum"),
+                peak_memory=("peak_memory", "max"),
+            )
+            .sort_values("wall", ascending=False)
+        )
+
+
+def _reset_peak():
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def _dump(obj, path):
+    if path is None:
+        return json.dumps(obj, default=str)
+    with open(path, "w") as f:
+        json.dump(obj, f, default=str)
+
+
+def enabled():
+    """
+    Whether the instrumentation is enabled.
+    """
+    return _recorder is not None
+
+
+def start(trace_memory=True):
+    """
+    Enables the instrumentation, returning a new :py:class:`Recorder`.
+    """
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = Recorder(trace_memory)
+    return _recorder
+
+
+def stop():
+    """
+    Disables the instrumentation, returning the :py:class:`Recorder` (or
+    ``None`` if the instrumentation was not enabled).
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+
+@contextmanager
+def recording(trace_memory=True):
+    """
+    Context manager that enables the instrumentation, yielding a
+    :py:class:`Recorder` that contains the spans recorded inside the
+    ``with`` block. The previous state is restored on exit.
+
+    Parameters
+    ----------
+    trace_memory : bool
+        Whether to measure the peak memory with ``tracemalloc`` (which slows
+        down the execution noticeably).
+    """
+    global _recorder
+    previous = _recorder
+    recorder = Recorder(trace_memory)
+    _recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+        recorder.close()
+
+
+def span(name, **counts):
+    """
+    Context manager that records a span, if the instrumentation is enabled.
+
+    The object returned can be used to add counts to the span:
+
+    .. code-block:: python3
+
+        with span("cube_file_utils.read_dump") as sp:
+            df = pd.read_csv(dump)
+            sp.count(rows=len(df))
+
+    Parameters
+    ----------
+    name : str
+        The name of the span;
+    counts :
+        Counts and attributes for the span.
+    """
+    if _recorder is None:
+        return _null_context
+    return _recorder.span(name, **counts)
+
+
+class _NullContext:
+    def __enter__(self):
+        return _null_span
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_context = _NullContext()
+
+
+def instrumented(name=None, counts=None):
+    """
+    Decorator that records a span for each call of a function.
+
+    Parameters
+    ----------
+    name : str or None
+        The name of the span. If ``None``, ``module.function``;
+    counts : callable or None
+        A function that takes the return value of the decorated function and
+        returns a dictionary of counts for the span, e.g.
+        ``lambda df: {"rows": len(df)}``.
+    """
+
+    def decorator(fun):
+        span_name = name if name is not None else f"{fun.__module__}.{fun.__name__}"
+
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return fun(*args, **kwargs)
+            with _recorder.span(span_name) as sp:
+                res = fun(*args, **kwargs)
+                if counts is not None:
+                    sp.count(**counts(res))
+                return res
+
+        return wrapper
+
+    return decorator
+
+
+def timed(name, fun):
+    """
+    Wraps a function so that the number of calls and the total time spent
+    in it are added to the current span (as ``timers[name]``).
+
+    Meant for functions called many times (e.g., once per line), for which
+    a span per call would be too expensive. If the instrumentation is
+    disabled, ``fun`` is returned unchanged.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return fun
+
+    @functools.wraps(fun)
+    def wrapper(*args, **kwargs):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            return fun(*args, **kwargs)
+        finally:
+            recorder.add_timing(
+                name,
+                time.perf_counter() - wall_start,
+                time.process_time() - cpu_start,
+            )
+
+    return wrapper
+
+
+def _write_at_exit(destination, output_format):
+    recorder = stop()
+    if recorder is None:
+        return
+    if destination in ["1", "true", "yes"]:
+        logging.info(f"Instrumentation summary:\n{recorder.summary()}")
+    elif output_format == "chrome":
+        recorder.to_chrome_trace(destination)
+    else:
+        recorder.to_json(destination)
+
+
+if os.environ.get(ENV_VAR):
+    start(trace_memory=os.environ.get(f"{ENV_VAR}_MEMORY", "1") != "0")
+    atexit.register(
+        _write_at_exit,
+        os.environ[ENV_VAR],
+        os.environ.get(f"{ENV_VAR}_FORMAT", "json"),
+    )
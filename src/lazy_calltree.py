@@ -0,0 +1,248 @@
+"""
+Lazy loading of large call trees.
+
+The call tree is built as a tree of ``CubeTreeNode`` objects, as in
+:py:mod:`calltree`, but only the top levels are created at once: the
+``children`` of the deeper nodes are created the first time they are
+accessed (e.g., iterating on them, or expanding a node in a notebook), from
+a small index retained in memory:
+
+- for the lines in the output of ``cube_dump -w``, the level of each line
+  (see :py:class:`LineIndex`): the children of a node are the lines one
+  level deeper in its range of lines, found with a vectorized comparison;
+- for ``anchor.xml``, the parsed XML elements of the cnodes and of the
+  regions (see :py:func:`lazy_calltree_from_anchor`).
+
+This way, the time needed to see the top of the tree does not depend on the
+size of the tree (apart from the cost of reading the lines or the XML).
+
+.. code-block:: python3
+
+    root = lazy_calltree.get_lazy_call_tree("profile.cubex", maxlevel=2)
+    print(calltree.calltree_to_string(root, maxlevel=2))
+    root.children[0].children  # created now
+"""
+import tarfile
+import xml.etree.ElementTree as ET
+from collections.abc import Sequence
+
+import cubex_archive as ca
+import numpy as np
+from calltree import CubeTreeNode, create_node, get_call_tree_lines
+from cube_file_utils import get_cube_dump_w_text
+from tree_parsing import level_fun
+
+
+class LazyChildren(Sequence):
+    """
+    The list of the children of a node, created by ``loader`` (a callable
+    taking the parent node) on first access.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._nodes = None
+        self.parent = None
+
+    @property
+    def loaded(self):
+        return self._nodes is not None
+
+    def load(self):
+        if self._nodes is None:
+            self._nodes = self._loader(self.parent)
+            self._loader = None
+        return self._nodes
+
+    def __getitem__(self, index):
+        return self.load()[index]
+
+    def __len__(self):
+        return len(self.load())
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __repr__(self):
+        if not self.loaded:
+            return "LazyChildren(<not loaded>)"
+        return f"LazyChildren({len(self._nodes)} nodes)"
+
+
+def _make_node(attrs, loader):
+    children = LazyChildren(loader)
+    attrs["children"] = children
+    node = CubeTreeNode(attrs)
+    children.parent = node
+    return node
+
+
+def is_loaded(node):
+    """
+    Whether the children of a node have already been created.
+    """
+    children = node.children
+    return not isinstance(children, LazyChildren) or children.loaded
+
+
+def load_levels(root, maxlevel):
+    """
+    Creates the nodes of a lazy call tree down to ``maxlevel`` levels below
+    ``root`` (all of them, if ``None``).
+    """
+    if maxlevel is not None and maxlevel <= 0:
+        return root
+    new_maxlevel = maxlevel - 1 if maxlevel is not None else None
+    for child in root.children:
+        load_levels(child, new_maxlevel)
+    return root
+
+
+class LineIndex:
+    """
+    An index on the lines of the call tree in the output of
+    ``cube_dump -w``: the level of each line.
+
+    Parameters
+    ----------
+    lines : list of str
+        The lines of the call tree (see
+        :py:func:`calltree.get_call_tree_lines`).
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.levels = np.fromiter(
+            (level_fun(line) for line in lines), dtype=int, count=len(lines)
+        )
+
+    def children(self, start, end):
+        """
+        The ranges of lines of the children of the node in line ``start``,
+        whose descendants end at line ``end`` (excluded).
+        """
+        levels = self.levels[start + 1 : end]
+        starts = start + 1 + np.flatnonzero(levels == self.levels[start] + 1)
+        ends = np.append(starts[1:], end)
+        return zip(starts.tolist(), ends.tolist())
+
+    def node(self, start, end, parent=None):
+        """
+        Creates the node of line ``start`` (see
+        :py:func:`calltree.create_node`), with lazy children.
+        """
+        attrs = dict(create_node(self.lines[start]))
+        attrs["parent"] = parent
+
+        def loader(node):
+            return [self.node(s, e, node) for s, e in self.children(start, end)]
+
+        return _make_node(attrs, loader)
+
+
+def lazy_calltree_from_lines(input_lines, maxlevel=2):
+    """
+    Builds a lazy call tree from the lines in the output of ``cube_dump -w``
+    (the lazy equivalent of :py:func:`calltree.calltree_from_lines`).
+
+    Parameters
+    ----------
+    input_lines : list of str
+        The lines of the call tree;
+    maxlevel : int or None
+        The number of levels below the root that are created immediately.
+
+    Returns
+    -------
+    root : CubeTreeNode
+        The root of the tree.
+    """
+    index = LineIndex(input_lines)
+    return load_levels(index.node(0, len(input_lines)), maxlevel)
+
+
+def _region_attrs(region):
+    fname_full = region.findtext("name").strip()
+    fname = fname_full
+    if "(" in fname_full:
+        # same as calltree.create_node_cpp
+        fname = fname_full[: fname_full.find("(")].replace(", ", ",").split()[-1]
+    return dict(
+        fname=fname,
+        fname_full=fname_full,
+        mod="",
+        paradigm=region.findtext("paradigm") or "",
+        role=region.findtext("role") or "",
+        url=region.findtext("url") or "",
+        descr=region.findtext("descr") or "",
+        mode=region.get("mod", ""),
+        begin=int(region.get("begin", -1)),
+        end=int(region.get("end", -1)),
+    )
+
+
+def lazy_calltree_from_anchor(anchor, maxlevel=2):
+    """
+    Builds a lazy call tree from ``anchor.xml``, without ``cube_dump``.
+
+    The nodes have the same attributes as the ones created from the output
+    of ``cube_dump -w`` (``fname``, ``fname_full``, ``cnode_id``,
+    ``paradigm``, ``role``, ``url``, ``descr``, ``mode``, ``begin``,
+    ``end``).
+
+    Parameters
+    ----------
+    anchor : xml.etree.ElementTree.Element
+        The root element of ``anchor.xml`` (see
+        :py:func:`cubex_archive.read_anchor`);
+    maxlevel : int or None
+        The number of levels below the root that are created immediately.
+
+    Returns
+    -------
+    root : CubeTreeNode
+        The root of the (first) tree.
+    """
+    program = anchor.find("program")
+    regions = {region.get("id"): region for region in program.iter("region")}
+    region_attrs = {}
+
+    def node(element, parent=None):
+        callee = element.get("calleeId")
+        if callee not in region_attrs:
+            region_attrs[callee] = _region_attrs(regions[callee])
+        attrs = dict(region_attrs[callee])
+        attrs["cnode_id"] = int(element.get("id"))
+        attrs["parent"] = parent
+
+        def loader(parent_node):
+            return [node(child, parent_node) for child in element.findall("cnode")]
+
+        return _make_node(attrs, loader)
+
+    return load_levels(node(program.find("cnode")), maxlevel)
+
+
+def get_lazy_call_tree(profile_file, maxlevel=2):
+    """
+    Gets a lazy call tree for a ``.cubex`` file, from ``anchor.xml`` if
+    possible, or else from the output of ``cube_dump -w``.
+
+    Parameters
+    ----------
+    profile_file : str
+        Name of the ``.cubex`` file;
+    maxlevel : int or None
+        The number of levels below the root that are created immediately.
+
+    Returns
+    -------
+    root : CubeTreeNode
+        The root of the tree.
+    """
+    try:
+        anchor = ca.read_anchor(profile_file)
+    except (OSError, tarfile.TarError, KeyError, ET.ParseError):
+        lines = get_call_tree_lines(get_cube_dump_w_text(profile_file))
+        return lazy_calltree_from_lines(lines, maxlevel)
+    return lazy_calltree_from_anchor(anchor, maxlevel)
@@ -3,15 +3,141 @@ Utilities to process the data from a single ``.cubex`` file, or merge the
 information that comes from multiple ``.cubex`` files.
 """
 import calltree as ct
+import calltree_conversions as cc
 from itertools import combinations
 import cube_file_utils as cfu
 import metrics as mt
+import instrumentation as ins
+import systemtree as st
 import logging
+import numpy as np
 import pandas as pd
 from box import Box
 
 
-def process_cubex(profile_file, exclusive=True):
+modes = ["exclusive", "inclusive", "both"]
+
+# pandas aggregations equivalent to the ufuncs in metrics.get_ufuncs
+_aggregations = {np.add: "sum", np.minimum: "min", np.maximum: "max"}
+
+
+def get_mode(mode, exclusive):
+    """
+    Validates ``mode``, or chooses it according to ``exclusive`` if it is
+    ``None``.
+    """
+    if mode is None:
+        return "exclusive" if exclusive else "inclusive"
+    assert mode in modes, f"Unknown mode: {mode}"
+    return mode
+
+
+def _count_rows(output):
+    data = output.excl if "excl" in output else output
+    return {"rows": len(data.df if "df" in data else data.common)}
+
+
+def derive_inclusive(profile_file, dump_df, ctree_df, metric_table):
+    """
+    Computes the inclusive data for a ``.cubex`` file out of the exclusive
+    data.
+
+    The metrics that are "INCLUSIVE convertible" or whose data type tells
+    how to aggregate them (e.g., minimum and maximum times, see
+    :py:func:`metrics.get_locally_convertible_metrics`) are converted with
+    :py:func:`calltree_conversions.convert_df_to_inclusive_vectorized`; only
+    the remaining ones are read again with ``cube_dump``.
+
+    Parameters
+    ----------
+    profile_file : str
+        The name of the ``.cubex`` file;
+    dump_df : pandas.DataFrame
+        The exclusive data (``df`` in the output of ``process_cubex``);
+    ctree_df : pandas.DataFrame
+        DataFrame representation of the call tree;
+    metric_table : pandas.DataFrame
+        The information about the metrics (see
+        :py:func:`metrics.get_metric_table`).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The inclusive data, with the same layout as ``dump_df``.
+    """
+    local = mt.get_locally_convertible_metrics(metric_table)
+    convertible = [metric for metric in dump_df.columns if metric in local]
+    not_convertible = [
+        metric for metric in dump_df.columns if metric not in local
+    ]
+
+    parts = []
+    if convertible:
+        parts.append(
+            cc.convert_df_to_inclusive_vectorized(
+                dump_df.loc[:, convertible], ctree_df, mt.get_ufuncs(metric_table)
+            )
+        )
+    if not_convertible:
+        logging.debug(f"Reading inclusive data for {not_convertible}...")
+        parts.append(
+            cfu.get_dump(profile_file, exclusive=False, metrics=not_convertible)
+            .rename_axis('metric', axis='columns')
+            .set_index(['Cnode ID', 'Thread ID'])
+            .reindex(dump_df.index)
+        )
+
+    return pd.concat(parts, axis="columns").loc[:, dump_df.columns]
+
+
+def roll_up(df, cutoff, ufuncs=None, exclusive=True):
+    """
+    Removes the data of the cnodes dropped from a truncated call tree (see
+    :py:func:`calltree.truncate_call_tree_lines`).
+
+    The exclusive values of the dropped cnodes are added to the ones of
+    their ancestor at the cutoff level (or combined with the ufuncs in
+    ``ufuncs``, e.g. the minimum for ``min_time``), so that the inclusive
+    values computed on the truncated tree do not change. Inclusive values
+    are just dropped.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID`` and ``Thread ID``;
+    cutoff : pandas.Series
+        The ancestor at the cutoff level of each dropped cnode;
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`). The
+        metrics that are not in the dictionary are summed;
+    exclusive : bool
+        Whether the data in ``df`` is exclusive.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the same layout as ``df``, without the rows of the
+        dropped cnodes.
+    """
+    cnode_ids = df.index.get_level_values("Cnode ID")
+    if not exclusive:
+        return df[~cnode_ids.isin(cutoff.index)]
+    targets = pd.Series(cnode_ids).map(cutoff).fillna(pd.Series(cnode_ids))
+    aggregations = {
+        metric: _aggregations[(ufuncs or {}).get(metric, np.add)]
+        for metric in df.columns
+    }
+    res = df.groupby(
+        [targets.astype(int).to_numpy(), df.index.get_level_values("Thread ID")],
+        sort=False,
+    ).agg(aggregations)
+    res.index.names = ["Cnode ID", "Thread ID"]
+    res.columns.name = df.columns.name
+    return res
+
+
+@ins.instrumented(counts=_count_rows)
+def process_cubex(profile_file, exclusive=True, mode=None, maxlevel=None, processes=None):
     """
     Processes a single ``.cubex`` file, returning the numeric data from the 
     profiling, plus information about the call tree and the metrics.
@@ -24,38 +150,89 @@ def process_cubex(profile_file, exclusive=True):
         The name of the ``.cubex`` file.
     exclusive : bool
         Whether to ask ``cube_dump`` for exclusive (True) or inclusive (False) 
-        metrics.
+        metrics. Ignored if ``mode`` is given.
+    mode : str or None
+        One of ``exclusive``, ``inclusive`` or ``both``. With ``both``, the
+        exclusive data is read only once, and the inclusive data is derived
+        from it for the "INCLUSIVE convertible" metrics (see
+        :py:func:`derive_inclusive`).
+    maxlevel : int or None
+        If given, the cnodes deeper than ``maxlevel`` (the root is at level
+        0) are dropped, and their exclusive values are rolled up into their
+        ancestor at level ``maxlevel`` (see :py:func:`roll_up`), so that the
+        inclusive values of the remaining cnodes are unchanged.
+    processes : int or None
+        If given, the number of worker processes used to parse the lines of
+        the call tree (see :py:func:`calltree.calltree_from_lines`).
 
     Returns
     -------
     ctree : calltree.CubeTreeNode
         A call tree recursive object
     ctree_df : pandas.DataFrame
-        A DataFrame representation of the call tree object
+        A DataFrame representation of the call tree object, with the
+        attributes of the regions (see :py:func:`calltree.calltree_to_df`)
+    system_df : pandas.DataFrame
+        The system tree, with the process and the node of each thread (see
+        :py:mod:`systemtree`).
     df : pandas.DataFrame
         A dataframe containing the profiling data, from 
     conv_info : list
         convertibility information (to inclusive) for the metrics contained
         in the dump.
+    metrics : pandas.DataFrame
+        All the information about the metrics (see 
+        :py:func:`metrics.get_metric_table`).
+    exclusive : bool
+        Whether the data in ``df`` is exclusive (True) or inclusive (False).
 
+    If ``mode`` is ``both``, the result contains instead two objects like the
+    one above, ``excl`` and ``incl``, for the exclusive and the inclusive data
+    (sharing the same call tree).
     """
+    mode = get_mode(mode, exclusive)
+
     # Getting all callgraph information
     logging.debug(f"Reading {profile_file}...")
 
-    ctree = ct.get_call_tree(profile_file)
-    ctree_df = ct.calltree_to_df(ctree, full_path=True)
+    # cube_dump -w is run only once, for both the call tree and the metrics
+    cube_dump_w_text = cfu.get_cube_dump_w_text(profile_file)
+    call_tree_lines = ct.get_call_tree_lines(cube_dump_w_text)
+    if maxlevel is not None:
+        call_tree_lines, cutoff = ct.truncate_call_tree_lines(call_tree_lines, maxlevel)
+    ctree = ct.calltree_from_lines(call_tree_lines, processes)
+    ctree_df = ct.calltree_to_df(ctree, full_path=True, attributes=True)
     dump_df = (
-        cfu.get_dump(profile_file, exclusive)  #
+        cfu.get_dump(profile_file, mode != "inclusive")  #
         .rename_axis('metric', axis='columns')  #
         .set_index(['Cnode ID', 'Thread ID']))  #
 
-    conv_info = mt.get_inclusive_convertible_metrics(profile_file)
-
+    metric_table = mt.get_metric_table(profile_file, cube_dump_w_text)
+    if maxlevel is not None:
+        dump_df = roll_up(
+            dump_df, cutoff, mt.get_ufuncs(metric_table), mode != "inclusive"
+        )
+    conv_info = set(metric_table.index[metric_table.convertible])
+    system_df = st.get_system_df(profile_file, cube_dump_w_text)
+
+    def make_output(df, exclusive):
+        return Box({
+            'ctree': ctree,
+            'ctree_df': ctree_df,
+            'system_df': system_df,
+            'df': df,
+            'conv_info': conv_info,
+            'metrics': metric_table,
+            'exclusive': exclusive
+        })
+
+    if mode != "both":
+        return make_output(dump_df, mode == "exclusive")
+
+    inclusive_df = derive_inclusive(profile_file, dump_df, ctree_df, metric_table)
     return Box({
-        'ctree': ctree,
-        'ctree_df': ctree_df,
-        'df': dump_df,
-        'conv_info': conv_info
+        'excl': make_output(dump_df, True),
+        'incl': make_output(inclusive_df, False)
     })
 
 
@@ -74,7 +251,10 @@ def check_column_sets(column_sets):
     logging.debug("Column sets are ok.")
 
 
-def process_multi(profile_files, exclusive=True):
+@ins.instrumented(counts=_count_rows)
+def process_multi(
+    profile_files, exclusive=True, mode=None, maxlevel=None, processes=None
+):
 
     """ Processes ``.cubex`` files coming from different profiling runs, e.g.
     from a ``scalasca -analyze`` run, aggregating the results.
@@ -91,7 +271,16 @@ def process_multi(profile_files, exclusive=True):
         List of ``.cubex`` filenames;
     exclusive : bool
         Whether to ask ``cube_dump`` for exclusive (True) or inclusive (False) 
-        metrics.
+        metrics. Ignored if ``mode`` is given.
+    mode : str or None
+        One of ``exclusive``, ``inclusive`` or ``both`` (see
+        :py:func:`process_cubex`);
+    maxlevel : int or None
+        The deepest level of the call tree to keep (see
+        :py:func:`process_cubex`);
+    processes : int or None
+        The number of worker processes used to parse each call tree (see
+        :py:func:`process_cubex`).
 
     Returns
     -------
@@ -99,6 +288,8 @@ def process_multi(profile_files, exclusive=True):
         A call tree recursive structure;
     ctree_df : pandas.DataFrame
         DataFrame representation of the call tree;
+    system_df : pandas.DataFrame
+        The system tree (from the first file);
     common : pandas.DataFrame
         A data frame containing all the data relative to metrics that are 
         shared among *all* the ``.cubex`` files ("common" metrics);
@@ -107,26 +298,54 @@ def process_multi(profile_files, exclusive=True):
         single ``.cubex`` files ("non-common" metrics);
     conv_info : list
         A list of metrics that can be converted to inclusive.
+    metrics : pandas.DataFrame
+        All the information about the metrics in all the files (see 
+        :py:func:`metrics.get_metric_table`).
     ncmetric : padas.DataFrame
         A dataframe expressing, for each metric coming from only a single
         ``.cubex`` file (the "non-common"  metrics) the ID of the run it came 
         from.
+    exclusive : bool
+        Whether the data is exclusive (True) or inclusive (False).
 
+    If ``mode`` is ``both``, the result contains instead two objects like the
+    one above, ``excl`` and ``incl``, for the exclusive and the inclusive data.
+    """
+    mode = get_mode(mode, exclusive)
+
+    logging.debug(f"Reading {len(profile_files)} files...")
+    outputs = [process_cubex(pf, mode=mode, maxlevel=maxlevel, processes=processes) for pf in profile_files]
+
+    if mode != "both":
+        return merge_outputs(outputs)
+
+    return Box({
+        'excl': merge_outputs([output.excl for output in outputs]),
+        'incl': merge_outputs([output.incl for output in outputs])
+    })
+
+
+def merge_outputs(outputs):
+    """
+    Merges the outputs of ``process_cubex`` for different profiling runs
+    into the output of ``process_multi``.
     """
     # Assuming that the calltree info is equal for all
     # .cubex files, up to isomorphism.
-    first_file_info = process_cubex(profile_files[0], exclusive)
-    ctree = first_file_info.ctree
-    ctree_df = first_file_info.ctree_df
+    ctree = outputs[0].ctree
+    ctree_df = outputs[0].ctree_df
+    system_df = outputs[0].system_df
+    exclusive = outputs[0].exclusive
 
-    logging.debug(f"Reading {len(profile_files)} files...")
-    outputs = [process_cubex(pf, exclusive) for pf in profile_files]
     dfs = [ output.df for output in outputs ]
     conv_infos = [output.conv_info for output in outputs]
 
 
     conv_info = set.union(*conv_infos)
 
+    metric_table = pd.concat([output.metrics for output in outputs])
+    metric_table = metric_table[~metric_table.index.duplicated()]
+
     columns_df = [set(df.columns) for df in dfs]
 
     # finding columns COMMON to all DFs and creating
@@ -134,7 +353,7 @@ def process_multi(profile_files, exclusive=True):
 
     check_column_sets(columns_df)
 
-    common_cols = set.intersection(*columns_df)
+    common_cols = sorted(set.intersection(*columns_df))
 
     dfs_common = [df.loc[:, common_cols] for df in dfs]
 
@@ -143,12 +362,15 @@ def process_multi(profile_files, exclusive=True):
                                                 for col in common_cols],
                                                names=['run', 'metric'])
 
-    df_common = pd.concat(dfs_common, axis="columns", join="inner")
+    with ins.span("merger.concat_common", frames=len(dfs_common)):
+        df_common = pd.concat(dfs_common, axis="columns", join="inner")
 
     # finding columns SPECIFIC to each DFs and creating a
     # dataframe for those
 
-    noncommon_columns_df = [columns.difference(common_cols) for columns in columns_df]
+    noncommon_columns_df = [
+        sorted(columns.difference(common_cols)) for columns in columns_df
+    ]
 
     dfs_noncommon = [
         df.loc[:, noncommon_columns]
@@ -156,9 +378,10 @@ def process_multi(profile_files, exclusive=True):
     ]
 
 
-    df_noncommon = (
-        pd.concat(dfs_noncommon, axis='columns', join='inner')  #
-        .rename_axis(mapper=['metric'], axis='columns'))  #
+    with ins.span("merger.concat_noncommon", frames=len(dfs_noncommon)):
+        df_noncommon = (
+            pd.concat(dfs_noncommon, axis='columns', join='inner')  #
+            .rename_axis(mapper=['metric'], axis='columns'))  #
 
     noncommon_columns_run_tuples = [
         (col, i) for i, columns in enumerate(noncommon_columns_df)
@@ -170,8 +393,11 @@ def process_multi(profile_files, exclusive=True):
     return Box({
         'ctree': ctree,
         'ctree_df': ctree_df,
+        'system_df': system_df,
         'common': df_common,
         'noncommon': df_noncommon,
         'conv_info': conv_info,
-        'ncmetrics' : noncommon_columns_run_df
+        'metrics': metric_table,
+        'ncmetrics' : noncommon_columns_run_df,
+        'exclusive': exclusive
     })
@@ -1,15 +1,27 @@
 """
 Utilities to get metric informations out of the output of ``cube_dump -w``.
 
-The only useful piece of information about the metrics is, for now, 
-the convertibility to inclusive.
+Besides the convertibility to inclusive, the metric table (see
+:py:func:`get_metric_table`) contains the data type of each metric, that 
+determines how the values are aggregated along the call tree: ``MINDOUBLE``
+and ``MAXDOUBLE`` metrics (e.g., ``min_time`` and ``max_time``) are
+aggregated with the minimum and the maximum, all the others are summed.
 
 """
 from collections import namedtuple
+import tarfile
 from cube_file_utils import get_lines, get_cube_dump_w_text
+import cubex_archive as ca
+import instrumentation as ins
+import numpy as np
+import pandas as pd
 
 Metric = namedtuple("Metric", ["shortname", "convertibility"])
 
+# ufuncs used to aggregate the metrics along the call tree, by data type.
+# All the other data types are summed.
+reduction_ufuncs = {"MINDOUBLE": np.minimum, "MAXDOUBLE": np.maximum}
+
 
 def get_metric_lines(cube_dump_w_text):
     """
@@ -35,12 +47,48 @@ def parse_line(line):
     info : Metric
         Tuple in the form ``(PAPI_L1_ICM,"INCLUSIVE convertible")``
     """
-    # this is brittle but should work for now.
-    # TODO : Strengthen it.
+    details = parse_line_details(line)
+    return Metric(
+        shortname=details["uniq_name"], convertibility=details["convertibility"]
+    )
+
+
+def parse_line_details(line):
+    """
+    Read all the information in a single line out of the `cube_dump -w`
+    output.
+
+    The description of the metric can contain commas and parentheses, so
+    the fields are counted from both ends of the line.
+
+    Parameters
+    ==========
+    line : str
+        String in the format ``PAPI_L1_ICM  ( id=11, PAPI_L1_ICM, #, UINT64, , Level 1 instruction cache misses. [ L2_RQSTS:ALL_CODE_RD ], INCLUSIVE convertible, cacheable)``
+
+    Returns
+    =======
+    info : dict
+        With keys ``uniq_name``, ``id``, ``disp_name``, ``uom``, ``dtype``,
+        ``url``, ``descr``, ``convertibility`` (the string in the output),
+        ``convertible`` (a bool) and ``cacheable``.
+    """
     start_parens_idx = line.find("(")
-    end_parens_idx = line.find(")")
-    info = line[start_parens_idx + 1 : end_parens_idx].split(",")
-    return Metric(shortname=info[1].strip(), convertibility=info[6].strip())
+    end_parens_idx = line.rfind(")")
+    fields = line[start_parens_idx + 1 : end_parens_idx].split(",")
+    info = [field.strip() for field in fields]
+    return {
+        "uniq_name": info[1],
+        "id": int(info[0].split("=")[1]),
+        "disp_name": line[:start_parens_idx].strip(),
+        "uom": info[2],
+        "dtype": info[3],
+        "url": info[4],
+        "descr": ",".join(fields[5:-2]).strip(),
+        "convertibility": info[-2],
+        "convertible": info[-2] == "INCLUSIVE convertible",
+        "cacheable": info[-1] == "cacheable",
+    }
 
 
 def get_metric_info(lines):
@@ -51,6 +99,80 @@ def get_metric_info(lines):
     return [parse_line(line) for line in lines]
 
 
+@ins.instrumented(counts=lambda table: {"metrics": len(table)})
+def get_metric_table(profile_file, cube_dump_w_text=None):
+    """
+    Gets a table with all the information about the metrics in a ``.cubex``
+    file.
+
+    The information comes from ``cube_dump -w``, except for the metric type
+    (``EXCLUSIVE`` or ``INCLUSIVE``), that is read from ``anchor.xml`` when
+    the file is a readable ``.cubex`` archive (and is ``None`` otherwise).
+
+    Parameters
+    ==========
+    profile_file : str
+        Name of the ``.cubex`` file;
+    cube_dump_w_text : str or None
+        The output of ``cube_dump -w`` for the file, if already available.
+
+    Returns
+    =======
+    res : pandas.DataFrame
+        A DataFrame indexed by the (unique) metric name, with the ``id``,
+        ``disp_name``, ``uom``, ``dtype``, ``url``, ``descr``,
+        ``convertibility``, ``convertible``, ``cacheable`` and ``type``
+        columns.
+    """
+    if cube_dump_w_text is None:
+        cube_dump_w_text = get_cube_dump_w_text(profile_file)
+    table = pd.DataFrame(
+        [parse_line_details(line) for line in get_metric_lines(cube_dump_w_text)]
+    ).set_index("uniq_name")
+
+    try:
+        anchor_table = ca.get_metric_table(ca.read_anchor(profile_file))
+        table["type"] = anchor_table["type"].reindex(table.index)
+    except (OSError, tarfile.TarError, KeyError):
+        table["type"] = None
+    return table
+
+
+def get_ufuncs(metric_table):
+    """
+    Chooses the ``numpy`` ufunc that aggregates each metric along the call
+    tree, according to its data type (see ``reduction_ufuncs``).
+
+    Parameters
+    ==========
+    metric_table : pandas.DataFrame
+        The output of :py:func:`get_metric_table`.
+
+    Returns
+    =======
+    res : dict
+        A dictionary from metric names to ufuncs.
+    """
+    return {
+        metric: reduction_ufuncs.get(dtype, np.add)
+        for metric, dtype in metric_table["dtype"].items()
+    }
+
+
+def get_locally_convertible_metrics(metric_table):
+    """
+    Gets the metrics whose inclusive values can be computed from the
+    exclusive ones (with the ufuncs given by :py:func:`get_ufuncs`), i.e. the
+    ``INCLUSIVE convertible`` ones and the ones with a ``MINDOUBLE`` or
+    ``MAXDOUBLE`` data type.
+    """
+    mask = metric_table["convertible"] | metric_table["dtype"].isin(
+        list(reduction_ufuncs)
+    )
+    return set(metric_table.index[mask])
+
+
+@ins.instrumented(counts=lambda metrics: {"metrics": len(metrics)})
 def get_inclusive_convertible_metrics(profile_file):
     """ This function gets directly as list of metrics that are
     ``INCLUSIVE convertible``.
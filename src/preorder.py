@@ -0,0 +1,217 @@
+"""
+A pre-order ("Euler tour") interval index on the call tree, for fast
+subtree and ancestor queries.
+
+Each cnode gets its position in a depth-first, pre-order traversal of the
+tree (``Entry``), and the position following its last descendant
+(``Exit``): the subtree of a cnode is then the interval ``[Entry, Exit)``,
+and ``a`` is an ancestor of ``b`` if and only if
+``Entry[a] < Entry[b] < Exit[a]``.
+
+If the data is sorted in pre-order (see :py:meth:`PreorderIndex.sort`), the
+rows of a subtree are contiguous, so that
+
+- selecting a subtree is a slice (see :py:meth:`PreorderIndex.subtree`),
+  instead of a walk on the tree followed by ``df.loc[list_of_ids]``;
+- the sum over a subtree is a difference of prefix sums (see
+  :py:meth:`PreorderIndex.prefix_sums` and
+  :py:meth:`PreorderIndex.subtree_sum`), and all the inclusive sums are
+  computed at once with :py:meth:`PreorderIndex.inclusive`.
+
+.. code-block:: python3
+
+    index = preorder.PreorderIndex(output.ctree_df)
+    df = index.sort(output.df)
+    solver = index.subtree(df, cnode_id)
+    index.ancestors(cnode_id)
+"""
+import calltree_conversions as cc
+import numpy as np
+import pandas as pd
+
+
+class PreorderIndex:
+    """
+    Pre-order entry and exit numbers of the cnodes of a call tree.
+
+    The children of each cnode are visited in the order of the rows of
+    ``tree_df``.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree.
+
+    Attributes
+    ----------
+    entry, exit : numpy.ndarray
+        The entry and exit numbers of each row of ``tree_df``;
+    cnode_ids : numpy.ndarray
+        The ``Cnode ID`` of the cnodes, in pre-order;
+    parents : numpy.ndarray
+        The pre-order position of the parent of each cnode, in pre-order
+        (``-1`` for the roots).
+    """
+
+    def __init__(self, tree_df):
+        parents = cc.get_parent_positions(tree_df)
+        levels = tree_df["Level"].to_numpy(dtype=int)
+        n = len(tree_df)
+        sizes = cc.convert_array_to_inclusive(np.ones(n), tree_df).astype(int)
+
+        # a cnode enters after its parent and after the subtrees of its
+        # previous siblings; processed top-down, one level at a time
+        entry = np.zeros(n, dtype=int)
+        by_level = np.argsort(levels, kind="stable")
+        bounds = np.searchsorted(levels[by_level], np.arange(levels.max() + 2))
+        for level in range(levels.max() + 1):
+            positions = by_level[bounds[level] : bounds[level + 1]]
+            group = parents[positions]
+            order = np.argsort(group, kind="stable")
+            positions, group = positions[order], group[order]
+            ends = np.cumsum(sizes[positions])
+            starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+            group_base = np.repeat(
+                np.r_[0, ends][starts], np.diff(np.r_[starts, len(positions)])
+            )
+            offset = ends - sizes[positions] - group_base
+            base = np.where(group >= 0, entry[np.maximum(group, 0)] + 1, 0)
+            entry[positions] = base + offset
+
+        self.tree_df = tree_df
+        self.entry = entry
+        self.exit = entry + sizes
+        self.rows = np.empty(n, dtype=int)
+        self.rows[entry] = np.arange(n)
+        self.cnode_ids = tree_df["Cnode ID"].to_numpy()[self.rows]
+        self.parents = np.where(
+            parents[self.rows] >= 0, entry[np.maximum(parents[self.rows], 0)], -1
+        )
+        self._positions = pd.Index(self.cnode_ids)
+
+    def __len__(self):
+        return len(self.cnode_ids)
+
+    @property
+    def df(self):
+        """
+        A DataFrame indexed by ``Cnode ID`` (in pre-order), with the
+        ``Entry`` and ``Exit`` columns.
+        """
+        return pd.DataFrame(
+            {"Entry": np.arange(len(self)), "Exit": self.exit[self.rows]},
+            index=pd.Index(self.cnode_ids, name="Cnode ID"),
+        )
+
+    def position(self, cnode_id):
+        """
+        The pre-order position (``Entry``) of a cnode.
+        """
+        return self._positions.get_loc(cnode_id)
+
+    def interval(self, cnode_id):
+        """
+        The ``(Entry, Exit)`` interval of the subtree of a cnode.
+        """
+        position = self.position(cnode_id)
+        return position, self.exit[self.rows[position]]
+
+    def subtree_ids(self, cnode_id):
+        """
+        The ``Cnode ID`` of all the cnodes in the subtree of a cnode
+        (including itself), in pre-order.
+        """
+        start, end = self.interval(cnode_id)
+        return self.cnode_ids[start:end]
+
+    def is_ancestor(self, ancestor_id, cnode_id):
+        """
+        Whether a cnode is a (strict) ancestor of another one.
+        """
+        start, end = self.interval(ancestor_id)
+        return start < self.position(cnode_id) < end
+
+    def ancestors(self, cnode_id):
+        """
+        The ``Cnode ID`` of the ancestors of a cnode, from the root to its
+        parent.
+        """
+        res = []
+        position = self.parents[self.position(cnode_id)]
+        while position >= 0:
+            res.append(self.cnode_ids[position])
+            position = self.parents[position]
+        return np.array(res[::-1], dtype=self.cnode_ids.dtype)
+
+    def sort(self, df):
+        """
+        Sorts a DataFrame indexed by ``Cnode ID`` (possibly together with
+        other levels, e.g. ``Thread ID``) in pre-order.
+
+        The resulting index uses the pre-order as the order of the
+        ``Cnode ID`` level, so that the rows of each cnode (and of each
+        subtree) can be found with a binary search.
+        """
+        if df.index.nlevels == 1:
+            return df.reindex(self.cnode_ids[np.isin(self.cnode_ids, df.index)])
+        cnode_codes = self._positions.get_indexer(df.index.get_level_values("Cnode ID"))
+        level = df.index.names.index("Cnode ID")
+        others = [
+            df.index.get_level_values(i).factorize(sort=True)
+            for i in range(df.index.nlevels)
+            if i != level
+        ]
+        codes = [codes for codes, _ in others]
+        order = np.lexsort(codes[::-1] + [cnode_codes])
+        index = pd.MultiIndex(
+            levels=[self.cnode_ids] + [uniques for _, uniques in others],
+            codes=[cnode_codes[order]] + [c[order] for c in codes],
+            names=["Cnode ID"] + [n for i, n in enumerate(df.index.names) if i != level],
+        )
+        return df.iloc[order].set_axis(index, axis="index")
+
+    def subtree(self, df, cnode_id):
+        """
+        Selects the rows of the subtree of a cnode out of a DataFrame sorted
+        with :py:meth:`sort`, as a slice.
+        """
+        start, end = self.interval(cnode_id)
+        first = df.index.get_loc(self.cnode_ids[start])
+        last = df.index.get_loc(self.cnode_ids[end - 1])
+        first = first.start if isinstance(first, slice) else first
+        last = last.stop if isinstance(last, slice) else last + 1
+        return df.iloc[first:last]
+
+    def prefix_sums(self, array):
+        """
+        Computes the prefix sums, along the pre-order, of an array whose
+        first axis runs over the rows of ``tree_df``.
+
+        Returns
+        -------
+        res : numpy.ndarray
+            An array with one more element on the first axis, starting with
+            zeros.
+        """
+        array = np.asarray(array, dtype=float)[self.rows]
+        res = np.zeros((len(array) + 1,) + array.shape[1:])
+        np.cumsum(array, axis=0, out=res[1:])
+        return res
+
+    def subtree_sum(self, prefix, cnode_id):
+        """
+        The sum over the subtree of a cnode, from the output of
+        :py:meth:`prefix_sums`.
+        """
+        start, end = self.interval(cnode_id)
+        return prefix[end] - prefix[start]
+
+    def inclusive(self, array):
+        """
+        Converts an array of exclusive values whose first axis runs over the
+        rows of ``tree_df`` into inclusive values (sums only), as the
+        difference of the prefix sums at the exit and at the entry of each
+        cnode.
+        """
+        prefix = self.prefix_sums(array)
+        return prefix[self.exit] - prefix[self.entry]
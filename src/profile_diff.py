@@ -0,0 +1,308 @@
+"""
+Differential profiles: comparison of two runs (e.g., a baseline and a
+candidate) cnode by cnode.
+
+The call trees of the two runs are aligned structurally: two cnodes are
+matched if they are relative to the same function and their parents are
+matched (i.e., if they have the same call path). Cnodes that are present in
+only one of the runs are kept, with zero values in the other one (since
+the whole subtree of a missing cnode is missing too, this is consistent
+for the inclusive values as well).
+
+All the metrics common to the two runs are compared at once: the data is
+reduced over threads (so that runs with different numbers of threads can
+be compared), converted to inclusive along the aligned tree, and the
+absolute and relative differences are computed on ``(cnode, metric)``
+arrays.
+
+.. code-block:: python3
+
+    diff = diff_profiles(process_cubex("baseline.cubex"),
+                         process_cubex("candidate.cubex"))
+    rank_regressions(diff, "time").head(20)
+"""
+import calltree_conversions as cc
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+from box import Box
+
+thread_statistics = ["sum", "mean", "max"]
+
+
+def align_calltrees(tree_df_a, tree_df_b):
+    """
+    Aligns two call trees, matching the cnodes with the same call path.
+
+    Parameters
+    ----------
+    tree_df_a, tree_df_b : pandas.DataFrame
+        DataFrame representations of the call trees.
+
+    Returns
+    -------
+    res : Box
+        ``tree_df``: a DataFrame representation of the union of the trees,
+        whose ``Cnode ID`` is the index of the aligned cnode ("path"), with
+        the additional ``Cnode ID a`` and ``Cnode ID b`` columns (``-1``
+        where the cnode is missing in a tree); ``paths_a`` and ``paths_b``:
+        the path of each row of ``tree_df_a`` and ``tree_df_b``.
+    """
+    aligned = align_trees([tree_df_a, tree_df_b])
+    tree_df = aligned.tree_df.copy()
+    tree_df["Cnode ID a"], tree_df["Cnode ID b"] = aligned.cnode_ids
+    return Box(tree_df=tree_df, paths_a=aligned.paths[0], paths_b=aligned.paths[1])
+
+
+def align_trees(tree_dfs):
+    """
+    Aligns any number of call trees, matching the cnodes with the same call
+    path.
+
+    The trees are traversed one level at a time, and at each level the pairs
+    (aligned parent, function name) are numbered with ``numpy.unique``, so
+    that the cost is dominated by a sort of the cnodes of each level.
+
+    Parameters
+    ----------
+    tree_dfs : list of pandas.DataFrame
+        DataFrame representations of the call trees.
+
+    Returns
+    -------
+    res : Box
+        ``tree_df``: a DataFrame representation of the union of the trees,
+        whose ``Cnode ID`` is the index of the aligned cnode ("path");
+        ``paths``: for each tree, the path of each of its rows;
+        ``cnode_ids``: an array of shape ``(n_trees, n_paths)`` with the
+        ``Cnode ID`` of each path in each tree (``-1`` where the path is
+        missing; the first cnode, if a path appears more than once).
+    """
+    names = pd.concat([tree["Function Name"] for tree in tree_dfs], ignore_index=True)
+    name_codes, name_uniques = pd.factorize(names)
+    n_names = len(name_uniques)
+    levels = np.concatenate([tree["Level"].to_numpy() for tree in tree_dfs])
+
+    # position of the parent of each row, in the concatenation of the trees
+    offsets = np.cumsum([0] + [len(tree) for tree in tree_dfs])
+    parent_rows = []
+    for tree, offset in zip(tree_dfs, offsets):
+        positions = cc.get_parent_positions(tree)
+        parent_rows.append(np.where(positions >= 0, positions + offset, -1))
+    parent_rows = np.concatenate(parent_rows)
+
+    paths = np.full(len(levels), -1)
+    path_parents = []
+    path_names = []
+    path_levels = []
+    n_paths = 0
+    for level in range(levels.max() + 1):
+        rows = np.flatnonzero(levels == level)
+        parent_paths = np.where(
+            parent_rows[rows] >= 0, paths[np.maximum(parent_rows[rows], 0)], -1
+        )
+        keys = (parent_paths + 1) * n_names + name_codes[rows]
+        uniques, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        paths[rows] = n_paths + inverse
+        path_parents.append(parent_paths[first])
+        path_names.append(name_codes[rows][first])
+        path_levels.append(np.full(len(uniques), level))
+        n_paths += len(uniques)
+
+    tree_paths = [paths[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    cnode_ids = np.full((len(tree_dfs), n_paths), -1)
+    for i, (tree, rows_paths) in enumerate(zip(tree_dfs, tree_paths)):
+        cnode_ids[i, rows_paths[::-1]] = tree["Cnode ID"].to_numpy()[::-1]
+
+    parents = np.concatenate(path_parents)
+    tree_df = pd.DataFrame(
+        {
+            "Function Name": np.asarray(name_uniques)[np.concatenate(path_names)],
+            "Cnode ID": np.arange(n_paths),
+            "Parent Cnode ID": pd.Series(parents).where(parents >= 0).astype("Int64"),
+            "Level": np.concatenate(path_levels),
+        }
+    )
+    return Box(tree_df=tree_df, paths=tree_paths, cnode_ids=cnode_ids)
+
+
+def reduce_over_threads(output, metrics, statistic="sum"):
+    """
+    Reduces the data of an output of ``process_cubex`` over threads, and
+    gets both the exclusive and the inclusive values.
+
+    The metrics aggregated with ``numpy.minimum`` or ``numpy.maximum`` (see
+    :py:func:`metrics.get_ufuncs`) are reduced with the same operation, the
+    others with ``statistic`` (``sum``, ``mean`` or ``max``, e.g. to take the
+    slowest thread).
+
+    Returns
+    -------
+    res : Box
+        ``excl`` and ``incl``: arrays of shape ``(n_cnodes, n_metrics)``,
+        whose rows follow ``output.ctree_df``. The exclusive values of the
+        metrics that are not summed are not defined (``NaN``) when the
+        data in the output is inclusive. ``ufuncs``: the operation used to
+        aggregate each metric.
+    """
+    assert statistic in thread_statistics, f"Unknown statistic {statistic}"
+    tree_df = output.ctree_df
+    ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else {}
+    ufunc = [ufuncs.get(metric, np.add) for metric in metrics]
+    array = ic.to_cnode_array(output.df.loc[:, list(metrics)], tree_df).array
+
+    reduced = np.empty(array.shape[:2])
+    for u in set(ufunc):
+        columns = np.array([i for i, v in enumerate(ufunc) if v is u])
+        if u is np.add and statistic == "max":
+            reduced[:, columns] = array[:, columns].max(axis=-1)
+            continue
+        reduced[:, columns] = u.reduce(array[:, columns], axis=-1)
+        if u is np.add and statistic == "mean":
+            reduced[:, columns] /= array.shape[-1]
+
+    if output.get("exclusive", True):
+        excl = reduced
+        incl = cc.convert_array_to_inclusive(excl, tree_df, ufunc) if len(ufunc) else excl
+    else:
+        incl = reduced
+        excl = cc.convert_array_to_exclusive(incl, tree_df)
+        excl[:, [u is not np.add for u in ufunc]] = np.nan
+    return Box(excl=excl, incl=incl, ufuncs=ufunc)
+
+
+_identities = {np.add: 0.0, np.minimum: np.inf, np.maximum: -np.inf}
+
+
+def merge_paths(values, paths, n_paths, ufuncs, fill=0.0):
+    """
+    Combines the rows of an array relative to cnodes with the same aligned
+    path (see :py:func:`align_trees`), e.g. sibling cnodes of the same
+    function.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        An array of shape ``(n_cnodes, n_metrics)``;
+    paths : numpy.ndarray
+        The path of each cnode;
+    n_paths : int
+        The number of paths;
+    ufuncs : list of numpy.ufunc
+        The operation for each metric (``numpy.add``, ``numpy.minimum`` or
+        ``numpy.maximum``, see :py:func:`reduce_over_threads`);
+    fill : float
+        The value for the paths without cnodes.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        An array of shape ``(n_paths, n_metrics)``.
+    """
+    res = np.empty((n_paths, values.shape[1]))
+    for u in set(ufuncs):
+        columns = np.array([i for i, v in enumerate(ufuncs) if v is u])
+        merged = np.full((n_paths, len(columns)), _identities[u])
+        u.at(merged, paths, values[:, columns])
+        res[:, columns] = merged
+    present = np.zeros(n_paths, dtype=bool)
+    present[paths] = True
+    res[~present] = fill
+    return res
+
+
+def diff_profiles(a, b, metrics=None, statistic="sum"):
+    """
+    Compares two runs, cnode by cnode.
+
+    Parameters
+    ----------
+    a, b : Box
+        The outputs of ``process_cubex`` for the baseline and for the
+        candidate run;
+    metrics : list of str or None
+        The metrics to compare. If ``None``, all the metrics common to the
+        two runs;
+    statistic : str
+        How the values of the threads are reduced: ``sum``, ``mean`` or
+        ``max`` (see :py:func:`reduce_over_threads`).
+
+    Returns
+    -------
+    res : Box
+        - ``tree_df``: the aligned call tree (see
+          :py:func:`align_calltrees`), whose ``Cnode ID`` indexes the rows
+          of all the arrays below;
+        - ``metrics``: the metrics, indexing the columns of the arrays;
+        - ``excl_a``, ``excl_b``, ``incl_a``, ``incl_b``: the exclusive and
+          inclusive values for the two runs (zero for missing cnodes);
+        - ``delta_excl`` and ``delta_incl``: the differences ``b - a``;
+        - ``rel_delta_excl`` and ``rel_delta_incl``: the differences
+          relative to ``a`` (``NaN`` where ``a`` is zero).
+    """
+    if metrics is None:
+        metrics = [metric for metric in a.df.columns if metric in set(b.df.columns)]
+    metrics = list(metrics)
+    aligned = align_calltrees(a.ctree_df, b.ctree_df)
+    n_paths = len(aligned.tree_df)
+
+    res = Box(tree_df=aligned.tree_df, metrics=metrics)
+    for suffix, output, paths in [("a", a, aligned.paths_a), ("b", b, aligned.paths_b)]:
+        reduced = reduce_over_threads(output, metrics, statistic)
+        for kind in ["excl", "incl"]:
+            res[f"{kind}_{suffix}"] = merge_paths(
+                reduced[kind], paths, n_paths, reduced.ufuncs
+            )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for kind in ["excl", "incl"]:
+            delta = res[f"{kind}_b"] - res[f"{kind}_a"]
+            res[f"delta_{kind}"] = delta
+            res[f"rel_delta_{kind}"] = np.where(
+                res[f"{kind}_a"] != 0, delta / res[f"{kind}_a"], np.nan
+            )
+    return res
+
+
+def rank_regressions(diff, metric="time", n=None, inclusive=True):
+    """
+    Ranks the cnodes by the increase of a metric between the two runs.
+
+    Parameters
+    ----------
+    diff : Box
+        The output of :py:func:`diff_profiles`;
+    metric : str
+        The metric;
+    n : int or None
+        The number of cnodes to return (all of them, if ``None``);
+    inclusive : bool
+        Whether to rank by the inclusive (default) or the exclusive
+        difference.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the aligned cnodes (``Cnode ID`` and the columns of
+        ``diff.tree_df``) and the values for the two runs and their
+        differences, sorted by decreasing difference.
+    """
+    column = diff.metrics.index(metric)
+    data = {
+        f"{kind} {suffix}": diff[f"{kind}_{suffix}"][:, column]
+        for kind in ["excl", "incl"]
+        for suffix in ["a", "b"]
+    }
+    for kind in ["excl", "incl"]:
+        data[f"delta {kind}"] = diff[f"delta_{kind}"][:, column]
+        data[f"rel delta {kind}"] = diff[f"rel_delta_{kind}"][:, column]
+
+    df = pd.concat(
+        [diff.tree_df.reset_index(drop=True), pd.DataFrame(data)], axis="columns"
+    )
+    key = "delta incl" if inclusive else "delta excl"
+    order = np.argsort(-df[key].to_numpy(), kind="stable")
+    if n is not None:
+        order = order[:n]
+    return df.iloc[order].set_index("Cnode ID")
@@ -0,0 +1,159 @@
+"""
+Level-of-detail pruning of a call tree, for the visualisation of large
+call trees (e.g., as sunburst or treemap plots).
+
+Given the inclusive values of a metric for each cnode, the cnodes whose
+value is below a threshold (relative to the largest value) are removed, and
+the pruned children of each remaining cnode are collapsed into a single
+synthetic ``other`` node holding the sum of their inclusive values. The
+result is a consistent tree (no cnode is kept without its parent) where the
+inclusive value of each cnode is still the sum of the values of its
+children and of its own exclusive value.
+
+The work that does not depend on the threshold is done once, in
+:py:func:`get_pruning_index`: the cnodes are sorted by decreasing value, so
+that the ``k`` cnodes above any threshold are a prefix of this order and
+:py:func:`prune` costs ``O(k log k)`` instead of ``O(n)``, e.g.
+
+.. code-block:: python3
+
+    index = pruning.get_pruning_index(output.ctree_df, inclusive_time)
+    pruning.prune(index, 0.01)   # fast, can be called for each new threshold
+"""
+import calltree_conversions as cc
+import numpy as np
+import pandas as pd
+from box import Box
+
+OTHER = "other"
+
+
+def get_pruning_index(tree_df, values):
+    """
+    Precomputes what is needed to prune a call tree quickly at any
+    threshold.
+
+    To make sure that the pruned tree is consistent also when the values of
+    a child can be larger than the ones of its parent (e.g., for metrics
+    that are not summed, or in presence of negative values), each cnode is
+    ranked by the minimum of the values along its call path.
+
+    Parameters
+    ----------
+    tree_df : pandas.DataFrame
+        DataFrame representation of the call tree;
+    values : array-like or pandas.Series
+        The inclusive values for each row of ``tree_df``, or a Series
+        indexed by ``Cnode ID``.
+
+    Returns
+    -------
+    res : Box
+        An object to pass to :py:func:`prune`.
+    """
+    if isinstance(values, pd.Series):
+        values = values.reindex(tree_df["Cnode ID"]).fillna(0)
+    values = np.asarray(values, dtype=float)
+    parents = cc.get_parent_positions(tree_df)
+    levels = tree_df["Level"].to_numpy(dtype=int)
+    is_child = parents >= 0
+
+    # minimum along the call path, computed top-down one level at a time;
+    # the roots are always kept
+    rank_values = np.where(is_child, values, np.inf)
+    order = np.argsort(levels, kind="stable")
+    bounds = np.searchsorted(levels[order], np.arange(levels.max() + 2))
+    for level in range(1, levels.max() + 1):
+        positions = order[bounds[level] : bounds[level + 1]]
+        rank_values[positions] = np.minimum(
+            rank_values[positions], rank_values[parents[positions]]
+        )
+
+    children_sum = np.zeros(len(values))
+    np.add.at(children_sum, parents[is_child], values[is_child])
+    n_children = np.bincount(parents[is_child], minlength=len(values))
+
+    order = np.argsort(-rank_values, kind="stable")
+    return Box(
+        tree_df=tree_df,
+        inclusive=values,
+        parents=parents,
+        order=order,
+        sorted_values=rank_values[order],
+        children_sum=children_sum,
+        n_children=n_children,
+        reference=values.max() if len(values) else 0.0,
+    )
+
+
+def prune(index, rel_threshold, value_name="Value"):
+    """
+    Prunes a call tree, keeping only the cnodes whose value is larger than
+    ``rel_threshold`` times the largest value.
+
+    Parameters
+    ----------
+    index : Box
+        The output of :py:func:`get_pruning_index`;
+    rel_threshold : float
+        The threshold, relative to the largest value;
+    value_name : str
+        The name of the column with the values.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The rows of the kept cnodes (with all the columns of the original
+        call tree DataFrame), followed by the ``other`` nodes, with the
+        additional ``value_name`` column and a ``Pruned`` column holding the
+        number of children collapsed in each ``other`` node (``0`` for the
+        kept cnodes). The ``other`` nodes have ``Function Name`` equal to
+        ``"other"`` and a negative ``Cnode ID`` (``-1 - parent``, where
+        ``parent`` is the ``Cnode ID`` of their parent).
+    """
+    threshold = rel_threshold * index.reference
+    # the values are sorted decreasingly
+    n_kept = np.searchsorted(-index.sorted_values, -threshold, side="left")
+    kept = np.sort(index.order[:n_kept])
+
+    parents = index.parents[kept]
+    is_child = parents >= 0
+    kept_parents, inverse = np.unique(parents[is_child], return_inverse=True)
+    kept_sum = np.bincount(inverse, weights=index.inclusive[kept][is_child])
+    kept_count = np.bincount(inverse)
+
+    # kept cnodes (in sorted order) with at least a kept child
+    with_children = np.searchsorted(kept, kept_parents)
+    pruned_sum = index.children_sum[kept]
+    pruned_count = index.n_children[kept].copy()
+    pruned_sum[with_children] -= kept_sum
+    pruned_count[with_children] -= kept_count
+    has_other = pruned_count > 0
+
+    tree_df = index.tree_df
+    kept_df = tree_df.iloc[kept].reset_index(drop=True)
+    kept_df[value_name] = index.inclusive[kept]
+    kept_df["Pruned"] = 0
+
+    parent_ids = kept_df["Cnode ID"].to_numpy()[has_other]
+    other_df = pd.DataFrame(
+        {
+            "Function Name": OTHER,
+            "Cnode ID": -1 - parent_ids,
+            "Parent Cnode ID": parent_ids,
+            "Level": kept_df["Level"].to_numpy()[has_other] + 1,
+            value_name: pruned_sum[has_other],
+            "Pruned": pruned_count[has_other],
+        }
+    )
+    res = pd.concat([kept_df, other_df], ignore_index=True)
+    res["Parent Cnode ID"] = res["Parent Cnode ID"].astype("Int64")
+    return res
+
+
+def prune_calltree(tree_df, values, rel_threshold, value_name="Value"):
+    """
+    Prunes a call tree at a single threshold (see :py:func:`prune` and
+    :py:func:`get_pruning_index`).
+    """
+    return prune(get_pruning_index(tree_df, values), rel_threshold, value_name)
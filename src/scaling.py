@@ -0,0 +1,188 @@
+"""
+Strong and weak scaling analysis across runs with different numbers of
+processes (or threads).
+
+Each run is processed on its own (e.g., with ``process_cubex``), so that
+runs with different numbers of locations can be compared without padding:
+the data of each run is reduced over threads first (see
+:py:func:`profile_diff.reduce_over_threads`), and only the reduced
+``(cnode, metric)`` arrays are put together, on the union of the call
+trees (see :py:func:`profile_diff.align_trees`).
+
+For each cnode and each metric, the following are then computed for all
+the runs at once, with respect to the run with the fewest resources (the
+*baseline*, with ``p0`` resources and value ``t0``):
+
+- ``speedup``: ``t0 / t``;
+- ``efficiency``: for strong scaling, ``(t0 / t) * (p0 / p)``; for weak
+  scaling (where the problem size grows with the resources),
+  ``t0 / t``;
+- ``exponent``: the exponent ``b`` of the power law ``t ~ p^b`` that best
+  fits all the runs (least squares on the logarithms): ``-1`` is perfect
+  strong scaling, ``0`` perfect weak scaling.
+
+.. code-block:: python3
+
+    outputs = [merger.process_cubex(f) for f in files]
+    res = scaling.analyse_scaling(outputs)
+    scaling.scaling_table(res, "time")
+"""
+import numpy as np
+import pandas as pd
+import profile_diff as pdiff
+from box import Box
+
+kinds = ["strong", "weak"]
+
+
+def get_resources(output):
+    """
+    The number of processes (MPI ranks) of a run, from its system tree, or
+    the number of threads if the system tree is not available.
+    """
+    if "system_df" in output:
+        return output.system_df["Rank"].nunique()
+    return len(output.df.index.unique("Thread ID"))
+
+
+def scaling_exponent(resources, values):
+    """
+    Fits the power law ``values ~ resources ^ exponent``, for every column
+    at once.
+
+    Parameters
+    ----------
+    resources : numpy.ndarray
+        The resources for each run, of shape ``(n_runs,)``;
+    values : numpy.ndarray
+        An array of shape ``(n_runs, ...)``. Runs where the value is not
+        positive (or ``NaN``) are ignored in the fit.
+
+    Returns
+    -------
+    res : numpy.ndarray
+        An array of shape ``values.shape[1:]`` with the exponents (``NaN``
+        where fewer than two runs have positive values).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = values > 0
+        log_t = np.where(valid, np.log(np.where(valid, values, 1.0)), 0.0)
+        log_p = np.log(np.asarray(resources, dtype=float)).reshape(
+            (-1,) + (1,) * (values.ndim - 1)
+        )
+        n = valid.sum(axis=0)
+        mean_p = (log_p * valid).sum(axis=0) / n
+        mean_t = log_t.sum(axis=0) / n
+        dp = np.where(valid, log_p - mean_p, 0.0)
+        covariance = (dp * (log_t - mean_t)).sum(axis=0)
+        variance = (dp * dp).sum(axis=0)
+        res = covariance / variance
+    return np.where((n >= 2) & (variance > 0), res, np.nan)
+
+
+def analyse_scaling(outputs, resources=None, metrics=None, kind="strong",
+                    inclusive=True, statistic="mean"):
+    """
+    Computes speedup, parallel efficiency and scaling exponent for every
+    cnode and every metric, across runs.
+
+    Parameters
+    ----------
+    outputs : list of Box
+        The outputs of ``process_cubex`` for the runs;
+    resources : list of int or None
+        The resources (e.g., number of processes) of each run. If ``None``,
+        they are taken from the system trees (see :py:func:`get_resources`);
+    metrics : list of str or None
+        The metrics to analyse. If ``None``, the ones common to all the runs;
+    kind : str
+        ``strong`` (fixed problem size) or ``weak`` (problem size
+        proportional to the resources);
+    inclusive : bool
+        Whether to use inclusive (default) or exclusive values;
+    statistic : str
+        How the values of the threads are reduced (``mean``, the default,
+        ``max`` or ``sum``, see :py:func:`profile_diff.reduce_over_threads`).
+
+    Returns
+    -------
+    res : Box
+        - ``tree_df``: the union of the call trees, whose ``Cnode ID``
+          indexes the second axis of the arrays below;
+        - ``metrics``: the metrics (the last axis of the arrays);
+        - ``resources``: the resources of each run, sorted (the first axis
+          of the arrays);
+        - ``order``: the position of each run in ``outputs``;
+        - ``data``: the reduced values, ``NaN`` where a cnode is missing
+          in a run, of shape ``(n_runs, n_cnodes, n_metrics)``;
+        - ``speedup`` and ``efficiency``: same shape as ``data``;
+        - ``exponent``: of shape ``(n_cnodes, n_metrics)``.
+    """
+    assert kind in kinds, f"Unknown kind {kind}"
+    if resources is None:
+        resources = [get_resources(output) for output in outputs]
+    order = np.argsort(resources, kind="stable")
+    outputs = [outputs[i] for i in order]
+    resources = np.asarray(resources)[order]
+
+    if metrics is None:
+        common = set.intersection(*[set(output.df.columns) for output in outputs])
+        metrics = [metric for metric in outputs[0].df.columns if metric in common]
+    metrics = list(metrics)
+
+    aligned = pdiff.align_trees([output.ctree_df for output in outputs])
+    n_paths = len(aligned.tree_df)
+
+    values = np.full((len(outputs), n_paths, len(metrics)), np.nan)
+    key = "incl" if inclusive else "excl"
+    for i, (output, paths) in enumerate(zip(outputs, aligned.paths)):
+        reduced = pdiff.reduce_over_threads(output, metrics, statistic)
+        values[i] = pdiff.merge_paths(
+            reduced[key], paths, n_paths, reduced.ufuncs, fill=np.nan
+        )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speedup = values[:1] / values
+        if kind == "strong":
+            efficiency = speedup * (resources[0] / resources)[:, None, None]
+        else:
+            efficiency = speedup
+
+    return Box(
+        tree_df=aligned.tree_df,
+        metrics=metrics,
+        resources=resources,
+        order=order,
+        data=values,
+        speedup=speedup,
+        efficiency=efficiency,
+        exponent=scaling_exponent(resources, values),
+    )
+
+
+def scaling_table(res, metric="time"):
+    """
+    Puts the results of :py:func:`analyse_scaling` for a metric in a
+    DataFrame.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID``, with the ``Function Name`` and
+        ``Level`` columns, ``(quantity, resources)`` columns for the data,
+        the speedup and the efficiency, and the ``exponent`` column.
+    """
+    column = res.metrics.index(metric)
+    parts = {
+        quantity: pd.DataFrame(
+            res[quantity][:, :, column].T,
+            columns=pd.Index(res.resources, name="resources"),
+        )
+        for quantity in ["data", "speedup", "efficiency"]
+    }
+    df = pd.concat(parts, axis="columns", names=["quantity"])
+    df[("exponent", "")] = res.exponent[:, column]
+    df.index = pd.Index(res.tree_df["Cnode ID"], name="Cnode ID")
+    info = res.tree_df.set_index("Cnode ID")[["Function Name", "Level"]]
+    info.columns = pd.MultiIndex.from_tuples([(c, "") for c in info.columns])
+    return pd.concat([info, df], axis="columns")
@@ -0,0 +1,526 @@
+"""
+Utilities to generate synthetic profiles, and to produce the same text that
+``cube_dump`` would print for them (``cube_dump -w`` and
+``cube_dump -s csv2``).
+
+Synthetic profiles can be used to test and benchmark the parsing and the
+analysis functions offline, on call trees of arbitrary size, without
+CubeLib or real ``.cubex`` files.
+
+A synthetic profile is a Box containing:
+
+- ``parents``: the position of the parent of each cnode (``-1`` for the
+  root). Cnodes are numbered in depth-first order, and the ``Cnode ID`` is
+  the position;
+- ``levels``: the depth of each cnode;
+- ``function_ids`` and ``functions``: the function of each cnode, and the
+  description of each function (name, paradigm, role, source file...);
+- ``metrics``: the description of each metric (``uniq_name``,
+  ``disp_name``, ``uom``, ``dtype``, ``convertible``);
+- ``data``: a dictionary with the exclusive values for each metric, as
+  ``(n_cnodes, n_threads)`` arrays.
+
+:py:class:`FakeCubeDump` can be set as the ``cube_dump`` runner in
+:py:mod:`cube_file_utils`, so that all the functions reading ``.cubex``
+files (e.g., ``merger.process_multi``) work on synthetic profiles.
+"""
+import ast
+import calltree_conversions as cc
+import cube_file_utils as cfu
+import metrics as mt
+import numpy as np
+import pandas as pd
+from box import Box
+
+MPI_FUNCTIONS = [
+    ("MPI_Init", "env"),
+    ("MPI_Finalize", "env"),
+    ("MPI_Allreduce", "all2all"),
+    ("MPI_Bcast", "one2all"),
+    ("MPI_Send", "point2point"),
+    ("MPI_Recv", "point2point"),
+    ("MPI_Isend", "point2point"),
+    ("MPI_Waitall", "point2point"),
+]
+
+BASE_METRICS = [
+    # uniq_name, disp_name, uom, dtype, convertible
+    ("visits", "Visits", "occ", "UINT64", True),
+    ("time", "Time", "sec", "DOUBLE", True),
+    ("min_time", "Minimum Inclusive Time", "sec", "MINDOUBLE", False),
+    ("max_time", "Maximum Inclusive Time", "sec", "MAXDOUBLE", False),
+]
+
+PAPI_COUNTERS = [
+    "PAPI_TOT_INS",
+    "PAPI_TOT_CYC",
+    "PAPI_L1_DCM",
+    "PAPI_L1_ICM",
+    "PAPI_L2_DCM",
+    "PAPI_LD_INS",
+    "PAPI_SR_INS",
+    "PAPI_BR_INS",
+    "PAPI_FP_OPS",
+    "PAPI_DP_OPS",
+]
+
+
+def generate_tree(n_cnodes, fanout=4, max_depth=None, rng=None):
+    """
+    Generates the shape of a random call tree.
+
+    Cnodes are added one level at a time: each level has at most ``fanout``
+    times the cnodes in the previous one, and each new cnode is attached to
+    a random cnode in the previous level. If ``max_depth`` is reached, all
+    the remaining cnodes are put in the last level.
+
+    Parameters
+    ----------
+    n_cnodes : int
+        Total number of cnodes;
+    fanout : int
+        Average number of children for the non-leaf cnodes;
+    max_depth : int or None
+        Maximum level of a cnode (the root has level 0). ``None`` means
+        unlimited.
+    rng : numpy.random.Generator or None
+        The random number generator to use.
+
+    Returns
+    -------
+    parents : numpy.ndarray
+        The position of the parent of each cnode (``-1`` for the root), with
+        cnodes in depth-first order.
+    levels : numpy.ndarray
+        The level of each cnode.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+
+    # breadth-first construction
+    bfs_parents = [-1]
+    previous_level = np.array([0])
+    nadded = 1
+    depth = 0
+    while nadded < n_cnodes:
+        depth += 1
+        last_level = max_depth is not None and depth >= max_depth
+        nnew = n_cnodes - nadded
+        if not last_level:
+            nnew = min(nnew, len(previous_level) * fanout)
+        new_parents = np.sort(rng.choice(previous_level, size=nnew))
+        bfs_parents.append(new_parents)
+        previous_level = np.arange(nadded, nadded + nnew)
+        nadded += nnew
+    bfs_parents = np.concatenate([np.array([-1])] + bfs_parents[1:]).astype(int)
+
+    # renumbering in depth-first order
+    children = [[] for _ in range(n_cnodes)]
+    for child, parent in enumerate(bfs_parents[1:], start=1):
+        children[parent].append(child)
+    order = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children[node]))
+    order = np.array(order)
+    new_position = np.empty(n_cnodes, dtype=int)
+    new_position[order] = np.arange(n_cnodes)
+
+    parents = np.where(
+        bfs_parents[order] >= 0, new_position[bfs_parents[order]], -1
+    )
+    levels = np.zeros(n_cnodes, dtype=int)
+    for position in range(1, n_cnodes):
+        levels[position] = levels[parents[position]] + 1
+    return parents, levels
+
+
+def generate_functions(n_functions, cpp_templates=False, rng=None):
+    """
+    Generates descriptions for a set of functions: the first ones are MPI
+    functions, the others are "compiler" functions with generated names
+    (C++ functions, possibly templated, if ``cpp_templates`` is True).
+
+    Returns
+    -------
+    functions : list of Box
+        Each with ``name``, ``full_name``, ``template`` (the ``[with ...]``
+        substitutions, or an empty string), ``paradigm``, ``role``, ``file``,
+        ``begin`` and ``end``.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    functions = []
+    for i in range(n_functions):
+        if i < len(MPI_FUNCTIONS) and i < n_functions // 4:
+            name, role = MPI_FUNCTIONS[i]
+            functions.append(
+                Box(name=name, full_name=name, template="", paradigm="mpi",
+                    role=role, file="MPI", begin=-1, end=-1)
+            )
+            continue
+        begin = int(rng.integers(1, 1000))
+        template = ""
+        if not cpp_templates:
+            name = f"func_{i}_"
+            full_name = name
+            source = f"/src/module_{i % 17}.f90"
+        else:
+            name = f"ns{i % 7}::Class{i % 13}::method_{i}"
+            source = f"/src/ns{i % 7}/class{i % 13}.hpp"
+            if i % 2:
+                full_name = f"void {name}(const T&, int)"
+                template = (
+                    f"[with T = Eigen::Matrix<double, -1, {i % 5}, 1>; "
+                    f"Functor = Eigen::internal::assign_op<double>]"
+                )
+            else:
+                full_name = f"double {name}(double, std::vector<double>&)"
+        functions.append(
+            Box(name=name, full_name=full_name, template=template,
+                paradigm="compiler", role="function", file=source,
+                begin=begin, end=begin + int(rng.integers(1, 200)))
+        )
+    return functions
+
+
+def get_function_ids(parents, n_functions, rng):
+    """
+    Assigns a random function to each cnode, with the constraint that
+    sibling cnodes are relative to different functions (as in a real call
+    tree). The root is relative to function 0 (``main``).
+    """
+    # rank of each cnode among its siblings
+    order = np.argsort(parents, kind="stable")
+    sorted_parents = parents[order]
+    group_starts = np.searchsorted(sorted_parents, sorted_parents)
+    ranks = np.empty(len(parents), dtype=int)
+    ranks[order] = np.arange(len(parents)) - group_starts
+
+    offsets = rng.integers(0, n_functions - 1, size=len(parents))
+    function_ids = 1 + (offsets[np.maximum(parents, 0)] + ranks) % (n_functions - 1)
+    function_ids[parents < 0] = 0
+    return function_ids
+
+
+def generate_profile(
+    n_cnodes=1000,
+    n_threads=1,
+    fanout=4,
+    max_depth=None,
+    n_functions=None,
+    cpp_templates=False,
+    n_papi_counters=0,
+    first_papi_counter=0,
+    threads_per_process=1,
+    processes_per_node=None,
+    seed=0,
+):
+    """
+    Generates a synthetic profile.
+
+    Parameters
+    ----------
+    n_cnodes : int
+        Number of cnodes in the call tree;
+    n_threads : int
+        Number of threads (locations);
+    fanout : int
+        Average number of children for the non-leaf cnodes;
+    max_depth : int or None
+        Maximum depth of the call tree;
+    n_functions : int or None
+        Number of distinct functions. If ``None``, ``n_cnodes // 4 + 1``;
+    cpp_templates : bool
+        Whether to use C++ (templated) function names;
+    n_papi_counters : int
+        Number of PAPI counters to add to the base metrics (``visits``,
+        ``time``, ``min_time`` and ``max_time``);
+    first_papi_counter : int
+        Index of the first PAPI counter to use (so that different profiles
+        can have different counters);
+    threads_per_process : int
+        Number of threads in each MPI process, in the system tree;
+    processes_per_node : int or None
+        Number of MPI processes on each node (if ``None``, all the processes
+        are on the same node);
+    seed : int
+        Seed for the random number generator.
+
+    Returns
+    -------
+    profile : Box
+        The synthetic profile (see the module documentation).
+    """
+    rng = np.random.default_rng(seed)
+    n_functions = n_functions if n_functions is not None else n_cnodes // 4 + 1
+
+    parents, levels = generate_tree(n_cnodes, fanout, max_depth, rng)
+    functions = [Box(name="main", full_name="int main(int, char**)", template="",
+                     paradigm="compiler", role="function", file="/src/main.c",
+                     begin=1, end=100)]
+    functions += generate_functions(n_functions, cpp_templates, rng)
+    function_ids = get_function_ids(parents, len(functions), rng)
+
+    metrics = [
+        Box(uniq_name=u, disp_name=d, uom=uom, dtype=dtype, convertible=conv)
+        for u, d, uom, dtype, conv in BASE_METRICS
+    ]
+    papi_names = [
+        PAPI_COUNTERS[i % len(PAPI_COUNTERS)]
+        + (f"_{i // len(PAPI_COUNTERS)}" if i >= len(PAPI_COUNTERS) else "")
+        for i in range(first_papi_counter, first_papi_counter + n_papi_counters)
+    ]
+    metrics += [
+        Box(uniq_name=name, disp_name=name, uom="#", dtype="UINT64",
+            convertible=True)
+        for name in papi_names
+    ]
+
+    shape = (n_cnodes, n_threads)
+    scale = rng.lognormal(mean=-3, sigma=2, size=(n_cnodes, 1))
+    time = scale * rng.uniform(0.5, 1.5, size=shape)
+    visits = rng.integers(1, 100, size=(n_cnodes, 1)) * np.ones(shape, dtype=int)
+    tree_df = get_tree_df(Box(parents=parents, levels=levels))
+    time_incl = cc.convert_array_to_inclusive(time, tree_df)
+    per_visit = time_incl / visits
+    data = {
+        "visits": visits,
+        "time": time,
+        "min_time": per_visit * rng.uniform(0.1, 1.0, size=shape),
+        "max_time": per_visit * rng.uniform(1.0, 2.0, size=shape),
+    }
+    for metric in metrics[len(BASE_METRICS):]:
+        data[metric.uniq_name] = np.floor(time * rng.uniform(1e6, 1e9))
+
+    return Box(
+        {
+            "parents": parents,
+            "levels": levels,
+            "function_ids": function_ids,
+            "functions": functions,
+            "metrics": metrics,
+            "data": data,
+            "n_threads": n_threads,
+            "threads_per_process": threads_per_process,
+            "processes_per_node": processes_per_node,
+        },
+        box_intact_types=(np.ndarray,),
+    )
+
+
+def get_tree_df(profile):
+    """
+    DataFrame representation of the call tree of a synthetic profile, with
+    the ``Cnode ID``, ``Parent Cnode ID`` and ``Level`` columns.
+    """
+    n_cnodes = len(profile.parents)
+    return pd.DataFrame(
+        {
+            "Cnode ID": np.arange(n_cnodes),
+            "Parent Cnode ID": pd.Series(profile.parents, dtype="Int64").mask(
+                profile.parents < 0
+            ),
+            "Level": profile.levels,
+        }
+    )
+
+
+def get_metric_values(profile, metric, exclusive=True):
+    """
+    Exclusive or inclusive values of a metric of a synthetic profile.
+
+    Inclusive values are computed summing over the subtree of each cnode,
+    or taking the minimum/maximum for the ``MINDOUBLE``/``MAXDOUBLE``
+    metrics.
+    """
+    values = profile.data[metric]
+    if exclusive:
+        return values
+    dtype = next(m.dtype for m in profile.metrics if m.uniq_name == metric)
+    ufunc = mt.reduction_ufuncs.get(dtype, np.add)
+    return cc.convert_array_to_inclusive(values, get_tree_df(profile), ufunc)
+
+
+def metric_line(i, metric):
+    """
+    A line of the ``METRIC DIMENSION`` section of ``cube_dump -w``.
+    """
+    convertibility = (
+        "INCLUSIVE convertible" if metric.convertible else "INCLUSIVE not convertible"
+    )
+    return (
+        f"{metric.disp_name}  ( id={i}, {metric.uniq_name}, {metric.uom}, "
+        f"{metric.dtype}, , Synthetic {metric.disp_name}, "
+        f"{convertibility}, cacheable)"
+    )
+
+
+def calltree_line(cnode_id, level, function):
+    """
+    A line of the ``CALL TREE`` section of ``cube_dump -w``.
+    """
+    prefix = "  |" * (level - 1) + "  |-" if level > 0 else ""
+    name = function.full_name
+    if function.template:
+        name += " " + function.template
+    return (
+        f"{prefix}{name}  [ ( id={cnode_id},   mod=), {function.begin}, "
+        f"{function.end}, paradigm={function.paradigm}, role={function.role}, "
+        f"url=, descr=, mode={function.file}]"
+    )
+
+
+def system_lines(n_threads, threads_per_process=1, processes_per_node=None):
+    """
+    Lines of the ``SYSTEM DIMENSION`` section of ``cube_dump -w``, with
+    ``threads_per_process`` threads in each MPI process and
+    ``processes_per_node`` processes on each node (all of them on the same
+    node, if ``None``).
+    """
+    n_processes = -(-n_threads // threads_per_process)
+    if processes_per_node is None:
+        processes_per_node = n_processes
+    lines = ["machine Linux  ( id=0, machine)"]
+    for rank in range(n_processes):
+        node = rank // processes_per_node
+        if rank % processes_per_node == 0:
+            lines.append(f"  |-node node{node:03d}  ( id={node + 1}, node)")
+        lines.append(f"  |  |-MPI Rank {rank}  ( id={rank}, rank={rank}, process)")
+        first = rank * threads_per_process
+        for thread in range(first, min(first + threads_per_process, n_threads)):
+            name = "Master thread" if thread == first else "OMP thread"
+            lines.append(
+                f"  |  |  |-{name}  ( id={thread}, rank={thread - first}, thread)"
+            )
+    return lines
+
+
+def cube_dump_w_text(profile):
+    """
+    Text that ``cube_dump -w`` would produce for a synthetic profile.
+    """
+    sep = "=" * 30
+    lines = [f"{sep} METRIC DIMENSION {sep}", ""]
+    lines += [metric_line(i, metric) for i, metric in enumerate(profile.metrics)]
+    lines += ["", f"{sep} CALLTREE DIMENSION {sep}", "", "CALL TREE", ""]
+    lines += [
+        calltree_line(cnode_id, level, profile.functions[function_id])
+        for cnode_id, (level, function_id) in enumerate(
+            zip(profile.levels, profile.function_ids)
+        )
+    ]
+    lines += ["", f"{sep} SYSTEM DIMENSION {sep}", ""]
+    lines += system_lines(
+        profile.n_threads, profile.threads_per_process, profile.processes_per_node
+    )
+    return "\n".join(lines) + "\n"
+
+
+def cube_dump_csv_text(profile, exclusive=True, metrics=None):
+    """
+    Text that ``cube_dump -m <metrics> -x excl -z <excl|incl> -c all -s csv2``
+    would produce for a synthetic profile.
+
+    Parameters
+    ----------
+    profile : Box
+        The synthetic profile;
+    exclusive : bool
+        Whether to produce exclusive (True) or inclusive (False) data;
+    metrics : list of str or None
+        The metrics to include (``None`` means all).
+    """
+    metrics = (
+        metrics if metrics is not None else [m.uniq_name for m in profile.metrics]
+    )
+    n_cnodes = len(profile.parents)
+    columns = {
+        "Cnode ID": np.repeat(np.arange(n_cnodes), profile.n_threads),
+        "Thread ID": np.tile(np.arange(profile.n_threads), n_cnodes),
+    }
+    for metric in metrics:
+        columns[metric] = get_metric_values(profile, metric, exclusive).ravel()
+    return pd.DataFrame(columns).to_csv(index=False)
+
+
+SPEC_PREFIX = "synthetic:"
+
+
+def parse_spec(profile_file):
+    """
+    Reads the parameters for :py:func:`generate_profile` from a file name
+    like ``synthetic:n_cnodes=1000,n_threads=10,cpp_templates=True``.
+    """
+    spec = profile_file[len(SPEC_PREFIX):]
+    kwargs = {}
+    for item in filter(None, spec.split(",")):
+        key, value = item.split("=")
+        kwargs[key.strip()] = ast.literal_eval(value.strip())
+    return kwargs
+
+
+class FakeCubeDump:
+    """
+    Pure-Python stand-in for the ``cube_dump`` executable, producing the
+    output of ``cube_dump -w`` and ``cube_dump -s csv2`` for synthetic
+    profiles.
+
+    The profile files it knows about are either registered with
+    :py:meth:`add`, or have a name starting with ``synthetic:`` followed by
+    the parameters for :py:func:`generate_profile` (see
+    :py:func:`parse_spec`).
+
+    Examples
+    --------
+    >>> fake = FakeCubeDump()
+    >>> fake.add("run1.cubex", n_cnodes=10000, n_threads=100)
+    >>> with cfu.use_cube_dump_runner(fake):
+    ...     output = merger.process_cubex("run1.cubex")
+    """
+
+    def __init__(self, profiles=None):
+        self.profiles = dict(profiles) if profiles is not None else {}
+        self.calls = []
+
+    def add(self, profile_file, profile=None, **kwargs):
+        """
+        Registers a profile under the name ``profile_file``. If ``profile``
+        is not given, it is generated passing ``kwargs`` to
+        :py:func:`generate_profile`.
+        """
+        if profile is None:
+            profile = generate_profile(**kwargs)
+        self.profiles[profile_file] = profile
+        return profile
+
+    def get_profile(self, profile_file):
+        """
+        The profile for a file name, generating it if needed.
+        """
+        if profile_file not in self.profiles:
+            if not profile_file.startswith(SPEC_PREFIX):
+                raise cfu.CubeDumpException(
+                    f"Unknown synthetic profile file: {profile_file}"
+                )
+            self.add(profile_file, **parse_spec(profile_file))
+        return self.profiles[profile_file]
+
+    def __call__(self, args):
+        """
+        Returns the output of ``cube_dump`` for the given arguments.
+        Only ``-w`` and the ``-m``, ``-x``, ``-z``, ``-c``, ``-s csv2``
+        options are supported.
+        """
+        self.calls.append(list(args))
+        profile = self.get_profile(args[-1])
+        if "-w" in args:
+            return cube_dump_w_text(profile)
+
+        options = dict(zip(args[:-1:2], args[1:-1:2]))
+        if options.get("-s") != "csv2":
+            raise cfu.CubeDumpException(f"Unsupported arguments: {args}")
+        metrics = options.get("-m", "all")
+        metrics = None if metrics == "all" else metrics.split(",")
+        exclusive = options.get("-z", "incl") == "excl"
+        return cube_dump_csv_text(profile, exclusive, metrics)
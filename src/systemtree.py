@@ -0,0 +1,320 @@
+"""
+Utilities to read the system tree (machine, nodes, processes and threads)
+and to aggregate the data over its levels.
+
+The system tree is represented as a DataFrame with one row per location
+(thread), indexed by ``Thread ID`` (the same as in the data read with
+``cube_dump``), whose columns give, for each thread, the process and the
+node it belongs to:
+
+- ``Thread Name`` and ``Thread Rank`` (the rank of the thread in its
+  process);
+- ``Rank`` and ``Process Name``: the MPI rank of the process;
+- ``Node ID`` (an integer, numbering the nodes in order of appearance) and
+  ``Node Name``;
+- ``Machine Name``.
+
+It can be read from ``anchor.xml`` (see :py:func:`system_df_from_anchor`)
+or from the ``SYSTEM DIMENSION`` section of the output of ``cube_dump -w``
+(see :py:func:`system_df_from_lines`).
+
+With it, the data can be aggregated per process or per node (see
+:py:func:`aggregate_df` and :py:func:`aggregate_output`), e.g.
+
+.. code-block:: python3
+
+    output = merger.process_cubex("profile.cubex")
+    per_rank = systemtree.aggregate_output(output, level="process")
+    per_node = systemtree.aggregate_output(output, level="node", mean=True)
+"""
+import re
+import tarfile
+import xml.etree.ElementTree as ET
+
+import cubex_archive as ca
+import index_conversions as ic
+import metrics as mt
+import numpy as np
+import pandas as pd
+from box import Box
+from tree_parsing import level_fun
+
+# index level of the aggregated data, for each level of the system tree
+levels = {"thread": "Thread ID", "process": "Rank", "node": "Node ID"}
+
+columns = [
+    "Thread ID",
+    "Thread Name",
+    "Thread Rank",
+    "Rank",
+    "Process Name",
+    "Node ID",
+    "Node Name",
+    "Machine Name",
+]
+
+
+def _make_system_df(rows):
+    df = pd.DataFrame(rows, columns=columns)
+    df["Node ID"], _ = pd.factorize(df["Node ID"])
+    return df.set_index("Thread ID").sort_index()
+
+
+def system_df_from_anchor(anchor):
+    """
+    Reads the system tree out of ``anchor.xml``.
+
+    Parameters
+    ----------
+    anchor : xml.etree.ElementTree.Element
+        The root element of ``anchor.xml`` (see
+        :py:func:`cubex_archive.read_anchor`).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The system tree DataFrame (see the module documentation).
+    """
+    rows = []
+
+    def visit(element, machine, node):
+        if element.tag == "systemtreenode":
+            kind = element.findtext("class")
+            name = element.findtext("name")
+            if machine is None or kind == "machine":
+                machine = name
+            if kind == "node":
+                node = (element.get("Id"), name)
+        for group in element.findall("locationgroup"):
+            # processes directly under the machine are on an unnamed node
+            group_node = node if node is not None else (element.get("Id"), "")
+            for location in group.findall("location"):
+                rows.append(
+                    (
+                        int(location.get("Id")),
+                        location.findtext("name"),
+                        int(location.findtext("rank")),
+                        int(group.findtext("rank")),
+                        group.findtext("name"),
+                        group_node[0],
+                        group_node[1],
+                        machine,
+                    )
+                )
+        for child in element.findall("systemtreenode"):
+            visit(child, machine, node)
+
+    for root in anchor.find("system").findall("systemtreenode"):
+        visit(root, None, None)
+    return _make_system_df(rows)
+
+
+def get_system_tree_lines(cube_dump_w_text):
+    """
+    Select the lines relative to the system tree out of the output of
+    ``cube_dump -w``.
+    """
+    all_lines = cube_dump_w_text.split("\n")
+    start = next(i for i, l in enumerate(all_lines) if "SYSTEM DIMENSION" in l)
+    lines = []
+    for line in all_lines[start + 1 :]:
+        if line.startswith("====="):
+            break
+        if "id=" in line:
+            lines.append(line)
+    return lines
+
+
+def parse_system_line(line):
+    """
+    Parses a line of the system tree in the output of ``cube_dump -w``.
+
+    INPUT:
+    '  |  |-MPI Rank 3  ( id=3, rank=3, process)'
+    OUTPUT:
+    Box with level=2, name='MPI Rank 3', id=3, rank=3, kind='process'
+    """
+    match = re.search(r"^(?:[\s|]*\|-)?\s*(.*?)\s*\((.*)\)\s*$", line)
+    name, info = match.groups()
+    entries = [entry.strip() for entry in info.split(",")]
+    attrs = dict(entry.split("=", 1) for entry in entries if "=" in entry)
+    kinds = [entry for entry in entries if entry and "=" not in entry]
+    return Box(
+        level=level_fun(line),
+        name=name,
+        id=int(attrs["id"]),
+        rank=int(attrs["rank"]) if "rank" in attrs else None,
+        kind=kinds[-1] if kinds else None,
+    )
+
+
+def system_df_from_lines(lines):
+    """
+    Reads the system tree out of the ``SYSTEM DIMENSION`` lines of the
+    output of ``cube_dump -w`` (see :py:func:`get_system_tree_lines`).
+
+    The deepest lines are the locations (threads), and their parents the
+    processes. The node of a process is its closest ancestor of kind
+    ``node`` (or its parent, if there is none), and the machine is the root.
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        The system tree DataFrame (see the module documentation).
+    """
+    parsed = [parse_system_line(line) for line in lines]
+    deepest = max(item.level for item in parsed)
+    rows = []
+    ancestors = []
+    for item in parsed:
+        del ancestors[item.level :]
+        if item.level == deepest:
+            process = ancestors[-1]
+            nodes = [a for a in ancestors[:-1] if a.kind == "node"]
+            node = nodes[-1] if nodes else ancestors[-2] if len(ancestors) > 1 else process
+            rows.append(
+                (
+                    item.id,
+                    item.name,
+                    item.rank if item.rank is not None else 0,
+                    process.rank if process.rank is not None else process.id,
+                    process.name,
+                    node.id,
+                    node.name,
+                    ancestors[0].name,
+                )
+            )
+        ancestors.append(item)
+    return _make_system_df(rows)
+
+
+def get_system_df(profile_file, cube_dump_w_text=None):
+    """
+    Reads the system tree of a profile, from ``anchor.xml`` if possible, or
+    else from the output of ``cube_dump -w``.
+    """
+    try:
+        return system_df_from_anchor(ca.read_anchor(profile_file))
+    except (OSError, tarfile.TarError, KeyError, ET.ParseError):
+        if cube_dump_w_text is None:
+            raise
+        return system_df_from_lines(get_system_tree_lines(cube_dump_w_text))
+
+
+def reduce_locations(array, codes, ufunc=np.add):
+    """
+    Aggregates the last axis of an array by groups, with ``reduceat``.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        An array whose last axis runs over threads;
+    codes : numpy.ndarray
+        The group (e.g., the rank) of each thread;
+    ufunc : numpy.ufunc or list of numpy.ufunc
+        The operation used to aggregate the values. A list gives one
+        ufunc for each element of the second axis (e.g., for each metric
+        in an array from :py:func:`index_conversions.to_cnode_array`).
+
+    Returns
+    -------
+    res : numpy.ndarray
+        The aggregated array, whose last axis runs over the groups;
+    groups : numpy.ndarray
+        The (sorted) groups;
+    counts : numpy.ndarray
+        The number of threads in each group.
+    """
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = np.asarray(codes)[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    groups = sorted_codes[starts]
+    counts = np.diff(np.r_[starts, len(sorted_codes)])
+    array = array[..., order]
+
+    if not isinstance(ufunc, (list, tuple)):
+        return ufunc.reduceat(array, starts, axis=-1), groups, counts
+
+    res = np.empty(array.shape[:-1] + (len(groups),), dtype=array.dtype)
+    ufuncs = np.array(ufunc, dtype=object)
+    for u in set(ufunc):
+        columns = np.flatnonzero(ufuncs == u)
+        res[:, columns] = u.reduceat(array[:, columns], starts, axis=-1)
+    return res, groups, counts
+
+
+def aggregate_df(df, system_df, level="process", ufuncs=None, mean=False):
+    """
+    Aggregates the data of the threads for each process or node.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A DataFrame indexed by ``Cnode ID`` and ``Thread ID`` (e.g., ``df``
+        in the output of ``process_cubex``);
+    system_df : pandas.DataFrame
+        The system tree DataFrame;
+    level : str
+        ``process`` or ``node`` (or ``thread``, for no aggregation);
+    ufuncs : dict or None
+        The ufunc for each metric (see :py:func:`metrics.get_ufuncs`), e.g.
+        to take the minimum of ``min_time``. The metrics that are not in the
+        dictionary are summed;
+    mean : bool
+        Whether to divide the sums by the number of threads in each group
+        (the metrics aggregated with other ufuncs are not affected).
+
+    Returns
+    -------
+    res : pandas.DataFrame
+        A DataFrame with the same columns as ``df``, indexed by ``Cnode ID``
+        and by ``Rank`` (for ``level="process"``) or ``Node ID`` (for
+        ``level="node"``).
+    """
+    assert level in levels, f"Unknown level: {level}"
+    cnode_array = ic.to_cnode_array(df)
+    thread_ids = np.asarray(cnode_array.others)
+    codes = system_df[levels[level]].to_numpy() if level != "thread" else system_df.index
+    codes = pd.Series(codes, index=system_df.index).loc[thread_ids].to_numpy()
+
+    metrics = (
+        df.columns.get_level_values("metric")
+        if "metric" in df.columns.names
+        else df.columns
+    )
+    ufunc = [(ufuncs or {}).get(metric, np.add) for metric in metrics]
+    res, groups, counts = reduce_locations(cnode_array.array, codes, ufunc)
+    if mean:
+        summed = np.array([u is np.add for u in ufunc], dtype=bool)
+        res[:, summed] = res[:, summed] / counts
+
+    n_cnodes, n_columns, n_groups = res.shape
+    index = pd.MultiIndex.from_product(
+        [cnode_array.cnode_ids, groups], names=["Cnode ID", levels[level]]
+    )
+    return pd.DataFrame(
+        data=res.transpose(0, 2, 1).reshape(n_cnodes * n_groups, n_columns),
+        index=index,
+        columns=df.columns,
+    )
+
+
+def aggregate_output(output, level="process", mean=False):
+    """
+    Aggregates the data in the output of ``process_cubex`` or
+    ``process_multi`` for each process or node (see :py:func:`aggregate_df`),
+    using the system tree in ``output.system_df`` and the ufuncs given by the
+    data type of each metric.
+
+    Returns
+    -------
+    res : Box
+        A copy of ``output``, where the data (``df``, or ``common`` and
+        ``noncommon``) is aggregated.
+    """
+    ufuncs = mt.get_ufuncs(output.metrics) if "metrics" in output else None
+    res = Box(output)
+    for key in ["df", "common", "noncommon"]:
+        if key in output:
+            res[key] = aggregate_df(output[key], output.system_df, level, ufuncs, mean)
+    return res
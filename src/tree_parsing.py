@@ -1,6 +1,7 @@
 """
 General utilities for parsing a list of lines into a hierarchical structure.
 """
+import numpy as np
 
 
 def level_fun(line):
@@ -75,6 +76,42 @@ def collect_hierarchy(
     return assemble_fun(root, children)
 
 
+def parent_positions(levels):
+    """
+    Finds the parent of each line from the levels of all the lines (see
+    :py:func:`level_fun`), without recursion: as in
+    :py:func:`collect_hierarchy`, the parent of a line is the last previous
+    line one level above it.
+
+    The lines are grouped by level: the parents of the lines at a level are
+    found with a binary search on the positions of the lines at the level
+    above.
+
+    Parameters
+    ----------
+    levels : numpy.ndarray
+        The level of each line.
+
+    Returns
+    -------
+    parents : numpy.ndarray
+        The position of the parent of each line (``-1`` if there is none).
+    """
+    levels = np.asarray(levels, dtype=int)
+    parents = np.full(len(levels), -1)
+    if len(levels) == 0:
+        return parents
+    # positions sorted by level, and by position within each level
+    order = np.argsort(levels, kind="stable")
+    bounds = np.searchsorted(levels[order], np.arange(levels.max() + 2))
+    for level in range(levels.min() + 1, levels.max() + 1):
+        above = order[bounds[level - 1] : bounds[level]]
+        lines = order[bounds[level] : bounds[level + 1]]
+        found = np.searchsorted(above, lines) - 1
+        parents[lines] = np.where(found >= 0, above[np.maximum(found, 0)], -1)
+    return parents
+
+
 # FOR TESTING
 
 
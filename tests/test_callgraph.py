@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import callgraph as cg
+import test_utils as tu
+import numpy as np
+
+
+def test_call_graph_nodes():
+    output = tu.get_small_output()
+    graph = cg.build_call_graph(output)
+    nodes = graph.nodes.set_index("Function Name")
+    assert graph.metrics == ["time", "visits"]
+    assert nodes.loc["bar", "Cnodes"] == 2
+    assert nodes.loc["foo", "Recursive"] and not nodes.loc["bar", "Recursive"]
+    assert nodes.loc["bar", "Calls"] == 4.0
+    assert nodes.loc["bar", "time excl"] == 14.0
+    # recursive call foo -> foo is counted only once
+    assert nodes.loc["foo", "time incl"] == 12.0
+    assert nodes.loc["main", "time incl"] == 27.0
+
+
+def test_call_graph_edges():
+    output = tu.get_small_output()
+    graph = cg.build_call_graph(output)
+    edges = graph.edges
+    assert len(edges) == 5  # main->foo, main->bar, main->MPI_Send, foo->foo, foo->bar
+    assert np.isclose(edges.time.sum() - edges.time[edges.Caller == "foo"].sum(),
+                      27.0 - 2.0)
+
+    to_bar = cg.callers(graph, "bar")
+    assert set(to_bar.index) == {"main", "foo"}
+    assert to_bar.loc["main", "time"] == 10.0 and to_bar.loc["foo", "time"] == 4.0
+
+    from_foo = cg.callees(graph, "foo", sort_by="time")
+    assert list(from_foo.index) == ["bar", "foo"]
+    # the recursive call is counted in the calls, not in the inclusive time
+    assert from_foo.loc["foo", "Calls"] == 2.0
+    assert from_foo.loc["foo", "time"] == 0.0
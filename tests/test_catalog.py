@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import catalog as cl
+import cube_file_utils as cfu
+import funcwise as fw
+import merger as mg
+import synthetic as sy
+import numpy as np
+
+FILES = [f"synthetic:n_cnodes=120,n_threads={n},seed={seed}"
+         for seed, n in enumerate([2, 4, 4])]
+
+
+def test_catalog(tmp_path):
+    fake = sy.FakeCubeDump()
+    path = str(tmp_path / "catalog.sqlite")
+    with cfu.use_cube_dump_runner(fake):
+        with cl.Catalog(path) as catalog:
+            for f in FILES:
+                catalog.ingest(f, tags=dict(nproc=f.split("n_threads=")[1][0]))
+            n_calls = len(fake.calls)
+            catalog.ingest(FILES[0])
+            assert len(fake.calls) == n_calls
+        output = mg.process_cubex(FILES[1])
+
+    with cl.Catalog(path) as catalog:
+        files = catalog.files()
+        assert list(files.path) == FILES
+        assert list(files.nproc) == ["2", "4", "4"]
+        assert list(files.n_threads) == [2, 4, 4]
+
+        # per-cnode statistics
+        mean = catalog.cnode_values(FILES[1], ["time"])
+        ref = output.df.time.groupby("Cnode ID").mean()
+        assert np.allclose(mean.time, ref.loc[mean.index])
+        incl = catalog.cnode_values(FILES[1], ["time"], inclusive=True, statistic="sum")
+        assert np.isclose(incl.time.loc[0], output.df.time.sum())
+
+        # cross-experiment query on a function
+        function = output.ctree_df["Function Name"].iloc[5]
+        res = catalog.function_values(function, "time", tags=dict(nproc=4))
+        assert FILES[1] in res.index and FILES[0] not in res.index
+        cnodes = output.ctree_df["Cnode ID"][output.ctree_df["Function Name"] == function]
+        ref = output.df.time.groupby("Cnode ID").sum().loc[cnodes].sum()
+        assert np.isclose(res.loc[FILES[1], "sum"], ref)
+        assert res.loc[FILES[1], "cnodes"] == len(cnodes)
+
+        # the inclusive values inside recursive calls are counted only once
+        tree_df = output.ctree_df
+        recursive = fw.get_recursion_mask(tree_df)
+        function = tree_df["Function Name"][recursive].iloc[0]
+        res = catalog.function_values(function, "time", inclusive=True)
+        ref = fw.aggregate_by_function(output.df[["time"]], tree_df, inclusive=True)
+        assert np.isclose(res.loc[FILES[1], "sum"], ref.time.loc[function].sum())
+        is_function = tree_df["Function Name"] == function
+        assert res.loc[FILES[1], "cnodes"] == (is_function & ~recursive).sum()
+        assert (is_function & recursive).any()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+import calltree_conversions as cc
+import index_conversions as ic
+import test_utils as tu
+import numpy as np
+
+
+def test_convert_array_to_inclusive():
+    '''
+    Checks the vectorized conversion against the recursive one, and that
+    the conversion to exclusive is its inverse.
+    '''
+    output = tu.get_small_output()
+    tree_df = output.ctree_df
+
+    res = ic.to_cnode_array(output.df, tree_df)
+    assert res.array.shape == (6, 2, 2)
+    assert list(res.cnode_ids) == list(tree_df['Cnode ID'])
+
+    incl = cc.convert_array_to_inclusive(res.array, tree_df)
+    reference = cc.convert_df_to_inclusive(output.df, output.ctree).sort_index()
+    reference = ic.to_cnode_array(reference, tree_df).array
+    assert np.allclose(incl, reference)
+
+    excl = cc.convert_array_to_exclusive(incl, tree_df)
+    assert np.allclose(excl, res.array)
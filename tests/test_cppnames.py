@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import cppnames as cn
+import test_utils as tu
+import numpy as np
+import pandas as pd
+
+TEMPLATE_FULL_NAME = (
+    "void Eigen::internal::call_dense_assignment_loop(const DstXprType&, "
+    "const SrcXprType&, const Functor&) [with DstXprType = "
+    "Eigen::Matrix<double, -1, -1, 1>; Functor = Eigen::internal::assign_op<double>]"
+)
+
+
+def test_normalise_name():
+    assert cn.normalise_name(TEMPLATE_FULL_NAME) == \
+        "Eigen::internal::call_dense_assignment_loop"
+    assert cn.normalise_name(TEMPLATE_FULL_NAME, params_depth=1) == \
+        ("Eigen::internal::call_dense_assignment_loop"
+         "(const DstXprType&,const SrcXprType&,const Functor&)")
+    assert cn.normalise_name(TEMPLATE_FULL_NAME, keep_subs=True).endswith(
+        "call_dense_assignment_loop [with DstXprType = "
+        "Eigen::Matrix<double, -1, -1, 1>; Functor = Eigen::internal::assign_op<double>]")
+
+    name = "A<B<int>, C>::f(std::vector<int> (*)(int)) const"
+    assert cn.normalise_name(name) == "A::f"
+    assert cn.normalise_name(name, template_depth=1) == "A<B,C>::f"
+    assert cn.normalise_name(name, template_depth=2) == "A<B<int>,C>::f"
+    assert cn.normalise_name(name, params_depth=1) == "A::f(std::vector) const"
+
+    assert cn.normalise_name("virtual SolverPetsc::~SolverPetsc()") == \
+        "SolverPetsc::~SolverPetsc"
+    assert cn.normalise_name("virtual SolverPetsc::~SolverPetsc()", keep_return=True) == \
+        "virtual SolverPetsc::~SolverPetsc"
+    assert cn.normalise_name("bool operator<(const A&, const A&)") == "operator<"
+    assert cn.normalise_name("std::map<int, int>::operator[](const int&)") == \
+        "std::map::operator[]"
+    assert cn.normalise_name("(anonymous namespace)::helper(int)") == \
+        "(anonymous namespace)::helper"
+    assert cn.normalise_name("MPI_Send") == "MPI_Send"
+
+
+def get_template_output():
+    '''
+    The small output, where foo and bar are instantiations of templates.
+    '''
+    output = tu.get_small_output()
+    names = {1: "Foo<int>::run", 2: "Foo<double>::run",
+             3: "Bar<Foo<int> >::f", 4: "Bar<Foo<float> >::f"}
+    tree_df = output.ctree_df.copy()
+    tree_df["Function Name"] = [names.get(cnode_id, name) for cnode_id, name in
+                                zip(tree_df["Cnode ID"], tree_df["Function Name"])]
+    tree_df["Function ID"], _ = pd.factorize(tree_df["Function Name"])
+    output.ctree_df = tree_df
+    return output
+
+
+def test_name_groups():
+    tree_df = get_template_output().ctree_df
+    groups = cn.get_name_groups(tree_df)
+    assert list(groups.names) == ["main", "Foo::run", "Bar::f", "MPI_Send"]
+    assert list(groups.sizes) == [1, 2, 2, 1]
+    assert list(groups.names[groups.ids]) == \
+        ["main", "Foo::run", "Foo::run", "Bar::f", "Bar::f", "MPI_Send"]
+
+    groups = cn.get_name_groups(tree_df, template_depth=1)
+    assert list(groups.names) == ["main", "Foo<int>::run", "Foo<double>::run",
+                                  "Bar<Foo>::f", "MPI_Send"]
+
+
+def test_aggregate_by_name():
+    output = get_template_output()
+    groups = cn.get_name_groups(output.ctree_df)
+    excl = cn.aggregate_by_name(output.df, output.ctree_df, groups)
+    assert excl.index.names == ["Normalised Name", "Thread ID"]
+    time = excl.time.groupby("Normalised Name").sum()
+    assert dict(time) == {"main": 2.0, "Foo::run": 8.0, "Bar::f": 14.0,
+                          "MPI_Send": 3.0}
+
+    # the inner Foo<double>::run is counted only in Foo<int>::run
+    incl = cn.aggregate_by_name(output.df, output.ctree_df, groups,
+                                inclusive=True)
+    assert incl.time[("Foo::run", 0)] == 6.0
+    assert incl.time[("Bar::f", 0)] == 8.0
+
+    top = cn.top_names(output.df, output.ctree_df, "time", k=2, groups=groups)
+    assert list(top.index) == ["Bar::f", "Foo::run"]
+    assert list(top) == [14.0, 8.0]
+
+
+def test_top_names_max():
+    output = get_template_output()
+    groups = cn.get_name_groups(output.ctree_df)
+    # time as if it were a MAXDOUBLE metric: the maximum over the cnodes of
+    # each group and over the threads
+    top = cn.top_names(output.df, output.ctree_df, "time", k=3, groups=groups,
+                       ufuncs={"time": np.maximum})
+    assert list(top.index) == ["Bar::f", "Foo::run", "MPI_Send"]
+    assert list(top) == [5.0, 4.0, 2.5]
@@ -44,3 +44,8 @@ def test_node_cpp_template(f):
     assert node_cpp_template.template_subs["SrcXprType"] == "Eigen::Matrix<double, -1, -1>"
     assert node_cpp_template.template_subs["Functor"] == "Eigen::internal::assign_op<double>"
 
+
+def test_line_range():
+    for l, f in zip(lines, funs):
+        node = f(l)
+        assert (node.begin, node.end) in [(-1, -1), (13, 20), (632, 646)]
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import cubepl as cp
+import test_utils as tu
+import numpy as np
+import pytest
+from box import Box
+from test_utils import SINGLE_FILES
+
+SPEC = "synthetic:n_cnodes=200,n_threads=3,n_papi_counters=2"
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    return tu.get_synthetic_output(SPEC, mode="both"), tu.get_synthetic_profile(SPEC)
+
+
+@pytest.mark.parametrize("profile_file", SINGLE_FILES)
+def test_parse_remapping_spec(profile_file):
+    '''
+    Parses all the CubePL code in the ``remapping.spec`` of the test files.
+    '''
+    definitions = cp.read_remapping_spec(profile_file)
+    names = [d.uniq_name for d in definitions]
+    assert "execution" in names and "mpi" in names and "comp" in names
+    for definition in definitions:
+        assert definition.type in cp.derived_types
+        cp.parse(definition.cubepl)
+        if definition.cubeplinit:
+            cp.parse(definition.cubeplinit)
+
+
+def test_expressions(outputs):
+    output, _ = outputs
+    code = '''
+    {
+        ${a} = 2 ^ 3 * -1 + 10 / 4;
+        if ( "MPI_Send" =~ /^MPI_(Send|Recv)$/ and not ( 1 > 2 ) )
+        { ${b} = max(${a}, 0) + 1; }
+        elseif ( 1 == 1 ) { ${b} = 100; }
+        else { ${b} = 1000; };
+        if ( ${calculation::callpath::id} < 10 ) { return -1; };
+        return ${b} + abs(${a});
+    }
+    '''
+    df = cp.compute_derived_metrics(output.excl, [cp.derived_metric("x", code)])
+    cnode_ids = df.index.get_level_values("Cnode ID")
+    assert (df.x[cnode_ids < 10] == -1).all()
+    assert (df.x[cnode_ids >= 10] == 1 + 5.5).all()
+
+
+def test_remapping_spec_metrics(outputs):
+    '''
+    Evaluates the standard Score-P derived metrics on a synthetic profile,
+    and checks them against the values computed from the generated data.
+    '''
+    output, profile = outputs
+    definitions = cp.read_remapping_spec(SINGLE_FILES[0])
+    excl = cp.compute_derived_metrics(
+        output.excl, definitions, missing_metrics="zero"
+    )
+    incl = cp.compute_derived_metrics(
+        output.incl, definitions, names=["execution", "mpi", "comp"],
+        missing_metrics="zero",
+    )
+    # metrics disabled in the initialisation are not computed
+    assert "cuda_time" not in excl.columns
+
+    is_mpi = np.array([profile.functions[f].paradigm == "mpi"
+                       for f in profile.function_ids])
+    time = profile.data.time
+    mpi = excl.mpi.to_numpy().reshape(time.shape)
+    assert np.allclose(mpi, np.where(is_mpi[:, None], time, 0))
+    assert np.allclose(excl.execution.to_numpy(), excl.mpi + excl.comp)
+
+    # PREDERIVED_EXCLUSIVE metrics are summed over the tree
+    root = incl.loc[0]
+    assert np.allclose(root.mpi, mpi.sum(axis=0))
+    assert np.allclose(root.mpi + root.comp, time.sum(axis=0))
+
+
+def test_postderived_ratio(outputs):
+    '''
+    A POSTDERIVED ratio is computed on the aggregated values, while a
+    PREDERIVED_EXCLUSIVE ratio is summed over the call tree.
+    '''
+    output, profile = outputs
+    counters = [m.uniq_name for m in profile.metrics[-2:]]
+    code = f"metric::{counters[0]}() / metric::time()"
+    definitions = [
+        cp.derived_metric("post", code),
+        cp.derived_metric("pre", code, type="PREDERIVED_EXCLUSIVE"),
+        cp.derived_metric("incl_time", "metric::time(i)"),
+    ]
+    excl = cp.compute_derived_metrics(output.excl, definitions)
+    incl = cp.compute_derived_metrics(output.excl, definitions, exclusive=False)
+
+    df_excl, df_incl = output.excl.df, output.incl.df
+    assert np.allclose(excl.post, df_excl[counters[0]] / df_excl.time)
+    assert np.allclose(incl.post, df_incl[counters[0]] / df_incl.time)
+    assert np.allclose(excl.pre, excl.post)
+    assert np.allclose(incl.pre.loc[0], excl.pre.groupby("Thread ID").sum())
+    assert np.allclose(excl.incl_time, df_incl.time)
+
+    with pytest.raises(cp.CubePLError):
+        cp.compute_derived_metrics(
+            output.excl, [cp.derived_metric("bad", "metric::missing()")]
+        )
+
+
+def test_truncated_tree(outputs):
+    '''
+    The Cnode IDs of a tree truncated with ``maxlevel`` are not contiguous.
+    The inclusive ``execution`` time of the remaining cnodes is unchanged
+    (the split into ``mpi`` and ``comp`` is not, as the MPI calls below
+    ``maxlevel`` are rolled up into their ancestors).
+    '''
+    output, _ = outputs
+    truncated = tu.get_synthetic_output(SPEC, mode="both", maxlevel=2)
+    cnode_ids = truncated.excl.ctree_df["Cnode ID"]
+    assert cnode_ids.max() + 1 > len(cnode_ids)
+
+    definitions = cp.read_remapping_spec(SINGLE_FILES[0])
+    names = ["execution", "mpi", "comp"]
+    full = cp.compute_derived_metrics(
+        output.incl, definitions, names=names, missing_metrics="zero"
+    )
+    for data in [truncated.excl, truncated.incl]:
+        incl = cp.compute_derived_metrics(
+            data, definitions, names=names, exclusive=False, missing_metrics="zero"
+        )
+        assert np.allclose(incl.execution.to_numpy(),
+                           full.execution.loc[cnode_ids.sort_values()].to_numpy())
+        assert np.allclose(incl.execution, incl.mpi + incl.comp)
+
+
+def test_thread_subset(outputs):
+    '''
+    On a subset of the threads, the result and ``calculation::location::id``
+    use the actual ``Thread ID`` of the data.
+    '''
+    output, _ = outputs
+    threads = [0, 2]
+    subset = Box(output.excl)
+    subset.df = output.excl.df.loc[(slice(None), threads), :]
+    code = "metric::time() + 1000 * ${calculation::location::id}"
+    definitions = [cp.derived_metric("x", code)]
+    df = cp.compute_derived_metrics(subset, definitions)
+    assert list(df.index.unique("Thread ID")) == threads
+    assert df.index.equals(subset.df.index)
+    assert np.allclose(
+        df.x, subset.df.time + 1000 * subset.df.index.get_level_values("Thread ID"))
+
+    full = cp.compute_derived_metrics(output.excl, definitions)
+    assert np.allclose(df.x, full.x.loc[(slice(None), threads)])
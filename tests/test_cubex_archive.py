@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import cubex_archive as ca
+import io
+import numpy as np
+import os
+import pytest
+import tarfile
+from test_utils import SINGLE_FILE, SINGLE_FILES, SCALASCA_OUTPUT
+
+
+def test_scan_cubex():
+    info = ca.scan_cubex(SINGLE_FILE)
+    assert info.scorep_version == "5.0"
+    assert info.cube_version == "4.4"
+    assert info.attributes["CUBE_CT_AGGR"] == "SUM"
+    assert info.metrics[:4] == ["visits", "time", "min_time", "max_time"]
+    assert info.n_cnodes == 171
+    assert info.n_location_groups == 40
+    assert info.n_locations == 40
+    assert info.file_size == os.path.getsize(SINGLE_FILE)
+
+
+def test_scan_directory():
+    serial = ca.scan_directory(os.path.dirname(SINGLE_FILE), max_workers=1)
+    parallel = ca.scan_directory(os.path.dirname(SINGLE_FILE), max_workers=2)
+    assert serial.equals(parallel)
+    assert set(SINGLE_FILES) <= set(serial.index)
+    assert (serial.index.str.startswith(SCALASCA_OUTPUT).sum()) == 9
+    assert serial.loc[SINGLE_FILE, "n_cnodes"] == 171
+
+    top = ca.scan_directory(os.path.dirname(SINGLE_FILE), pattern="*.cubex")
+    assert not top.index.str.startswith(SCALASCA_OUTPUT).any()
+
+
+def test_cubex_reader():
+    with ca.CubexReader(SINGLE_FILES[0]) as reader:
+        assert (reader.n_cnodes, reader.n_locations) == (171, 40)
+        time = reader.get_metric("time")
+        visits = reader.get_metric("visits")
+        cnode_ids = [0, 17, 170, 5]
+        values = reader.get_values("time", cnode_ids, threads=[3, 1])
+        assert (values == time[cnode_ids][:, [3, 1]]).all()
+
+        # without memory mapping
+        reader._mmap.close()
+        reader._mmap = None
+        assert (reader.get_values("time", cnode_ids, threads=[3, 1]) == values).all()
+        assert not reader.get_metric("bytes_put").any()
+
+        # time is stored as inclusive: parents take more than their children
+        parents = ca.get_cnode_orders(reader.anchor).parents
+        children_time = np.zeros_like(time)
+        np.add.at(children_time, parents[parents >= 0], time[parents >= 0])
+        assert (time >= children_time - 1e-9).all()
+        assert (visits[0] == 1).all()
+
+
+def test_cubex_reader_sparse():
+    '''
+    Only the MPI communication functions send bytes.
+    '''
+    with ca.CubexReader("../test_data/profile-5m-nproc20-nsteps10.cubex") as reader:
+        bytes_sent = reader.get_metric("bytes_sent").sum(axis=1)
+        assert (reader.layout("bytes_sent").rows >= 0).sum() < reader.n_cnodes
+        program = reader.anchor.find("program")
+        regions = {r.get("id"): r.findtext("name") for r in program.iter("region")}
+        callees = {int(c.get("id")): regions[c.get("calleeId")]
+                   for c in program.iter("cnode")}
+        senders = {callees[c] for c in np.nonzero(bytes_sent)[0]}
+        assert senders == {"MPI_Bcast", "MPI_Isend", "MPI_Send"}
+
+
+def rewrite_cubex(profile_file, output_file, mode="w", data_header=None):
+    '''
+    Writes a copy of a ``.cubex`` file, in a (possibly compressed) tar
+    archive, optionally replacing the header of the data members.
+    '''
+    with tarfile.open(profile_file) as src, tarfile.open(output_file, mode) as dst:
+        for member in src.getmembers():
+            content = src.extractfile(member).read()
+            if data_header is not None and member.name.endswith(".data"):
+                content = data_header + content[len(ca.DATA_HEADER):]
+                member.size = len(content)
+            dst.addfile(member, io.BytesIO(content))
+
+
+def test_compressed_data_not_supported(tmp_path):
+    compressed_file = str(tmp_path / "compressed.cubex")
+    rewrite_cubex(SINGLE_FILE, compressed_file, data_header=ca.COMPRESSED_DATA_HEADER)
+    with ca.CubexReader(compressed_file) as reader:
+        with pytest.raises(NotImplementedError, match="compressed data not supported"):
+            reader.layout("time")
+        with pytest.raises(NotImplementedError, match="compressed data not supported"):
+            reader.read_metrics()
+
+
+def test_read_metrics_threads(tmp_path):
+    '''
+    The layouts and the values of the metrics are read concurrently by the
+    threads of ``read_metrics``, all from the same (gzip-compressed, thus not
+    memory-mapped) archive.
+    '''
+    gzip_file = str(tmp_path / "profile.cubex")
+    rewrite_cubex(SINGLE_FILE, gzip_file, mode="w:gz")
+    with ca.CubexReader(SINGLE_FILE) as reader:
+        ref = reader.read_metrics(max_workers=1)
+    assert list(ref.columns[:4]) == ["visits", "time", "min_time", "max_time"]
+    for _ in range(10):
+        with ca.CubexReader(gzip_file) as reader:
+            assert reader._mmap is None
+            res = reader.read_metrics(max_workers=8)
+            assert (reader.get_values("time", [3, 0], [2]) == ref.array[[3, 0], 1][:, [2]]).all()
+        assert list(res.columns) == list(ref.columns)
+        assert (res.array == ref.array).all()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import cube_file_utils as cfu
+import dashboard as db
+import synthetic as sy
+import numpy as np
+import pytest
+
+SPEC = "synthetic:n_cnodes=400,n_threads=3,seed=6"
+
+
+def test_threshold_bucket():
+    assert db.threshold_bucket(0.01) == -2.0
+    assert db.threshold_bucket(0.0101) == db.threshold_bucket(0.0099)
+    assert db.threshold_bucket(0.01) != db.threshold_bucket(0.02)
+    assert db.threshold_bucket(0.0) == -np.inf
+
+
+def test_figure_cache():
+    cache = db.FigureCache(maxsize=2)
+    calls = []
+
+    def make(key):
+        return lambda: calls.append(key) or key
+
+    assert cache.get("a", make("a")) == "a"
+    assert cache.get("b", make("b")) == "b"
+    assert cache.get("a", make("a")) == "a"
+    cache.get("c", make("c"))
+    # "b" was the least recently used
+    assert "b" not in cache and "a" in cache and len(cache) == 2
+    assert calls == ["a", "b", "c"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_analysis_store():
+    fake = sy.FakeCubeDump()
+    built = []
+
+    def figure_function(data, metric, vis_type):
+        built.append((metric, vis_type))
+        return data
+
+    store = db.AnalysisStore(max_figures=8, figure_function=figure_function)
+    with cfu.use_cube_dump_runner(fake):
+        future = store.load(SPEC)
+        assert store.load(SPEC) is future
+        analysis = store.get(SPEC, timeout=60)
+    assert store.is_ready(SPEC) and store.files() == [SPEC]
+    assert "time" in analysis.metrics
+
+    data = store.figure(SPEC, "time", 0.0101)
+    store.figure(SPEC, "time", 0.0099)
+    store.figure(SPEC, "time", 0.0099, "sunburst")
+    assert built == [("time", "treemap"), ("time", "sunburst")]
+
+    # the plot data is a consistent tree, with all the ids unique
+    assert data["Node"].is_unique
+    assert set(data["Parent"]) - {""} <= set(data["Node"])
+    others = data[data["Pruned"] > 0]
+    assert others["Short Callpath"].str.startswith("other").all()
+    root = data[data["Parent"] == ""]
+    assert np.isclose(root["time"].iloc[0], analysis.mean["time"].max())
+    store.shutdown()
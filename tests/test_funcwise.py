@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import calltree as ct
+import calltree_conversions as cc
+import funcwise as fw
+import metrics as mt
+import test_utils as tu
+import numpy as np
+import pandas as pd
+
+
+def test_function_ids():
+    tree_df = tu.get_small_output().ctree_df
+    functions = ct.get_function_table(tree_df)
+    assert list(functions) == ['main', 'foo', 'bar', 'MPI_Send']
+    names = functions.loc[tree_df['Function ID']].to_numpy()
+    assert (names == tree_df['Function Name'].to_numpy()).all()
+
+
+def test_recursion_mask():
+    tree_df = tu.get_small_output().ctree_df
+    mask = fw.get_recursion_mask(tree_df)
+    # only the inner foo is inside a call to the same function
+    assert list(tree_df['Cnode ID'][mask]) == [2]
+
+
+def test_aggregate_by_function():
+    output = tu.get_small_output()
+    excl = fw.aggregate_by_function(output.df, output.ctree_df)
+    assert excl.index.names == ['Function Name', 'Thread ID']
+    assert list(excl.columns) == ['time', 'visits']
+    time = excl.time.groupby('Function Name').sum()
+    assert dict(time) == {'main': 2.0, 'foo': 8.0, 'bar': 14.0, 'MPI_Send': 3.0}
+    assert excl.visits[('foo', 0)] == 2.0
+
+    incl = fw.aggregate_by_function(output.df, output.ctree_df, inclusive=True)
+    assert incl.time[('foo', 0)] == 6.0
+    assert incl.time[('foo', 1)] == 6.0
+    assert incl.time[('main', 0)] == 12.5
+
+    # starting from inclusive data gives the same results
+    incl_df = cc.convert_df_to_inclusive(output.df, output.ctree)
+    excl_2 = fw.aggregate_by_function(incl_df, output.ctree_df,
+                                      exclusive_data=False)
+    assert np.allclose(excl_2.values, excl.values)
+
+
+def test_aggregate_by_function_min_max():
+    '''
+    ``min_time`` and ``max_time`` are reduced with the minimum and the
+    maximum, both along the call tree and over the cnodes of each function.
+    '''
+    spec = 'synthetic:n_cnodes=50,n_threads=2,seed=1'
+    excl = tu.get_synthetic_output(spec)
+    incl = tu.get_synthetic_output(spec, exclusive=False)
+    ufuncs = mt.get_ufuncs(excl.metrics)
+    tree_df = excl.ctree_df
+    function_ids = pd.Series(tree_df['Function ID'].to_numpy(),
+                             index=tree_df['Cnode ID'])
+
+    def reference(df, counted):
+        df = df[df.index.get_level_values('Cnode ID').isin(counted)]
+        keys = [function_ids.loc[df.index.get_level_values('Cnode ID')].to_numpy(),
+                df.index.get_level_values('Thread ID')]
+        return df.groupby(keys).agg({'time': 'sum', 'min_time': 'min',
+                                     'max_time': 'max'})
+
+    res = fw.aggregate_by_function(excl.df, tree_df, ufuncs=ufuncs)
+    ref = reference(excl.df, tree_df['Cnode ID'])
+    assert np.allclose(res[ref.columns].to_numpy(), ref.to_numpy())
+
+    res = fw.aggregate_by_function(excl.df, tree_df, inclusive=True, ufuncs=ufuncs)
+    ref = reference(incl.df, tree_df['Cnode ID'][~fw.get_recursion_mask(tree_df)])
+    assert np.allclose(res[ref.columns].to_numpy(), ref.to_numpy())
+
+    # min/max values cannot be un-rolled from inclusive data
+    res = fw.aggregate_by_function(incl.df, tree_df, exclusive_data=False,
+                                   ufuncs=ufuncs)
+    assert res[['min_time', 'max_time']].isna().all().all()
+    assert np.allclose(res.time, fw.aggregate_by_function(excl.df, tree_df).time)
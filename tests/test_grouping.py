@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import grouping as gr
+import test_utils as tu
+import numpy as np
+import pandas as pd
+import pytest
+
+SPEC = ("synthetic:n_cnodes=400,n_threads=4,seed=11,"
+        "threads_per_process=2,processes_per_node=1")
+
+
+@pytest.fixture(scope="module")
+def output():
+    return tu.get_synthetic_output(SPEC, mode="both")
+
+
+def test_attribute_columns(output):
+    tree_df = output.excl.ctree_df
+    for column in ["Paradigm", "Role", "Source File"]:
+        assert isinstance(tree_df[column].dtype, pd.CategoricalDtype)
+    assert {"mpi", "compiler"} <= set(tree_df["Paradigm"])
+    assert (tree_df["Begin Line"] <= tree_df["End Line"]).all()
+
+
+def test_group_reduce_paradigm(output):
+    excl = output.excl
+    res = gr.group_reduce(excl, "paradigm", level="process")
+    assert res.index.names == ["Paradigm", "Rank"]
+    # reference with pandas
+    paradigm = excl.ctree_df.set_index("Cnode ID")["Paradigm"]
+    df = excl.df.reset_index()
+    df["Paradigm"] = paradigm.loc[df["Cnode ID"]].to_numpy()
+    df["Rank"] = excl.system_df["Rank"].loc[df["Thread ID"]].to_numpy()
+    reference = df.groupby(["Paradigm", "Rank"], observed=True)[["time", "min_time"]].agg(
+        {"time": "sum", "min_time": "min"})
+    assert np.allclose(res.loc[reference.index, "time"], reference.time)
+    assert np.allclose(res.loc[reference.index, "min_time"], reference.min_time)
+
+    # same result from the inclusive data, for the summed metrics only
+    incl = gr.group_reduce(output.incl, "paradigm", metrics=["time", "min_time"],
+                           level="process")
+    assert np.allclose(incl.time, res.time)
+    assert incl.min_time.isna().all()
+
+
+def test_group_reduce_multiple(output):
+    excl = output.excl
+    res = gr.group_reduce(excl, ["file", "level"], metrics=["time"], level=None)
+    assert res.index.names == ["Source File", "Level"]
+    assert np.isclose(res.time.sum(), excl.df.time.sum())
+    per_level = gr.group_reduce(excl, "level", metrics=["time"], level=None)
+    assert np.allclose(res.time.groupby(level="Level").sum(), per_level.time)
+
+    mean = gr.group_reduce(excl, "role", metrics=["time"], level="node", mean=True)
+    total = gr.group_reduce(excl, "role", metrics=["time"], level=None)
+    # two nodes, with two threads each
+    summed = (mean.time * 2).groupby(level="Role", observed=True).sum()
+    assert np.allclose(summed.loc[total.index], total.time)
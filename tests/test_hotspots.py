@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import hotspots as hs
+import calltree as ct
+import test_utils as tu
+import numpy as np
+import pytest
+
+
+def test_top_k_cnodes_exclusive():
+    output = tu.get_small_output()
+    top = hs.top_k(output, 'time', k=2, reduction='sum')
+    assert list(top.index) == [4, 1]
+    assert list(top.time) == [10.0, 6.0]
+    assert list(top['Short Callpath']) == ['bar,4', 'foo,1']
+
+
+@pytest.mark.parametrize('reduction', ['mean', 'max', 'sum'])
+def test_top_k_cnodes_inclusive(reduction):
+    output = tu.get_small_output()
+    top = hs.top_k(output, 'time', k=6, reduction=reduction, exclusive=False)
+    # reference: sum over subtrees, then reduction over threads
+    incl = tu.SMALL_TREE_TIME.copy()
+    incl[2] += incl[3]
+    incl[1] += incl[2]
+    incl[0] += incl[1] + incl[4] + incl[5]
+    expected = getattr(np, reduction)(incl, axis=1)
+    assert np.allclose(top.time.values, np.sort(expected)[::-1])
+    assert top.index[0] == 0
+
+
+def test_top_k_functions():
+    output = tu.get_small_output()
+    top = hs.top_k(output, 'time', k=3, by='function', reduction='sum')
+    assert dict(top.time) == {'bar': 14.0, 'foo': 8.0, 'MPI_Send': 3.0}
+
+    top_incl = hs.top_k(output, 'time', k=4, by='function', reduction='sum',
+                        exclusive=False)
+    # recursive call foo -> foo is counted only once
+    assert top_incl.time['foo'] == 12.0
+    assert top_incl.time['main'] == 27.0
+
+
+def test_top_k_subtree():
+    output = tu.get_small_output()
+    res = hs.top_k(output, 'time', k=1, reduction='sum', return_subtree=True)
+    ids = [n.cnode_id for n in ct.iterate_on_call_tree(res.subtree)]
+    assert ids == [0, 4]
+
+    res = hs.top_k(output, 'time', k=1, by='function', reduction='max',
+                   return_subtree=True)
+    assert list(res.top.index) == ['bar']
+    ids = [n.cnode_id for n in ct.iterate_on_call_tree(res.subtree)]
+    assert ids == [0, 1, 2, 3, 4]
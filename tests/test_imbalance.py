@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import imbalance as ib
+import calltree_conversions as cc
+import test_utils as tu
+import numpy as np
+import pytest
+
+
+def test_imbalance_array():
+    array = np.array([[1.0, 3.0], [0.0, 0.0]])
+    res = ib.imbalance_array(array)
+    stats = dict(zip(ib.statistics, res[0]))
+    assert stats['mean'] == 2.0
+    assert stats['max/mean'] == 1.5
+    assert stats['(max-min)/mean'] == 1.0
+    assert stats['cv'] == 0.5
+    assert stats['percent imbalance'] == 50.0
+    assert stats['critical path imbalance'] == 1.0
+    assert np.isnan(res[1, ib.statistics.index('max/mean')])
+
+
+@pytest.mark.parametrize('inclusive', [False, True])
+def test_get_imbalance(inclusive):
+    output = tu.get_small_output()
+    res = ib.get_imbalance(output, inclusive=inclusive)
+    assert res.columns.names == ['metric', 'statistic']
+    assert list(res.index) == list(output.ctree_df['Cnode ID'])
+
+    time = tu.SMALL_TREE_TIME
+    if inclusive:
+        time = cc.convert_array_to_inclusive(time, output.ctree_df)
+    spread = (time.max(axis=1) - time.min(axis=1)) / time.mean(axis=1)
+    assert np.allclose(res[('time', '(max-min)/mean')], spread)
+    assert np.allclose(res[('visits', 'cv')], 0.0)
+
+
+def test_get_imbalance_multi():
+    output = tu.get_small_multi_output()
+    res = ib.get_imbalance(output)
+    assert res.columns.names == ['run', 'metric', 'statistic']
+    assert set(res.columns.droplevel('statistic')) == {
+        (0, 'time'), (1, 'time'), (0, 'PAPI_A'), (1, 'PAPI_B')}
+    # imbalance ratios do not depend on the scale
+    assert np.allclose(res[(1, 'PAPI_B', 'cv')], res[(0, 'time', 'cv')])
+    assert np.allclose(res[(1, 'time', 'max')], 2 * res[(0, 'time', 'max')])
+
+
+def test_get_imbalance_min_max():
+    '''
+    ``min_time`` and ``max_time`` are made inclusive with the minimum and the
+    maximum, and cannot be converted back to exclusive values.
+    '''
+    spec = 'synthetic:n_cnodes=50,n_threads=2,seed=1'
+    excl = tu.get_synthetic_output(spec)
+    incl = tu.get_synthetic_output(spec, exclusive=False)
+
+    res = ib.get_imbalance(excl, inclusive=True)
+    ref = ib.get_imbalance(incl, inclusive=True)
+    for metric in ['time', 'min_time', 'max_time']:
+        assert np.allclose(res[metric], ref[metric])
+
+    res = ib.get_imbalance(incl, inclusive=False)
+    ref = ib.get_imbalance(excl, inclusive=False)
+    assert np.allclose(res['time'], ref['time'], equal_nan=True)
+    assert res[['min_time', 'max_time']].isna().all().all()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import json
+import cube_file_utils as cfu
+import instrumentation as ins
+import merger as mg
+import synthetic as sy
+import numpy as np
+
+
+def test_instrumentation_process_multi(tmp_path):
+    '''
+    Checks that the spans for all the stages of ``process_multi`` are
+    recorded, and that they can be exported.
+    '''
+    fake = sy.FakeCubeDump()
+    files = [f"synthetic:n_cnodes=100,n_threads=2,seed={i}" for i in range(2)]
+
+    assert not ins.enabled()
+    with cfu.use_cube_dump_runner(fake), ins.recording() as recorder:
+        assert ins.enabled()
+        mg.process_multi(files)
+    assert not ins.enabled()
+
+    names = {span.name for span in recorder.spans}
+    for name in ["merger.process_multi", "merger.process_cubex",
+                 "calltree.calltree_from_lines",
+                 "calltree.calltree_to_df", "cube_file_utils.get_dump",
+                 "cube_file_utils.read_dump", "merger.concat_common",
+                 "metrics.get_metric_table"]:
+        assert name in names, name
+
+    spans = {span.name: span for span in recorder.spans}
+    top = spans["merger.process_multi"]
+    assert top.depth == 0
+    assert top.counts == {"rows": 200}
+    assert top.wall >= max(span.wall for span in recorder.spans) - 1e-9
+    assert all(span.peak_memory >= 0 for span in recorder.spans)
+    assert top.peak_memory >= max(span.peak_memory for span in recorder.spans)
+    assert spans["calltree.calltree_from_lines"].timers["create_node"]["calls"] == 100
+
+    summary = recorder.summary()
+    assert summary.loc["merger.process_cubex", "calls"] == 2
+    assert summary.index[0] == "merger.process_multi"
+
+    recorder.to_chrome_trace(tmp_path / "trace.json")
+    events = json.load(open(tmp_path / "trace.json"))["traceEvents"]
+    assert len(events) == len(recorder.spans)
+    assert all(event["ph"] == "X" for event in events)
+    spans = json.loads(recorder.to_json())["spans"]
+    assert len(spans) == len(recorder.spans)
+
+
+def test_instrumentation_disabled():
+    assert ins.timed("f", np.sum) is np.sum
+    with ins.span("nothing") as sp:
+        sp.count(rows=1)
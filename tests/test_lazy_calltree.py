@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import calltree as ct
+import cube_file_utils as cfu
+import cubex_archive as ca
+import lazy_calltree as lct
+import synthetic as sy
+import pytest
+from test_utils import SINGLE_FILES
+
+
+@pytest.fixture(scope="module")
+def lines():
+    profile = sy.generate_profile(n_cnodes=500, n_threads=1, seed=7)
+    return ct.get_call_tree_lines(sy.cube_dump_w_text(profile))
+
+
+def loaded_levels(node, level=0):
+    if not lct.is_loaded(node):
+        return level
+    return max([loaded_levels(child, level + 1) for child in node.children] + [level])
+
+
+def test_lazy_from_lines(lines):
+    root = lct.lazy_calltree_from_lines(lines, maxlevel=1)
+    # nodes down to level 1 exist, their children are not created yet
+    assert loaded_levels(root) == 1
+    assert not lct.is_loaded(root.children[0])
+    assert lct.is_loaded(root.children[0].children[0].parent)
+
+    # once loaded, the tree is the same as the one built eagerly
+    eager = ct.calltree_from_lines(lines)
+    lazy_df = ct.calltree_to_df(root, full_path=True)
+    eager_df = ct.calltree_to_df(eager, full_path=True)
+    assert lazy_df.equals(eager_df)
+    assert all(child.parent.children is root.children for child in root.children)
+
+
+@pytest.mark.parametrize("filename", SINGLE_FILES)
+def test_lazy_from_anchor(filename):
+    root = lct.get_lazy_call_tree(filename, maxlevel=0)
+    assert not lct.is_loaded(root)
+    cnode_ids = [node.cnode_id for node in ct.iterate_on_call_tree(root)]
+    orders = ca.get_cnode_orders(ca.read_anchor(filename))
+    assert cnode_ids == list(orders.preorder)
+    assert all(isinstance(node.fname, str) and "(" not in node.fname
+               for node in ct.iterate_on_call_tree(root))
+
+
+def test_lazy_fallback_to_lines():
+    fake = sy.FakeCubeDump()
+    with cfu.use_cube_dump_runner(fake):
+        root = lct.get_lazy_call_tree("synthetic:n_cnodes=100,seed=8")
+    assert len(list(ct.iterate_on_call_tree(root))) == 100
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import calltree_conversions as cc
+import cubex_archive as ca
+import metrics as mt
+import synthetic as sy
+import numpy as np
+from test_utils import SINGLE_FILE
+
+
+def test_parse_line_details():
+    line = ('PAPI_L1_ICM  ( id=11, PAPI_L1_ICM, #, UINT64, , Level 1 instruction '
+            'cache misses (all, code), INCLUSIVE convertible, cacheable)')
+    details = mt.parse_line_details(line)
+    assert details["id"] == 11
+    assert details["uniq_name"] == "PAPI_L1_ICM"
+    assert details["dtype"] == "UINT64"
+    assert details["descr"] == "Level 1 instruction cache misses (all, code)"
+    assert details["convertible"] and details["cacheable"]
+    assert mt.parse_line(line) == ("PAPI_L1_ICM", "INCLUSIVE convertible")
+
+
+def test_anchor_metric_table():
+    table = ca.get_metric_table(ca.read_anchor(SINGLE_FILE))
+    assert table.loc["time", "type"] == "INCLUSIVE"
+    assert table.loc["visits", "type"] == "EXCLUSIVE"
+    assert table.loc["min_time", "dtype"] == "MINDOUBLE"
+    assert table.loc["max_time", "dtype"] == "MAXDOUBLE"
+    ufuncs = mt.get_ufuncs(table)
+    assert ufuncs["min_time"] is np.minimum and ufuncs["time"] is np.add
+
+
+def test_convert_with_ufuncs():
+    '''
+    Checks that converting the metrics together, each with its own ufunc,
+    gives the same results as converting them one at a time.
+    '''
+    profile = sy.generate_profile(n_cnodes=300, n_threads=3)
+    tree_df = sy.get_tree_df(profile)
+    metrics = ["time", "min_time", "max_time", "visits"]
+    array = np.stack([profile.data[m] for m in metrics], axis=1)
+    ufuncs = [mt.reduction_ufuncs.get(m.dtype, np.add)
+              for name in metrics for m in profile.metrics if m.uniq_name == name]
+
+    res = cc.convert_array_to_inclusive(array, tree_df, ufuncs)
+    for i, metric in enumerate(metrics):
+        ref = sy.get_metric_values(profile, metric, exclusive=False)
+        assert np.allclose(res[:, i, :], ref)
+    assert (res[:, 1, :] <= array[:, 1, :]).all()
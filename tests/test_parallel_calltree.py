@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import calltree as ct
+import synthetic as sy
+import test_utils as tu
+import pytest
+
+
+def check_same_tree(a, b):
+    nodes_a = list(ct.iterate_on_call_tree(a))
+    nodes_b = list(ct.iterate_on_call_tree(b))
+    assert len(nodes_a) == len(nodes_b)
+    for node_a, node_b in zip(nodes_a, nodes_b):
+        assert {k: v for k, v in node_a.items() if k not in ("parent", "children")} == \
+            {k: v for k, v in node_b.items() if k not in ("parent", "children")}
+        assert type(node_a) is type(node_b)
+        assert node_a.children == node_b.children
+        if "template_subs" in node_a:
+            assert type(node_a.template_subs) is type(node_b.template_subs)
+        if node_a.parent is None:
+            assert node_b.parent is None
+        else:
+            assert node_a.parent == node_b.parent
+    df_a = ct.calltree_to_df(a, full_path=True, attributes=True)
+    df_b = ct.calltree_to_df(b, full_path=True, attributes=True)
+    assert df_a.equals(df_b)
+
+
+@pytest.mark.parametrize("cpp_templates", [False, True])
+def test_parallel_calltree_from_lines(cpp_templates):
+    profile = sy.generate_profile(n_cnodes=300, n_threads=1, seed=5,
+                                  cpp_templates=cpp_templates)
+    lines = ct.get_call_tree_lines(sy.cube_dump_w_text(profile))
+    sequential = ct.calltree_from_lines(lines)
+    parallel = ct.calltree_from_lines(lines, processes=2, chunksize=37)
+    check_same_tree(sequential, parallel)
+
+
+def test_link_parsed_lines():
+    lines = tu.SMALL_TREE_LINES
+    root = ct.link_parsed_lines(*ct._parse_lines(lines))
+    check_same_tree(ct.calltree_from_lines(lines), root)
+    assert [child.cnode_id for child in root.children] == [1, 4, 5]
+    assert [child.cnode_id for child in root.children[0].children] == [2]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import calltree as ct
+import calltree_conversions as cc
+import preorder as po
+import test_utils as tu
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def output():
+    return tu.get_synthetic_output("synthetic:n_cnodes=500,n_threads=3,seed=10")
+
+
+def test_entry_exit(output):
+    index = po.PreorderIndex(output.ctree_df)
+    # the rows of calltree_to_df are already in pre-order
+    assert (index.entry == np.arange(len(index))).all()
+    preorder = [node.cnode_id for node in ct.iterate_on_call_tree(output.ctree)]
+    assert list(index.cnode_ids) == preorder
+
+    # same result on a shuffled tree
+    shuffled = output.ctree_df.sample(frac=1, random_state=0)
+    shuffled = shuffled.sort_values("Level", kind="stable")
+    other = po.PreorderIndex(shuffled)
+    for cnode_id in output.ctree_df["Cnode ID"].iloc[::25]:
+        assert set(other.subtree_ids(cnode_id)) == set(index.subtree_ids(cnode_id))
+
+
+def test_queries(output):
+    tree_df = output.ctree_df
+    index = po.PreorderIndex(tree_df)
+    parents = tree_df.set_index("Cnode ID")["Parent Cnode ID"]
+    cnode_id = tree_df["Cnode ID"][tree_df["Level"] == 4].iloc[0]
+
+    ancestors = index.ancestors(cnode_id)
+    assert len(ancestors) == 4 and ancestors[-1] == parents[cnode_id]
+    assert all(index.is_ancestor(a, cnode_id) for a in ancestors)
+    assert not index.is_ancestor(cnode_id, ancestors[0])
+
+    df = index.sort(output.df)
+    ids = index.subtree_ids(ancestors[1])
+    sub = index.subtree(df, ancestors[1])
+    assert len(sub) == len(ids) * 3
+    assert (sub.index.get_level_values("Cnode ID").unique() == ids).all()
+    assert np.allclose(sub.time.to_numpy(), output.df.time.loc[list(ids)].to_numpy())
+
+
+def test_inclusive(output):
+    tree_df = output.ctree_df
+    index = po.PreorderIndex(tree_df)
+    time = output.df.time.unstack("Thread ID").loc[tree_df["Cnode ID"]].to_numpy()
+    reference = cc.convert_array_to_inclusive(time, tree_df)
+    assert np.allclose(index.inclusive(time), reference)
+
+    prefix = index.prefix_sums(time)
+    cnode_id = tree_df["Cnode ID"].iloc[7]
+    assert np.allclose(index.subtree_sum(prefix, cnode_id), reference[7])
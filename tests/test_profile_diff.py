@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import profile_diff as pdiff
+import test_utils as tu
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    specs = ["synthetic:n_cnodes=300,n_threads=2,seed=1",
+             "synthetic:n_cnodes=300,n_threads=3,seed=1",
+             "synthetic:n_cnodes=250,n_threads=3,seed=2"]
+    return [tu.get_synthetic_output(spec) for spec in specs]
+
+
+def test_align_same_tree(outputs):
+    a, b, _ = outputs
+    diff = pdiff.diff_profiles(a, b)
+    tree_df = diff.tree_df
+    assert len(tree_df) == 300
+    assert (tree_df["Cnode ID a"] == tree_df["Cnode ID b"]).all()
+    assert diff.metrics == ["visits", "time", "min_time", "max_time"]
+
+    same = pdiff.diff_profiles(a, a)
+    assert (same.delta_incl == 0).all() and (same.delta_excl == 0).all()
+
+
+def test_diff_different_trees(outputs):
+    a, _, c = outputs
+    diff = pdiff.diff_profiles(a, c, statistic="mean")
+    tree_df = diff.tree_df
+    assert (tree_df["Cnode ID a"] >= 0).sum() == 300
+    assert (tree_df["Cnode ID b"] >= 0).sum() == 250
+
+    # missing cnodes have zero values, and inclusive totals are preserved
+    missing_b = tree_df["Cnode ID b"].to_numpy() < 0
+    assert (diff.incl_b[missing_b] == 0).all()
+    time = diff.metrics.index("time")
+    root = np.flatnonzero(tree_df["Level"].to_numpy() == 0)[0]
+    assert np.isclose(diff.incl_a[root, time], a.df.time.sum() / 2)
+    assert np.isclose(diff.incl_b[root, time], c.df.time.sum() / 3)
+
+    # aligned cnodes have the same call path
+    both = tree_df[~missing_b & (tree_df["Cnode ID a"] >= 0)]
+    paths_a = a.ctree_df.set_index("Cnode ID")["Full Callpath"]
+    paths_b = c.ctree_df.set_index("Cnode ID")["Full Callpath"]
+    assert (paths_a.loc[both["Cnode ID a"]].to_numpy()
+            == paths_b.loc[both["Cnode ID b"]].to_numpy()).all()
+
+    ranked = pdiff.rank_regressions(diff, "time", n=10)
+    assert len(ranked) == 10
+    assert ranked["delta incl"].is_monotonic_decreasing
+    excl = pdiff.rank_regressions(diff, "time", inclusive=False)
+    assert np.isclose(excl["delta excl"].iloc[0], diff.delta_excl[:, time].max())
+
+
+def test_merge_paths():
+    # two sibling cnodes with the same path, one path without cnodes
+    values = np.array([[1.0, 5.0, 5.0],
+                       [2.0, 3.0, 7.0],
+                       [4.0, 4.0, 4.0]])
+    ufuncs = [np.add, np.minimum, np.maximum]
+    merged = pdiff.merge_paths(values, np.array([0, 0, 2]), 3, ufuncs)
+    assert (merged == [[3.0, 3.0, 7.0], [0.0, 0.0, 0.0], [4.0, 4.0, 4.0]]).all()
+    merged = pdiff.merge_paths(values, np.array([0, 0, 2]), 3, ufuncs, fill=np.nan)
+    assert np.isnan(merged[1]).all()
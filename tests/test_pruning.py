@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import calltree_conversions as cc
+import pruning as pr
+import synthetic as sy
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def tree():
+    profile = sy.generate_profile(n_cnodes=2000, n_threads=1, seed=5)
+    tree_df = sy.get_tree_df(profile)
+    time = sy.get_metric_values(profile, "time")[:, 0]
+    incl = cc.convert_array_to_inclusive(time, tree_df)
+    return tree_df, incl
+
+
+def check_consistency(pruned, incl, threshold):
+    ids = pruned["Cnode ID"].to_numpy()
+    parents = pruned["Parent Cnode ID"].dropna().astype(int).to_numpy()
+    # no orphans
+    assert np.isin(parents, ids).all()
+    real = pruned[pruned["Pruned"] == 0]
+    assert (real["Value"].iloc[1:] > threshold * incl.max()).all()
+    # inclusive values are preserved: children (with "other") sum up to at
+    # most the value of the parent
+    children_sum = pruned.groupby("Parent Cnode ID")["Value"].sum()
+    values = pruned.set_index("Cnode ID")["Value"]
+    parent_values = values.loc[children_sum.index.astype(int)].to_numpy()
+    assert (children_sum.to_numpy() <= parent_values * (1 + 1e-12)).all()
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.001, 0.01, 0.1, 1.0])
+def test_prune(tree, threshold):
+    tree_df, incl = tree
+    index = pr.get_pruning_index(tree_df, incl)
+    pruned = pr.prune(index, threshold)
+    check_consistency(pruned, incl, threshold)
+
+    # same as the naive selection, since inclusive times are monotonic
+    reference = set(tree_df["Cnode ID"][incl > threshold * incl.max()])
+    reference |= set(tree_df["Cnode ID"][tree_df["Level"] == 0])
+    assert set(pruned["Cnode ID"][pruned["Pruned"] == 0]) == reference
+
+    # the other nodes hold exactly the pruned children
+    others = pruned[pruned["Pruned"] > 0]
+    parents = tree_df["Parent Cnode ID"]
+    for _, row in others.iterrows():
+        children = tree_df["Cnode ID"][parents == row["Parent Cnode ID"]]
+        children = children[~children.isin(reference)]
+        assert len(children) == row["Pruned"]
+        positions = pd.Index(tree_df["Cnode ID"]).get_indexer(children)
+        assert np.isclose(incl[positions].sum(), row["Value"])
+
+
+def test_prune_not_monotonic(tree):
+    tree_df, incl = tree
+    values = pd.Series(incl, index=tree_df["Cnode ID"])
+    # a child larger than its parent does not appear without it
+    child = tree_df["Cnode ID"][tree_df["Level"] == 2].iloc[0]
+    parent = tree_df.set_index("Cnode ID")["Parent Cnode ID"][child]
+    values[parent] = 0.0
+    values[child] = 10 * incl.max()
+    pruned = pr.prune_calltree(tree_df, values, 0.5)
+    assert child not in set(pruned["Cnode ID"])
+    assert np.isin(pruned["Parent Cnode ID"].dropna(), pruned["Cnode ID"]).all()
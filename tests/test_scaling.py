@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import scaling as sc
+import test_utils as tu
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    specs = ["synthetic:n_cnodes=200,n_threads=4,seed=3",
+             "synthetic:n_cnodes=200,n_threads=1,seed=3",
+             "synthetic:n_cnodes=180,n_threads=2,seed=4"]
+    return [tu.get_synthetic_output(spec) for spec in specs]
+
+
+def test_scaling_exponent():
+    resources = np.array([1, 2, 4, 8])
+    values = np.stack([10.0 / resources, 3.0 * np.ones(4), [1.0, np.nan, 4.0, 8.0]],
+                      axis=-1)
+    exponent = sc.scaling_exponent(resources, values)
+    assert np.allclose(exponent, [-1.0, 0.0, 1.0])
+    assert np.isnan(sc.scaling_exponent(resources[:1], values[:1])).all()
+
+
+def test_analyse_scaling(outputs):
+    res = sc.analyse_scaling(outputs)
+    assert list(res.resources) == [1, 2, 4]
+    assert list(res.order) == [1, 2, 0]
+    n_paths = len(res.tree_df)
+    assert res.data.shape == (3, n_paths, len(res.metrics))
+    assert res.exponent.shape == (n_paths, len(res.metrics))
+
+    # the baseline has unit speedup and efficiency where it has data
+    present = ~np.isnan(res.data[0])
+    assert np.allclose(res.speedup[0][present], 1.0)
+    assert np.allclose(res.efficiency[0][present], 1.0)
+    assert np.allclose(res.efficiency[2][present],
+                       res.speedup[2][present] / 4, equal_nan=True)
+
+    # the root holds the mean inclusive time of each run
+    time = res.metrics.index("time")
+    root = np.flatnonzero(res.tree_df["Level"].to_numpy() == 0)[0]
+    for i, output in zip(res.order, [outputs[i] for i in res.order]):
+        n_threads = len(output.df.index.unique("Thread ID"))
+        position = list(res.order).index(i)
+        assert np.isclose(res.data[position, root, time],
+                          output.df.time.sum() / n_threads)
+
+    weak = sc.analyse_scaling(outputs, kind="weak")
+    assert np.allclose(weak.efficiency, weak.speedup, equal_nan=True)
+
+    table = sc.scaling_table(res, "time")
+    assert len(table) == n_paths
+    assert np.allclose(table[("speedup", 4)], res.speedup[2, :, time], equal_nan=True)
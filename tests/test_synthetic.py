@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import io
+import calltree as ct
+import calltree_conversions as cc
+import cube_file_utils as cfu
+import metrics as mt
+import synthetic as sy
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("cpp_templates", [False, True])
+def test_synthetic_calltree(cpp_templates):
+    '''
+    Checks that the synthetic ``cube_dump -w`` output is parsed back into
+    the generated call tree.
+    '''
+    profile = sy.generate_profile(n_cnodes=300, n_threads=2, fanout=3,
+                                  cpp_templates=cpp_templates)
+    text = sy.cube_dump_w_text(profile)
+    calltree = ct.calltree_from_lines(ct.get_call_tree_lines(text))
+    tree_df = ct.calltree_to_df(calltree, full_path=True)
+
+    assert list(tree_df['Cnode ID']) == list(range(300))
+    assert (tree_df['Level'].to_numpy() == profile.levels).all()
+    parents = tree_df['Parent Cnode ID'].fillna(-1).to_numpy(dtype=int)
+    assert (parents == profile.parents).all()
+    names = [profile.functions[f].name for f in profile.function_ids]
+    assert list(tree_df['Function Name'])[1:] == names[1:]
+    # sibling cnodes are relative to different functions
+    assert not tree_df['Full Callpath'].duplicated().any()
+
+    convertible = {m.shortname for m in mt.get_metric_info(mt.get_metric_lines(text))
+                   if m.convertibility == "INCLUSIVE convertible"}
+    assert convertible == {'visits', 'time'}
+
+
+def test_synthetic_dump():
+    profile = sy.generate_profile(n_cnodes=100, n_threads=4, n_papi_counters=3)
+    excl = cfu.read_dump(io.StringIO(sy.cube_dump_csv_text(profile)))
+    incl = cfu.read_dump(io.StringIO(sy.cube_dump_csv_text(profile, False)))
+    assert list(excl.columns[:2]) == ['Cnode ID', 'Thread ID']
+    assert len(excl) == 400
+    assert len(excl.columns) == 2 + 4 + 3
+
+    tree_df = sy.get_tree_df(profile)
+    time_excl = excl.time.to_numpy().reshape(100, 4)
+    time_incl = incl.time.to_numpy().reshape(100, 4)
+    assert np.allclose(cc.convert_array_to_inclusive(time_excl, tree_df), time_incl)
+    max_time = incl.max_time.to_numpy().reshape(100, 4)
+    assert (max_time[0] >= max_time.max(axis=0)).all()
+
+
+def test_fake_cube_dump_process_multi():
+    '''
+    Runs ``process_multi`` on synthetic profiles, with the fake ``cube_dump``.
+    '''
+    import merger as mg
+
+    fake = sy.FakeCubeDump()
+    files = []
+    for run in range(3):
+        filename = f"run{run}.cubex"
+        fake.add(filename, n_cnodes=200, n_threads=3, seed=run,
+                 n_papi_counters=2, first_papi_counter=2 * run)
+        files.append(filename)
+
+    with cfu.use_cube_dump_runner(fake):
+        output = mg.process_multi(files)
+    assert cfu._cube_dump_runner is None
+
+    assert len(output.ctree_df) == 200
+    assert output.common.shape == (600, 3 * 4)
+    assert output.noncommon.shape == (600, 3 * 2)
+    assert set(output.ncmetrics.run) == {0, 1, 2}
+    time = output.common[(1, 'time')].to_numpy().reshape(200, 3)
+    assert np.allclose(time, fake.profiles['run1.cubex'].data.time)
+
+
+def test_fake_cube_dump_spec():
+    fake = sy.FakeCubeDump()
+    with cfu.use_cube_dump_runner(fake):
+        tree = ct.get_call_tree("synthetic:n_cnodes=50,cpp_templates=True")
+        incl = cfu.get_dump("synthetic:n_cnodes=50,n_threads=2", exclusive=False)
+        with pytest.raises(cfu.CubeDumpException):
+            cfu.get_dump("missing.cubex")
+    assert len(ct.calltree_to_df(tree)) == 50
+    assert incl.shape == (100, 2 + 4)
+    assert fake.calls[0] == ["-w", "synthetic:n_cnodes=50,cpp_templates=True"]
+
+
+def test_process_multi_both():
+    '''
+    Checks that the data obtained with ``mode="both"`` coincides with the
+    one from separate exclusive and inclusive runs, and that no metric is
+    read again (min_time and max_time are aggregated locally).
+    '''
+    import merger as mg
+
+    fake = sy.FakeCubeDump()
+    files = [f"synthetic:n_cnodes=150,n_threads=3,seed={run},"
+             f"n_papi_counters=1,first_papi_counter={run}" for run in range(2)]
+    with cfu.use_cube_dump_runner(fake):
+        both = mg.process_multi(files, mode="both")
+        n_calls = len(fake.calls)
+        excl = mg.process_multi(files, exclusive=True)
+        incl = mg.process_multi(files, mode="inclusive")
+
+    assert both.excl.exclusive and not both.incl.exclusive
+    for output, ref in [(both.excl, excl), (both.incl, incl)]:
+        for key in ["common", "noncommon"]:
+            assert list(output[key].columns) == list(ref[key].columns)
+            assert np.allclose(output[key].to_numpy(), ref[key].to_numpy())
+
+    csv_calls = [call for call in fake.calls[:n_calls] if "-w" not in call]
+    assert [call[1] for call in csv_calls] == ["all"] * 2
+    assert both.excl.metrics.loc["min_time", "dtype"] == "MINDOUBLE"
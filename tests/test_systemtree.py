@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import cubex_archive as ca
+import synthetic as sy
+import systemtree as st
+import test_utils as tu
+import numpy as np
+import pytest
+from test_utils import SINGLE_FILE
+
+SPEC = ("synthetic:n_cnodes=100,n_threads=12,threads_per_process=3,"
+        "processes_per_node=2,n_papi_counters=1")
+
+
+def test_system_df_from_anchor():
+    system_df = st.system_df_from_anchor(ca.read_anchor(SINGLE_FILE))
+    assert list(system_df.index) == list(range(40))
+    assert list(system_df.Rank) == list(range(40))
+    assert (system_df["Thread Rank"] == 0).all()
+    assert (system_df["Node Name"] == "node scs0049").all()
+    assert (system_df["Machine Name"] == "machine Linux").all()
+
+
+def test_system_df_from_lines():
+    lines = sy.system_lines(7, threads_per_process=2, processes_per_node=3)
+    system_df = st.system_df_from_lines(lines)
+    assert list(system_df.index) == list(range(7))
+    assert list(system_df.Rank) == [0, 0, 1, 1, 2, 2, 3]
+    assert list(system_df["Thread Rank"]) == [0, 1, 0, 1, 0, 1, 0]
+    assert list(system_df["Node ID"]) == [0] * 6 + [1]
+    assert system_df.loc[6, "Node Name"] == "node node001"
+    assert system_df.loc[1, "Thread Name"] == "OMP thread"
+
+
+@pytest.mark.parametrize("level,n_groups,threads", [("process", 4, 3), ("node", 2, 6)])
+def test_aggregate_output(level, n_groups, threads):
+    output = tu.get_synthetic_output(SPEC)
+    assert len(output.system_df) == 12
+
+    aggregated = st.aggregate_output(output, level=level)
+    df = aggregated.df
+    assert df.index.names == ["Cnode ID", st.levels[level]]
+    assert len(df) == 100 * n_groups
+
+    data = tu.get_synthetic_profile(SPEC).data
+    time = df.time.to_numpy().reshape(100, n_groups)
+    ref = data.time.reshape(100, n_groups, threads)
+    assert np.allclose(time, ref.sum(axis=-1))
+    min_time = df.min_time.to_numpy().reshape(100, n_groups)
+    assert np.allclose(min_time, data.min_time.reshape(100, n_groups, threads).min(axis=-1))
+
+    mean = st.aggregate_output(output, level=level, mean=True).df
+    assert np.allclose(mean.time.to_numpy().reshape(100, n_groups), ref.mean(axis=-1))
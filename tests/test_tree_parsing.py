@@ -11,5 +11,9 @@ def test_tree_parsing(filename):
     lines = ct.get_call_tree_lines(cfu.get_cube_dump_w_text(filename))
     assert list(tp.iterate(tp.collect_hierarchy(lines, tp.level_fun))) == lines
 
+def test_parent_positions():
+    levels = [0, 1, 2, 2, 1, 2, 3, 1]
+    assert list(tp.parent_positions(levels)) == [-1, 0, 1, 1, 0, 4, 5, 0]
+
 if __name__ == "__main__":
     print("All ok")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import calltree as ct
+import synthetic as sy
+import test_utils as tu
+import numpy as np
+import pytest
+
+SPEC = "synthetic:n_cnodes=600,n_threads=3,seed=9"
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    return (tu.get_synthetic_output(SPEC, mode="both"),
+            tu.get_synthetic_output(SPEC, mode="both", maxlevel=3),
+            tu.get_synthetic_output(SPEC, exclusive=False, maxlevel=3))
+
+
+def test_truncate_call_tree_lines():
+    profile = sy.generate_profile(n_cnodes=200, n_threads=1, seed=9)
+    lines = ct.get_call_tree_lines(sy.cube_dump_w_text(profile))
+    kept, cutoff = ct.truncate_call_tree_lines(lines, 2)
+    tree_df = ct.calltree_to_df(ct.calltree_from_lines(kept))
+    assert tree_df["Level"].max() == 2
+    assert len(kept) + len(cutoff) == len(lines)
+    levels = tree_df.set_index("Cnode ID")["Level"]
+    assert (levels.loc[cutoff.unique()] == 2).all()
+
+
+def test_roll_up(outputs):
+    full, truncated, inclusive = outputs
+    assert truncated.excl.ctree_df["Level"].max() == 3
+    kept = truncated.excl.ctree_df["Cnode ID"]
+    assert len(truncated.excl.df) == len(kept) * 3
+
+    # inclusive values are exact on the truncated tree
+    for metric in ["time", "visits", "min_time", "max_time"]:
+        reference = full.incl.df[metric].loc[kept].sort_index()
+        assert np.allclose(truncated.incl.df[metric].sort_index(), reference)
+        assert np.allclose(inclusive.df[metric].sort_index(), reference)
+
+    # exclusive totals are preserved
+    assert np.isclose(truncated.excl.df.time.sum(), full.excl.df.time.sum())
+    assert truncated.excl.df.min_time.min() == full.excl.df.min_time.min()
@@ -34,3 +34,118 @@ def check_float_equality(a,b,tolerance = 1e-5):
     assert np.all((check < tolerance) | (a == b)), np.max(check[a!=b])
 
 
+
+
+# A small call tree, in the format of the output of ``cube_dump -w``,
+# with a recursive call (foo -> foo) and a function called from two places
+# (bar).
+SMALL_TREE_LINES = [
+    'main  [ ( id=0,   mod=), 1, 50, paradigm=compiler, role=function, url=, descr=, mode=main.c]',
+    '  |-foo  [ ( id=1,   mod=), 10, 20, paradigm=compiler, role=function, url=, descr=, mode=foo.c]',
+    '  |  |-foo  [ ( id=2,   mod=), 10, 20, paradigm=compiler, role=function, url=, descr=, mode=foo.c]',
+    '  |  |  |-bar  [ ( id=3,   mod=), 30, 40, paradigm=compiler, role=function, url=, descr=, mode=bar.c]',
+    '  |-bar  [ ( id=4,   mod=), 30, 40, paradigm=compiler, role=function, url=, descr=, mode=bar.c]',
+    '  |-MPI_Send  [ ( id=5,   mod=), -1, -1, paradigm=mpi, role=point2point, url=, descr=, mode=MPI]',
+]
+
+# Exclusive time for the small tree, for 2 threads (rows are Cnode IDs)
+SMALL_TREE_TIME = np.array([
+    [1.0, 1.0],
+    [2.0, 4.0],
+    [1.0, 1.0],
+    [3.0, 1.0],
+    [5.0, 5.0],
+    [0.5, 2.5],
+])
+
+
+def get_small_output():
+    '''
+    Builds an object analogous to the output of ``merger.process_cubex``
+    for the small tree in ``SMALL_TREE_LINES``, with exclusive data.
+    '''
+    import pandas as pd
+    from box import Box
+    import calltree as ct
+
+    ctree = ct.calltree_from_lines(SMALL_TREE_LINES)
+    ctree_df = ct.calltree_to_df(ctree, full_path=True)
+    ncnodes, nthreads = SMALL_TREE_TIME.shape
+    index = pd.MultiIndex.from_product(
+        [range(ncnodes), range(nthreads)], names=['Cnode ID', 'Thread ID'])
+    df = pd.DataFrame(
+        {'time': SMALL_TREE_TIME.ravel(),
+         'visits': np.ones(ncnodes * nthreads)},
+        index=index).rename_axis('metric', axis='columns')
+    return Box({
+        'ctree': ctree,
+        'ctree_df': ctree_df,
+        'df': df,
+        'conv_info': {'time', 'visits'},
+        'exclusive': True
+    })
+
+
+def get_small_multi_output():
+    '''
+    Builds an object analogous to the output of ``merger.process_multi``
+    for the small tree in ``SMALL_TREE_LINES``, with two runs sharing
+    the ``time`` metric and one non-common metric each.
+    '''
+    import pandas as pd
+    from box import Box
+
+    single = get_small_output()
+    df = single.df
+    common = pd.concat([df[['time']], 2 * df[['time']]], axis='columns')
+    common.columns = pd.MultiIndex.from_tuples([(0, 'time'), (1, 'time')],
+                                               names=['run', 'metric'])
+    noncommon = pd.DataFrame({
+        'PAPI_A': df.time * 10,
+        'PAPI_B': df.time * 100
+    }).rename_axis('metric', axis='columns')
+    ncmetrics = pd.DataFrame([('PAPI_A', 0), ('PAPI_B', 1)],
+                             columns=['metric', 'run'])
+    return Box({
+        'ctree': single.ctree,
+        'ctree_df': single.ctree_df,
+        'common': common,
+        'noncommon': noncommon,
+        'conv_info': {'time', 'PAPI_A', 'PAPI_B'},
+        'ncmetrics': ncmetrics,
+        'exclusive': True
+    })
+
+
+_synthetic_outputs = {}
+
+
+def get_synthetic_output(spec, **kwargs):
+    '''
+    Runs ``merger.process_cubex`` on a synthetic profile (a file name like
+    ``synthetic:n_cnodes=200,n_threads=3``, see
+    ``synthetic.FakeCubeDump``), with the keyword arguments given (e.g.
+    ``mode`` or ``maxlevel``).
+
+    The outputs are cached and shared by all the tests: they must not be
+    modified.
+    '''
+    import cube_file_utils as cfu
+    import merger as mg
+    import synthetic as sy
+
+    key = (spec, tuple(sorted(kwargs.items())))
+    if key not in _synthetic_outputs:
+        with cfu.use_cube_dump_runner(sy.FakeCubeDump()):
+            _synthetic_outputs[key] = mg.process_cubex(spec, **kwargs)
+    return _synthetic_outputs[key]
+
+
+def get_synthetic_profile(spec):
+    '''
+    The generated profile (see ``synthetic.generate_profile``) behind a
+    synthetic file name, to check the results against.
+    '''
+    import synthetic as sy
+
+    return sy.FakeCubeDump().get_profile(spec)